@@ -21,3 +21,18 @@ class CampaignAdmin(admin.ModelAdmin):
 @admin.register(models.Ad)
 class AdAdmin(admin.ModelAdmin):
     list_display = 'campaign', 'campaign_name', 'ad_name', 'spent', 'listens', 'reach', 'cpm'
+
+
+@admin.register(models.Musician)
+class MusicianAdmin(admin.ModelAdmin):
+    list_display = 'name_key', 'musician_name', 'musician_vk_id', 'update_datetime'
+
+
+@admin.register(models.ArtistCard)
+class ArtistCardAdmin(admin.ModelAdmin):
+    list_display = 'artist_name', 'card_id', 'last_release_date', 'crawl_datetime'
+
+
+@admin.register(models.Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = 'command', 'owner', 'priority', 'status', 'create_datetime', 'finish_datetime'
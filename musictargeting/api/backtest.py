@@ -0,0 +1,189 @@
+from time import monotonic
+
+import numpy as np
+
+from musictargeting.api.decisions import AdsFrame, DecisionEngine
+
+
+# Циклов автоматизации в сутках (цикл раз в 10 минут)
+CYCLES_PER_DAY = 144
+
+# Границы СРМ в ВК, за которые обновление СРМ не проходит
+MIN_CPM = 30.
+MAX_CPM = 1000.
+
+
+class Strategy:
+
+    def __init__(self, name, target_cost, speed_coef=None, rules=None):
+        """
+        Стратегия автоматизации для бэктеста
+
+        :param name:            str, название стратегии в отчете
+        :param target_cost:     float, целевая стоимость прослушивания
+        :param speed_coef:      float, коэффициент ускорения кампании
+        :param rules:           list, правила DecisionEngine (None - правила по умолчанию)
+        """
+        self.name = name
+        self.target_cost = target_cost
+        self.speed_coef = speed_coef
+        self.engine = DecisionEngine(rules=rules)
+
+
+class SyntheticAdModel:
+
+    def __init__(self, campaigns=100, ads_per_campaign=30, days=30, base_cpm=30., impressions_per_day=3000.,
+                 listen_rate=0.01, elasticity=1.5, seed=0):
+        """
+        Синтетическая модель отклика объявлений: показы за день растут со ставкой как (cpm / base_cpm) ** elasticity,
+        доля прослушиваний с показа у каждого объявления своя (логнормальное распределение вокруг listen_rate)
+
+        :param campaigns:               int, количество кампаний
+        :param ads_per_campaign:        int, объявлений в кампании
+        :param days:                    int, дней симуляции
+        :param base_cpm:                float, стартовый СРМ объявлений
+        :param impressions_per_day:     float, средние показы объявления за день при base_cpm
+        :param listen_rate:             float, средняя доля прослушиваний с показа
+        :param elasticity:              float, эластичность показов по СРМ
+        :param seed:                    int, сид генератора случайных чисел
+        """
+        rng = np.random.default_rng(seed)
+        size = campaigns * ads_per_campaign
+
+        self.days = days
+        self.campaign_keys = np.repeat(np.arange(campaigns), ads_per_campaign)
+        self.ad_ids = np.arange(size)
+        self.start_cpm = np.full(size, float(base_cpm))
+        self.base_cpm = base_cpm
+        self.elasticity = elasticity
+        self.base_impressions = impressions_per_day * rng.lognormal(0., 0.5, size)
+        self.listen_rates = np.clip(listen_rate * rng.lognormal(0., 0.7, size), 0., 1.)
+
+    def impressions(self, day, cpm):
+        """
+        Ожидаемые показы объявлений за день при ставке cpm
+
+        :param day:     int, номер дня симуляции
+        :param cpm:     array, текущие СРМ объявлений
+        :return:        array
+        """
+        return self.base_impressions * (cpm / self.base_cpm) ** self.elasticity
+
+    def listen_rate(self, day):
+        """
+        Доля прослушиваний с показа у объявлений в день day
+
+        :param day:     int, номер дня симуляции
+        :return:        array
+        """
+        return self.listen_rates
+
+
+class RecordedAdModel:
+
+    def __init__(self, series, elasticity=1.5):
+        """
+        Модель отклика объявлений по записанной стате: в каждый день объявление получает записанные показы,
+        пересчитанные на ставку стратегии как (cpm / recorded_cpm) ** elasticity, и записанную долю прослушиваний.
+        Дни каждой кампании считаются от ее первого записанного дня
+
+        :param series:      dict, {campaign_key: {ad_id: [{'day': date, 'spent': , 'reach': , 'listens': }, ...]}},
+                                  значения - за день
+        :param elasticity:  float, эластичность показов по СРМ
+        """
+        campaign_keys, ad_ids, ad_series = [], [], []
+        for campaign_key, ads in series.items():
+            first_day = min([x['day'] for days in ads.values() for x in days], default=None)
+            for ad_id, days in ads.items():
+                campaign_keys.append(campaign_key)
+                ad_ids.append(ad_id)
+                ad_series.append({(x['day'] - first_day).days: x for x in days})
+
+        self.days = max([max(x.keys()) + 1 for x in ad_series if x], default=0)
+        self.campaign_keys = np.asarray(campaign_keys)
+        self.ad_ids = np.asarray(ad_ids)
+        self.elasticity = elasticity
+
+        size = len(ad_ids)
+        self.reach = np.zeros((self.days, size))
+        self.cpm = np.zeros((self.days, size))
+        self.listen_rates = np.zeros((self.days, size))
+        for n, days in enumerate(ad_series):
+            for day, stat in days.items():
+                if stat['reach']:
+                    self.reach[day, n] = stat['reach']
+                    self.cpm[day, n] = stat['spent'] / (stat['reach'] / 1000)
+                    self.listen_rates[day, n] = min(1., stat['listens'] / stat['reach'])
+
+        # Стартовый СРМ - записанный СРМ первого дня с показами (без записанных дней - минимальный)
+        if not self.days:
+            self.start_cpm = np.full(size, MIN_CPM)
+            return
+        first_shown = np.argmax(self.reach > 0, axis=0)
+        self.start_cpm = np.clip(self.cpm[first_shown, np.arange(size)], MIN_CPM, MAX_CPM)
+
+    def impressions(self, day, cpm):
+        recorded_cpm = self.cpm[day]
+        scale = np.divide(cpm, recorded_cpm, out=np.zeros_like(cpm), where=recorded_cpm > 0)
+        return self.reach[day] * scale ** self.elasticity
+
+    def listen_rate(self, day):
+        return self.listen_rates[day]
+
+
+def run_backtest(model, strategies, cycles_per_day=CYCLES_PER_DAY, seed=0):
+    """
+    Прогоняет стратегии автоматизации по модели отклика объявлений быстрее реального времени, полностью офлайн.
+    Все объявления всех кампаний симулируются колонками, решения на каждом цикле - через DecisionEngine.
+    Шум показов и прослушиваний у всех стратегий одинаковый (один сид)
+
+    :param model:           SyntheticAdModel or RecordedAdModel
+    :param strategies:      list, [Strategy, ...]
+    :param cycles_per_day:  int, циклов автоматизации в сутках
+    :param seed:            int, сид генератора случайных чисел
+    :return:                dict, {strategy_name: {'spent': float, 'listens': int, 'reach': int, 'cpl': float,
+                                                   'campaign_days': int, 'seconds': float}}
+    """
+    report = {}
+    for strategy in strategies:
+        started = monotonic()
+        rng = np.random.default_rng(seed)
+        size = len(model.ad_ids)
+
+        cpm = model.start_cpm.copy()
+        status = np.ones(size, dtype=np.int64)
+        approved = np.full(size, 2, dtype=np.int64)
+        spent, reach, listens = np.zeros(size), np.zeros(size), np.zeros(size)
+        target_cost = np.full(size, float(strategy.target_cost))
+
+        for day in range(model.days):
+            impressions_per_cycle = model.impressions(day, cpm) / cycles_per_day
+            listen_rate = model.listen_rate(day)
+            for _ in range(cycles_per_day):
+                # Отклик объявлений за цикл (показы есть только у запущенных)
+                impressions = rng.poisson(impressions_per_cycle * status)
+                spent += impressions * cpm / 1000
+                reach += impressions
+                listens += rng.binomial(impressions, listen_rate)
+
+                # Решения автоматизации по накопленной стате, как в automate_campaign_cycle
+                frame = AdsFrame(model.campaign_keys, model.ad_ids, spent, listens, cpm, status, approved,
+                                 target_cost)
+                decisions = strategy.engine.apply(frame, speed_coef=strategy.speed_coef)
+
+                cpm_update = ~np.isnan(decisions.cpm)
+                if cpm_update.any():
+                    cpm[cpm_update] = np.clip(decisions.cpm[cpm_update], MIN_CPM, MAX_CPM)
+                    impressions_per_cycle = model.impressions(day, cpm) / cycles_per_day
+                status[decisions.stop] = 0
+                status[decisions.start] = 1
+
+        total_spent, total_listens = float(spent.sum()), int(listens.sum())
+        report[strategy.name] = {'spent': round(total_spent, 2),
+                                 'listens': total_listens,
+                                 'reach': int(reach.sum()),
+                                 'cpl': round(total_spent / total_listens, 2) if total_listens else 0,
+                                 'campaign_days': len(np.unique(model.campaign_keys)) * model.days,
+                                 'seconds': round(monotonic() - started, 2)}
+
+    return report
@@ -0,0 +1,141 @@
+from django.utils import timezone
+
+from musictargeting.api.models import Musician, ArtistCard, ArtistCardEdge
+from musictargeting.settings import MUSICIANS_CACHE_TTL, MUSICIANS_CACHE_NEGATIVE_TTL, ARTIST_GRAPH_TTL
+
+
+def _normalize_artist_name(artist_name):
+    """
+    Возвращает имя артиста, приведенное к ключу кэша: без регистра и лишних пробелов
+
+    :param artist_name:     str, имя артиста
+    :return:                str
+    """
+    return ' '.join(artist_name.lower().split())[:100]
+
+
+class MusiciansCache:
+    """
+    Кэш в БД для VkAds.get_musicians: имя артиста -> айди музыканта в рекламном кабинете.
+    Имена, по которым музыкант не нашелся, тоже кэшируются (на меньший срок)
+    """
+
+    def get_many(self, artist_names):
+        """
+        Возвращает найденные в кэше и не устаревшие записи и список имен, которых в кэше нет
+
+        :param artist_names:    list, имена артистов
+        :return:                tuple, ({artist_name: (musician_name, musician_id) or None}, [artist_name, ...])
+                                       None - музыкант по имени не найден в ВК
+        """
+        names_by_key = {}
+        for name in artist_names:
+            names_by_key.setdefault(_normalize_artist_name(name), name)
+
+        musicians = {x.name_key: x for x in Musician.objects.filter(name_key__in=list(names_by_key.keys()))}
+
+        now = timezone.now()
+        cached, misses = {}, []
+        for key, name in names_by_key.items():
+            musician = musicians.get(key)
+            if not musician:
+                misses.append(name)
+            elif musician.musician_vk_id and now - musician.update_datetime < MUSICIANS_CACHE_TTL:
+                cached[name] = (musician.musician_name, musician.musician_vk_id)
+            elif not musician.musician_vk_id and now - musician.update_datetime < MUSICIANS_CACHE_NEGATIVE_TTL:
+                cached[name] = None
+            else:
+                misses.append(name)
+
+        return cached, misses
+
+    def set_many(self, musicians):
+        """
+        Записывает в кэш результаты поиска музыкантов
+
+        :param musicians:   dict, {artist_name: (musician_name, musician_id) or None}
+        """
+        if not musicians:
+            return
+
+        now = timezone.now()
+        updates = {}
+        for name, musician in musicians.items():
+            musician_name, musician_id = musician if musician else (None, None)
+            updates[_normalize_artist_name(name)] = {'musician_name': musician_name,
+                                                     'musician_vk_id': musician_id,
+                                                     'update_datetime': now}
+
+        # Новые записи создаются без ошибки на уже существующих ключах (их мог параллельно создать другой воркер),
+        # затем все записи обновляются
+        Musician.objects.bulk_create([Musician(name_key=key, **fields) for key, fields in updates.items()],
+                                     ignore_conflicts=True)
+
+        musicians = list(Musician.objects.filter(name_key__in=list(updates.keys())))
+        for musician in musicians:
+            for field, value in updates[musician.name_key].items():
+                setattr(musician, field, value)
+        Musician.objects.bulk_update(musicians, ['musician_name', 'musician_vk_id', 'update_datetime'])
+
+
+class ArtistGraphStore:
+
+    def __init__(self, ttl=ARTIST_GRAPH_TTL):
+        """
+        Граф карточек артистов в БД для VkArtistCards.get_related_artists: узлы - карточки артистов,
+        ребра - похожие артисты и фиты. Карточки, обойденные раньше ttl, считаются устаревшими и запрашиваются заново
+
+        :param ttl:     timedelta, срок свежести карточки
+        """
+        self.ttl = ttl
+
+    def get_node(self, card_id=None, card_url=None):
+        """
+        Возвращает свежий узел карточки артиста по айди карточки или ссылке на нее
+        (не по имени: у разных артистов имена часто совпадают)
+
+        :param card_id:         str, айди карточки артиста
+        :param card_url:        str, ссылка на карточку артиста (как в ребрах related)
+        :return:                dict or None, узел как у set_node (None - карточки нет или она устарела)
+        """
+        cards = ArtistCard.objects.filter(crawl_datetime__gte=timezone.now() - self.ttl)
+        if card_id:
+            cards = cards.filter(card_id=card_id)
+        elif card_url:
+            cards = cards.filter(card_url=card_url)
+        else:
+            return None
+
+        card = cards.prefetch_related('edges').order_by('-crawl_datetime').first()
+        if not card:
+            return None
+
+        return {'card_id': card.card_id,
+                'card_url': card.card_url,
+                'artist_name': card.artist_name,
+                'plays': card.plays,
+                'last_release_date': card.last_release_date,
+                'related': {x.target_name: x.target_ref for x in card.edges.all() if x.kind == 'related'},
+                'feats': {x.target_name: x.target_ref for x in card.edges.all() if x.kind == 'feat'}}
+
+    def set_node(self, node):
+        """
+        Записывает обойденную карточку артиста с ее ребрами (старые ребра карточки удаляются)
+
+        :param node:    dict, {'card_id': str, 'card_url': str, 'artist_name': str, 'plays': [int, ...],
+                               'last_release_date': date or None,
+                               'related': {artist_name: artist_card_url}, 'feats': {artist_name: artist_id}}
+        """
+        card, _ = ArtistCard.objects.update_or_create(card_id=node['card_id'],
+                                                      defaults={'card_url': node['card_url'][:255],
+                                                                'artist_name': node['artist_name'][:255],
+                                                                'plays': node['plays'],
+                                                                'last_release_date': node['last_release_date'],
+                                                                'crawl_datetime': timezone.now()})
+
+        card.edges.all().delete()
+        edges = [ArtistCardEdge(source=card, kind='related', target_name=name[:255], target_ref=str(ref)[:255])
+                 for name, ref in node['related'].items()]
+        edges += [ArtistCardEdge(source=card, kind='feat', target_name=name[:255], target_ref=str(ref)[:255])
+                  for name, ref in node['feats'].items()]
+        ArtistCardEdge.objects.bulk_create(edges)
@@ -0,0 +1,88 @@
+import json
+import os
+import socket
+
+from musictargeting.settings import AUTOMATE_CONTROL_SOCKET
+
+
+# Действия над автоматизацией: stop и pause снимают кампанию с планировщика, остальные - запускают ее цикл сразу
+CONTROL_ACTIONS = ['start', 'stop', 'pause', 'resume', 'settings']
+STOP_ACTIONS = ['stop', 'pause']
+
+
+def send_automate_control(action, campaign_pk, path=AUTOMATE_CONTROL_SOCKET):
+    """
+    Отправляет планировщику автоматизаций сообщение о действии над автоматизацией кампании.
+    Сообщение только будит планировщик: само действие уже должно быть записано в БД.
+    Если планировщик не запущен - ничего не делает, он прочитает состояние из БД при старте
+
+    :param action:          str, одно из CONTROL_ACTIONS
+    :param campaign_pk:     int, primary key кампании
+    :param path:            str, путь к файлу сокета планировщика
+    :return:                bool, True - сообщение отправлено
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return False
+
+    message = json.dumps({'action': action, 'campaign_pk': campaign_pk}).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.sendto(message, str(path))
+        except OSError:
+            return False
+    return True
+
+
+class ControlChannel:
+
+    def __init__(self, path=AUTOMATE_CONTROL_SOCKET):
+        """
+        Принимающая сторона канала управления автоматизациями: локальный датаграммный сокет планировщика.
+        На системах без unix-сокетов канал не открывается, планировщик работает только по БД
+
+        :param path:    str, путь к файлу сокета
+        """
+        self.path = str(path)
+        self.sock = None
+        if hasattr(socket, 'AF_UNIX'):
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.path)
+            self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def notify(self):
+        """
+        Будит ждущего на канале (из другого потока того же процесса)
+        """
+        if self.sock:
+            send_automate_control('wake', None, path=self.path)
+
+    def receive(self):
+        """
+        Возвращает все сообщения, пришедшие в канал (не ждет)
+
+        :return:    list, [(action, campaign_pk), ...]
+        """
+        messages = []
+        while self.sock:
+            try:
+                data = self.sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                break
+            try:
+                message = json.loads(data)
+                messages.append((message['action'], message['campaign_pk']))
+            except (ValueError, KeyError):
+                print(f'Bad automate control message: {data}')
+        return messages
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
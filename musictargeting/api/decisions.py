@@ -0,0 +1,209 @@
+import numpy as np
+
+
+class AdsFrame:
+
+    def __init__(self, campaign_keys, ad_ids, spent, listens, cpm, status, approved, target_cost):
+        """
+        Объявления любого количества кампаний в виде колонок (массивов одинаковой длины)
+
+        :param campaign_keys:   array, ключ кампании каждого объявления (например, primary key кампании)
+        :param ad_ids:          array of int, айди объявлений в ВК
+        :param spent:           array of float, потраченный бюджет
+        :param listens:         array of int, прослушивания
+        :param cpm:             array of float, текущий СРМ в рублях
+        :param status:          array of int, статус объявления (0 - остановлено, 1 - запущено)
+        :param approved:        array of int, статус модерации (2 - одобрено)
+        :param target_cost:     array of float, целевая стоимость прослушивания кампании объявления
+        """
+        self.campaign_keys = np.asarray(campaign_keys)
+        self.ad_ids = np.asarray(ad_ids, dtype=np.int64)
+        self.spent = np.asarray(spent, dtype=np.float64)
+        self.listens = np.asarray(listens, dtype=np.float64)
+        self.cpm = np.asarray(cpm, dtype=np.float64)
+        self.status = np.asarray(status, dtype=np.int64)
+        self.approved = np.asarray(approved, dtype=np.int64)
+        self.target_cost = np.asarray(target_cost, dtype=np.float64)
+
+        # Текущая стоимость прослушивания, 0 - если прослушиваний (или трат) еще не было
+        self.cost = np.divide(self.spent, self.listens, out=np.zeros_like(self.spent), where=self.listens > 0)
+
+    def __len__(self):
+        return len(self.ad_ids)
+
+    @classmethod
+    def from_stats(cls, campaign_key, ads_stats, ad_statuses, target_cost):
+        """
+        Возвращает колонки объявлений одной кампании из статы в формате VkAPI.get_full_ads_stat
+
+        :param campaign_key:    ключ кампании
+        :param ads_stats:       dict, {ad_id: {'spent': , 'listens': , 'cpm': , ...}}
+        :param ad_statuses:     dict, {ad_id: {'status': , 'approved': }} - как у VkAds.get_ads
+                                      (None - статусы неизвестны, все объявления считаются готовыми к запуску)
+        :param target_cost:     float, целевая стоимость прослушивания
+        :return:                AdsFrame
+        """
+        ad_ids = list(ads_stats.keys())
+        # Если статусы неизвестны - все объявления готовы к запуску, объявления без статусов не запускаются
+        if ad_statuses:
+            statuses = [ad_statuses.get(x, {'status': 1, 'approved': 0}) for x in ad_ids]
+        else:
+            statuses = [{'status': 0, 'approved': 2}] * len(ad_ids)
+        return cls(campaign_keys=[campaign_key] * len(ad_ids),
+                   ad_ids=ad_ids,
+                   spent=[ads_stats[x]['spent'] for x in ad_ids],
+                   listens=[ads_stats[x]['listens'] for x in ad_ids],
+                   cpm=[ads_stats[x]['cpm'] for x in ad_ids],
+                   status=[x['status'] for x in statuses],
+                   approved=[x['approved'] for x in statuses],
+                   target_cost=[target_cost] * len(ad_ids))
+
+    @classmethod
+    def concat(cls, frames):
+        """
+        Склеивает колонки объявлений нескольких кампаний в одни
+
+        :param frames:  list, [AdsFrame, ...]
+        :return:        AdsFrame
+        """
+        columns = ['campaign_keys', 'ad_ids', 'spent', 'listens', 'cpm', 'status', 'approved', 'target_cost']
+        if not frames:
+            return cls(**{x: [] for x in columns})
+        return cls(**{x: np.concatenate([getattr(frame, x) for frame in frames]) for x in columns})
+
+
+class Decisions:
+
+    def __init__(self, size):
+        """
+        Решения по объявлениям в виде колонок, заполняются правилами по очереди
+
+        :param size:    int, количество объявлений
+        """
+        self.decided = np.zeros(size, dtype=bool)       # Объявление уже обработано одним из правил
+        self.stop = np.zeros(size, dtype=bool)          # Остановить
+        self.start = np.zeros(size, dtype=bool)         # Запустить
+        self.cpm = np.full(size, np.nan)                # Новый СРМ, nan - не менять
+
+
+class CpmRaiseRule:
+
+    def __init__(self, step=5.1, max_cpm=115):
+        """
+        Кост не выше целевого, а СРМ есть куда увеличивать - увеличиваем СРМ на step
+
+        :param step:        float, шаг изменения СРМ в рублях
+        :param max_cpm:     float, СРМ, выше которого не поднимаем
+        """
+        self.step = step
+        self.max_cpm = max_cpm
+
+    def __call__(self, frame, decisions, speed_coef=1.):
+        mask = ~decisions.decided & (frame.cost > 0) & (frame.cost <= frame.target_cost * speed_coef) & \
+            (frame.cpm <= self.max_cpm)
+        decisions.cpm[mask] = frame.cpm[mask] + self.step
+        decisions.decided |= mask
+
+
+class CpmLowerRule:
+
+    def __init__(self, step=5.1, cpm_threshold=35.1, stop_coef=1.2):
+        """
+        Кост выше целевого, но ниже остановочного (целевой * stop_coef) - понижаем СРМ на step
+
+        :param step:            float, шаг изменения СРМ в рублях
+        :param cpm_threshold:   float, СРМ, выше которого правило не срабатывает
+        :param stop_coef:       float, во сколько раз остановочный кост больше целевого
+        """
+        self.step = step
+        self.cpm_threshold = cpm_threshold
+        self.stop_coef = stop_coef
+
+    def __call__(self, frame, decisions, speed_coef=1.):
+        target_cost = frame.target_cost * speed_coef
+        stop_cost = frame.target_cost * self.stop_coef * speed_coef
+        mask = ~decisions.decided & (frame.cost > 0) & (frame.cost > target_cost) & (frame.cost < stop_cost) & \
+            (frame.cpm <= self.cpm_threshold)
+        decisions.cpm[mask] = frame.cpm[mask] - self.step
+        decisions.decided |= mask
+
+
+class StopRule:
+
+    def __init__(self, stop_coef=1.2):
+        """
+        Кост выше остановочного (целевой * stop_coef) - останавливаем объявление
+
+        :param stop_coef:   float, во сколько раз остановочный кост больше целевого
+        """
+        self.stop_coef = stop_coef
+
+    def __call__(self, frame, decisions, speed_coef=1.):
+        mask = ~decisions.decided & (frame.cost > 0) & (frame.cost > frame.target_cost * self.stop_coef * speed_coef)
+        decisions.stop |= mask
+        decisions.decided |= mask
+
+
+class StartRule:
+    """
+    Одобренные и остановленные объявления, которые не нужно останавливать, - запускаем
+    """
+
+    def __call__(self, frame, decisions, speed_coef=1.):
+        decisions.start |= ~decisions.stop & (frame.approved == 2) & (frame.status == 0)
+
+
+# Правила автоматизации по умолчанию, применяются по очереди: объявление, обработанное правилом,
+# следующими правилами СРМ и остановки не трогается
+DEFAULT_RULES = [CpmRaiseRule(), CpmLowerRule(), StopRule(), StartRule()]
+
+
+class DecisionEngine:
+
+    def __init__(self, rules=None):
+        """
+        Движок решений автоматизации: за один векторный проход по колонкам объявлений всех кампаний
+        считает, какие объявления запустить, остановить и кому поменять СРМ.
+        Правило - callable (frame, decisions, speed_coef), который дописывает свои решения в Decisions
+
+        :param rules:   list, правила по порядку применения (None - DEFAULT_RULES)
+        """
+        self.rules = rules if rules is not None else DEFAULT_RULES
+
+    def decide(self, frame, speed_coef=None):
+        """
+        Возвращает решения по объявлениям, сгруппированные по кампаниям
+
+        :param frame:           AdsFrame, объявления всех кампаний
+        :param speed_coef:      float, коэффициент ускорения кампаний (умножается на целевой и остановочный кост)
+        :return:                dict, {campaign_key: (start_ads, stop_ads, cpm_update)}
+                                      start_ads, stop_ads - [ad_id, ...], cpm_update - {ad_id: cpm}
+        """
+        decisions = self.apply(frame, speed_coef)
+
+        campaign_keys = frame.campaign_keys.tolist()
+        ad_ids = frame.ad_ids.tolist()
+        results = {key: ([], [], {}) for key in set(campaign_keys)}
+
+        # Python-циклы только по объявлениям, по которым есть решения
+        for n in np.flatnonzero(decisions.start).tolist():
+            results[campaign_keys[n]][0].append(ad_ids[n])
+        for n in np.flatnonzero(decisions.stop).tolist():
+            results[campaign_keys[n]][1].append(ad_ids[n])
+        for n in np.flatnonzero(~np.isnan(decisions.cpm)).tolist():
+            results[campaign_keys[n]][2][ad_ids[n]] = decisions.cpm[n].item()
+
+        return results
+
+    def apply(self, frame, speed_coef=None):
+        """
+        Применяет правила к колонкам объявлений
+
+        :param frame:           AdsFrame
+        :param speed_coef:      float, коэффициент ускорения кампаний
+        :return:                Decisions
+        """
+        decisions = Decisions(len(frame))
+        for rule in self.rules:
+            rule(frame, decisions, speed_coef=speed_coef if speed_coef else 1.)
+        return decisions
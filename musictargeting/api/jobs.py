@@ -0,0 +1,25 @@
+from musictargeting.api.models import Job
+from musictargeting.settings import JOB_PRIORITIES
+
+
+def enqueue_job(command, owner=None, owner_id=None, priority=None, **kwargs):
+    """
+    Ставит задачу в очередь для воркеров run_job_workers и возвращает ее объект
+
+    :param command:     str, название management-команды ('start_campaign', 'update_campaign_stats', ...)
+    :param owner:       User, владелец задачи (чтобы он мог смотреть ее статус через API)
+    :param owner_id:    int, primary key владельца задачи (вместо owner)
+    :param priority:    int, приоритет задачи, больше - раньше (None - приоритет команды из JOB_PRIORITIES)
+    :param kwargs:      параметры команды, как для call_command
+    :return:            Job
+    """
+    if priority is None:
+        priority = JOB_PRIORITIES.get(command, 0)
+
+    job = Job(command=command, kwargs=kwargs, priority=priority)
+    if owner is not None:
+        job.owner = owner
+    elif owner_id is not None:
+        job.owner_id = owner_id
+    job.save()
+    return job
@@ -1,184 +1,210 @@
-from datetime import datetime, date, timedelta
-from time import sleep
+from datetime import datetime, timedelta
 
-from musictargeting.api.models import Campaign, Ad
+from django.utils import timezone
+
+from musictargeting.api.control import send_automate_control
+from musictargeting.api.decisions import AdsFrame, DecisionEngine
+from musictargeting.api.models import Campaign, Ad, AutomateSettings
+from musictargeting.api.reconcile import AdStateReconciler
+from musictargeting.api.stats import CabinetStatsCollector, StatsAggregator
 from musictargeting.api.vk import vk_framework
-from musictargeting.settings import DEV_PROXY, DEV_RUCAPTCHA_KEY
+from musictargeting.settings import DEV_PROXY, DEV_RUCAPTCHA_KEY, AUTOMATE_INTERVAL
 
 
-def automate_campaign(campaign, target_cost, start_tomorrow, finish_tomorrow, is_restart):
+def start_automate(campaign, target_cost, start_tomorrow, finish_tomorrow, is_restart):
+    """
+    Включает автоматизацию кампании: снимает лимиты с объявлений и сохраняет настройки автоматизации.
+    Сами циклы автоматизации выполняет демон планировщика (continue_automate_campaigns)
 
-    # Получение переменных, которые не будут меняться в процессе
-    # Там же заодно снимаются лимиты с объявлений и обновляется объект кампании в БД (automate=1)
-    ads, ads_for_vk_framework, campaign_pk, vk = _get_automate_constant_objects(campaign)
+    :param campaign:            Campaign, объект кампании
+    :param target_cost:         float, целевая стоимость прослушивания
+    :param start_tomorrow:      bool, начать автоматизацию с завтрашнего дня
+    :param finish_tomorrow:     bool, закончить автоматизацию в конце дня старта
+    :param is_restart:          bool, продолжить с последними сохраненными настройками автоматизации
+    """
+    vk = _get_vk(campaign)
+    ad_ids = list(Ad.objects.filter(campaign_vk_id=campaign.campaign_vk_id).values_list('ad_vk_id', flat=True))
+    vk.ads.limit_ads(ad_ids=ad_ids, limit=0)
 
-    # Получение времени старта и остановки автоматизации кампании
-    if is_restart:
-        automate_settings = list(campaign.automate_settings.all().order_by('-settings_create_datetime'))[0]
-        start_time, finish_time = automate_settings.start_time, automate_settings.finish_time
-    else:
+    if not is_restart or not campaign.automate_settings.exists():
         start_time, finish_time = _get_time_params(finish_tomorrow, start_tomorrow)
+        AutomateSettings.objects.create(campaign=campaign,
+                                        campaign_vk_id=campaign.campaign_vk_id,
+                                        target_cost=target_cost,
+                                        start_time=start_time,
+                                        finish_time=finish_time)
 
-    # Ожидание наступления времени старта автоматизации
-    _waiting_start_time(start_time)
-
-    # Цикл автоматизации до наступления времени остановки
-    while datetime.now() < finish_time:
-        # Получение обновленных параметров кампании
-        ad_stats, ad_statuses, campaign = _get_updated_campaign_params(ads_for_vk_framework, campaign_pk, vk)
-
-        # Если есть стата и кампания все еще автоматизирована
-        if ad_stats and campaign.automate:
-            start_ads, stop_ads = _update_ad_params_in_vk(ad_stats, ad_statuses, target_cost, vk)
-            updated_campaign_stat = _update_ad_objects(ad_stats, ads, start_ads, stop_ads)
-            _update_campaign_object(campaign, updated_campaign_stat)
-
-        # Если есть стата, но автоматизацию нужно остановить (обновился параметр у объекта кампании в БД)
-        elif ad_stats and not campaign.automate:
-            updated_campaign_stat = _update_ad_objects(ad_stats, ads, [], ads_for_vk_framework.keys())
-            _update_campaign_object(campaign, updated_campaign_stat)
-            break
-
-        # Если ошибка со статой и автоматизацию нужно остановить (обновился параметр у объекта кампании в БД)
-        if not campaign.automate:
-            break
-
-        # Завершение автоматизации, если всеобъявления в кампании остановлены
-        if ad_statuses:
-            stopped_ads = [ad_id for ad_id, statuses in ad_statuses.items() if statuses['status'] == 0]
-            if len(stopped_ads) == len(ads_for_vk_framework):
-                break
-
-        sleep(600)
-
-
-def _get_updated_campaign_params(ads_for_vk_framework, campaign_pk, vk):
-    campaign = Campaign.objects.get(pk=campaign_pk)
-    ad_stats = vk.get_full_ads_stat(ads=ads_for_vk_framework)
-    ad_statuses = vk.ads.get_ads(campaign_id=campaign.cabinet_vk_id)
-    return ad_stats, ad_statuses, campaign
-
-
-def _get_automate_constant_objects(campaign):
-    campaign_pk = campaign.pk
-    user = campaign.owner
-    ads = Ad.objects.all().filter(campaign_vk_id=campaign.cabinet_vk_id)
-    ads_for_vk_framework = {ad.ad_vk_id: ad.playlist_url for ad in list(ads)}
-    vk = vk_framework.VkAPI(token=user.vk_token,
-                            ads_cabinet_id=campaign.cabinet_vk_id,
-                            ads_client_id=campaign.client_vk_id,
-                            rucaptcha_key=DEV_RUCAPTCHA_KEY,
-                            proxy=DEV_PROXY)
-
-    vk.ads.limit_ads(ad_ids=ads_for_vk_framework, limit=0)
     campaign.automate = 1
-    campaign.save()
-
-    return ads, ads_for_vk_framework, campaign_pk, vk
-
+    campaign.save(update_fields=['automate'])
+    send_automate_control('settings', campaign.pk)
+
+
+def automate_campaign_cycle(campaign_pk, vk=None, campaign_stats=None, aggregator=None, decisions=None, pacer=None):
+    """
+    Выполняет один цикл автоматизации кампании: обновляет стату, меняет СРМ, запускает и останавливает объявления.
+    Настройки и флаг автоматизации (0 - выключена, 1 - включена, 2 - на паузе) перечитываются из БД каждый цикл
+
+    :param campaign_pk:         int, primary key кампании в БД
+    :param vk:                  VkAPI, объект API кабинета кампании (None - будет создан)
+    :param campaign_stats:      dict, часть результата CabinetStatsCollector.collect для этой кампании
+                                      (None - стата кампании будет запрошена отдельно)
+    :param aggregator:          StatsAggregator, общий движок статы для нескольких циклов, сохраняет вызывающий код
+                                (None - изменения сохраняются в конце цикла)
+    :param decisions:           tuple, (start_ads, stop_ads, cpm_update) - решения, посчитанные для всего кабинета
+                                (None - решения будут посчитаны для этой кампании)
+    :param pacer:               AutomatePacer, адаптивный интервал между циклами (None - постоянный AUTOMATE_INTERVAL)
+    :return:                    datetime or None, время следующего цикла, None - автоматизация кампании завершена
+    """
+    campaign = Campaign.objects.filter(pk=campaign_pk).first()
+    if not campaign:
+        return None
+    automate_settings = campaign.automate_settings.all().order_by('-settings_create_datetime').first()
+    if not automate_settings:
+        return None
 
-def _update_ad_params_in_vk(ad_stats, ad_statuses, target_cost, vk):
-    start_ads, stop_ads, cpm_update = _get_ads_dicisions(ad_stats, ad_statuses, target_cost)
-    vk.ads.start_ads(ad_ids=start_ads)
-    vk.ads.stop_ads(ad_ids=stop_ads)
-    vk.ads.update_cpm(cpm_dict=cpm_update)
-    return start_ads, stop_ads
-
-
-def _update_campaign_object(campaign, updated_campaign_stat):
-    campaign.spent = updated_campaign_stat['spent']
-    campaign.listens = updated_campaign_stat['listens']
-    campaign.listens = updated_campaign_stat['reach']
-    campaign.listens = updated_campaign_stat['clicks']
-    campaign.listens = updated_campaign_stat['subscribes']
-
-    reach = updated_campaign_stat['reach']
-
-    listens = updated_campaign_stat['listens']
-
-    campaign.cpm = updated_campaign_stat['spent'] / (reach / 1000) if reach else 0
-    campaign.cpl = updated_campaign_stat['spent'] / listens if listens else 0
-
-    campaign.save()
-
-
-def _update_ad_objects(ad_stats, ads, start_ads, stop_ads):
-    updated_ad_objects = []
-    updated_campaign_stat = {'spent': 0, 'listens': 0, 'reach': 0, 'clicks': 0, 'subscribes': 0}
-    for ad in list(ads):
-        # Если был охват (если он не ноль)
-        if ad_stats[ad.ad_vk_id]['reach']:
-            # Обновление статы в объектах объявлений
-            ad.spent = ad_stats[ad.ad_vk_id]['spent']
-            ad.reach = ad_stats[ad.ad_vk_id]['reach'],
-            ad.cpm = ad_stats[ad.ad_vk_id]['cpm'],
-            ad.clicks = ad_stats[ad.ad_vk_id]['clicks'],
-            ad.subscribes = ad_stats[ad.ad_vk_id]['subscribes'],
-            ad.listens = ad_stats[ad.ad_vk_id]['listens']
-
-            # Обновление средней статы кампании
-            for param in updated_campaign_stat.keys():
-                updated_campaign_stat[param] += ad_stats[ad.ad_vk_id][param]
+    # Ожидание наступления времени старта автоматизации
+    now = timezone.now()
+    if now < automate_settings.start_time:
+        return automate_settings.start_time if campaign.automate == 1 else None
+
+    # Автоматизация закончилась по времени
+    if now >= automate_settings.finish_time:
+        _finish_automate(campaign)
+        return None
+
+    # Получение обновленных параметров кампании
+    vk = vk if vk else _get_vk(campaign)
+    if campaign_stats is None:
+        campaign_stats = CabinetStatsCollector(vk, [campaign]).collect()[campaign.pk]
+    ads, ad_stats, ad_statuses = campaign_stats['ads'], campaign_stats['ad_stats'], campaign_stats['ad_statuses']
+
+    # Обновление статы объявлений и кампании (в том числе, если автоматизацию нужно остановить)
+    save_stats = aggregator is None
+    aggregator = aggregator if aggregator else StatsAggregator()
+    if ad_stats:
+        aggregator.update_ads(campaign, ads, ad_stats, ad_statuses)
+
+    # Если есть стата и кампания все еще автоматизирована (не остановлена и не на паузе)
+    if ad_stats and campaign.automate == 1:
+        if decisions is None:
+            decisions = _get_ads_dicisions(ad_stats, ad_statuses, automate_settings.target_cost)
+        start_ads, stop_ads = _update_ad_params_in_vk(decisions, vk, ad_statuses)
+        aggregator.set_ads_status(ads, start_ads, 1)
+        aggregator.set_ads_status(ads, stop_ads, 0)
+
+    if save_stats:
+        aggregator.save()
+
+    if campaign.automate != 1:
+        return None
+
+    # Завершение автоматизации, если все объявления в кампании остановлены
+    if ad_statuses:
+        stopped_ads = [ad_id for ad_id, statuses in ad_statuses.items() if statuses['status'] == 0]
+        if len(stopped_ads) == len(ads):
+            _finish_automate(campaign)
+            return None
+
+    if pacer is None:
+        return timezone.now() + AUTOMATE_INTERVAL
+    return timezone.now() + pacer.next_interval(campaign, automate_settings.target_cost, ad_stats, ad_statuses)
+
+
+def automate_cabinet_cycles(campaigns, pacer=None):
+    """
+    Выполняет циклы автоматизации кампаний одного кабинета, стата всех кампаний собирается за один проход
+
+    :param campaigns:   list, [Campaign, ...] - кампании одного кабинета (и клиента) одного владельца
+    :param pacer:       AutomatePacer, адаптивный интервал между циклами (None - постоянный AUTOMATE_INTERVAL)
+    :return:            dict, {campaign_pk: datetime or None} - время следующего цикла каждой кампании
+    """
+    vk = _get_vk(campaigns[0])
+    cabinet_stats = CabinetStatsCollector(vk, campaigns).collect()
+    cabinet_decisions = _get_cabinet_decisions(campaigns, cabinet_stats)
+
+    # Стата всех кампаний кабинета сохраняется в БД одной записью после всех циклов
+    aggregator = StatsAggregator()
+    next_runs = {}
+    for campaign in campaigns:
+        try:
+            next_runs[campaign.pk] = automate_campaign_cycle(campaign.pk, vk=vk,
+                                                             campaign_stats=cabinet_stats[campaign.pk],
+                                                             aggregator=aggregator,
+                                                             decisions=cabinet_decisions.get(campaign.pk),
+                                                             pacer=pacer)
+        except Exception as exc:
+            print(f'Automate cycle of campaign {campaign.pk} failed: {exc}')
+            next_runs[campaign.pk] = timezone.now() + AUTOMATE_INTERVAL
+    aggregator.save()
+
+    return next_runs
+
+
+def _get_cabinet_decisions(campaigns, cabinet_stats):
+    """
+    Считает решения по объявлениям всех автоматизированных кампаний кабинета одним векторным проходом
+
+    :param campaigns:       list, [Campaign, ...] - кампании одного кабинета
+    :param cabinet_stats:   dict, результат CabinetStatsCollector.collect
+    :return:                dict, {campaign_pk: (start_ads, stop_ads, cpm_update)}
+    """
+    # Последние настройки автоматизации каждой кампании
+    target_costs = {}
+    automate_settings = AutomateSettings.objects.filter(campaign_id__in=[x.pk for x in campaigns])\
+        .order_by('campaign_id', '-settings_create_datetime').values_list('campaign_id', 'target_cost')
+    for campaign_pk, target_cost in automate_settings:
+        target_costs.setdefault(campaign_pk, target_cost)
+
+    frames = []
+    for campaign in campaigns:
+        campaign_stats = cabinet_stats[campaign.pk]
+        if campaign.automate == 1 and campaign_stats['ad_stats'] and campaign.pk in target_costs:
+            frames.append(AdsFrame.from_stats(campaign.pk, campaign_stats['ad_stats'],
+                                              campaign_stats['ad_statuses'], target_costs[campaign.pk]))
+
+    return DecisionEngine().decide(AdsFrame.concat(frames))
+
+
+def _get_vk(campaign):
+    user = campaign.owner
+    return vk_framework.VkAPI(token=user.vk_token,
+                              ads_cabinet_id=campaign.cabinet_vk_id,
+                              ads_client_id=campaign.client_vk_id,
+                              rucaptcha_key=DEV_RUCAPTCHA_KEY,
+                              proxy=DEV_PROXY)
 
-        # Обновление статусов объявлений
-        if ad in start_ads:
-            ad.status = 1
-        elif ad in stop_ads:
-            ad.status = 0
 
-        # Добавление обновленного объекта в лист
-        updated_ad_objects.append(ad)
+def _finish_automate(campaign):
+    campaign.automate = 0
+    campaign.save(update_fields=['automate'])
 
-    # Сохранение обновленных объектво объявлений в БД
-    Ad.objects.bulk_update(updated_ad_objects, ['spent', 'reach', 'cpm', 'clicks', 'subscribes', 'listens', 'status'])
 
-    # Возврат обновленной средней статы кампании
-    return updated_campaign_stat
+def _update_ad_params_in_vk(decisions, vk, ad_statuses=None):
+    # В ВК уходят только статусы и СРМ, которые отличаются от полученных в этом цикле через get_ads.
+    # Объявления, изменения которых не применились, в БД не запускаются и не останавливаются
+    start_ads, stop_ads, cpm_update = decisions
+    results = AdStateReconciler(ad_statuses).push(vk, start_ads=start_ads, stop_ads=stop_ads, cpm_update=cpm_update)
+    failed_ads = set(ad_id for ad_id, success in results.items() if not success)
+    return [x for x in start_ads if x not in failed_ads], [x for x in stop_ads if x not in failed_ads]
 
 
 def _get_ads_dicisions(ads_stats, ad_statuses, target_cost, speed_coef=None):
-    # Расчет stop_cost из target_cost
-    stop_cost = target_cost * 1.2
-
-    # Если передан коэффициент ускорения кампании
-    if speed_coef:
-        target_cost *= speed_coef
-        stop_cost *= speed_coef
-
-    # Проход по каждому объявлению
-    stop_ads, cpm_update = [], {}
-    for ad_id, ad_stats in ads_stats.items():
-        # Расчет текущей стоимости прослушивания, если есть хотя бы одно прослушивание
-        current_cost = ad_stats['spent'] / ad_stats['listens'] if ad_stats['listens'] else None
-
-        # Если кост меньше или равен целевому, а СРМ есть куда увеличивать - увеличиваем
-        if current_cost and current_cost <= target_cost and ad_stats['cpm'] <= 115:
-            cpm_update[ad_id] = ad_stats['cpm'] + 5.1
-
-        # Если кост выше целевого, но ниже остановочного и СРМ есть куда понижать - понижаем
-        elif current_cost and stop_cost > current_cost > target_cost and ad_stats['cpm'] <= 35.1:
-            cpm_update[ad_id] = ad_stats['cpm'] - 5.1
-
-        # Если кост выше остановочного - останавливаем
-        elif current_cost and current_cost > stop_cost:
-            stop_ads.append(ad_id)
-
-    # Получение объявлений для запуска
-    start_ads = [x for x in ads_stats.keys() if x not in stop_ads]
-    if ad_statuses:
-        start_ads = [x for x in start_ads if ad_statuses[x]['approved'] == 2 and ad_statuses[x]['status'] == 0]
+    """
+    Возвращает решения по объявлениям одной кампании (через DecisionEngine с правилами по умолчанию)
 
-    return start_ads, stop_ads, cpm_update
+    :param ads_stats:       dict, {ad_id: {...}} - как у VkAPI.get_full_ads_stat
+    :param ad_statuses:     dict, {ad_id: {...}} - как у VkAds.get_ads
+    :param target_cost:     float, целевая стоимость прослушивания
+    :param speed_coef:      float, коэффициент ускорения кампании
+    :return:                tuple, (start_ads, stop_ads, cpm_update)
+    """
+    frame = AdsFrame.from_stats(0, ads_stats, ad_statuses, target_cost)
+    return DecisionEngine().decide(frame, speed_coef=speed_coef).get(0, ([], [], {}))
 
 
 def _get_time_params(finish_tomorrow, start_tomorrow):
-    start_time = datetime.combine(date.today(), datetime.min.time())
+    start_time = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
     if start_tomorrow:
         start_time += timedelta(days=1)
     finish_time = start_time + timedelta(hours=23, minutes=59) if finish_tomorrow else start_time + timedelta(days=365)
     return start_time, finish_time
-
-
-def _waiting_start_time(start_time):
-    while datetime.now() < start_time:
-        sleep(60)
@@ -0,0 +1,209 @@
+import heapq
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+from select import select
+from time import sleep
+
+from django.db import connection
+from django.utils import timezone
+
+from musictargeting.api.control import ControlChannel, STOP_ACTIONS
+from musictargeting.api.management.commands._automate_campaign import automate_cabinet_cycles, _finish_automate
+from musictargeting.api.models import AutomateSettings, Campaign
+from musictargeting.api.pacing import AutomatePacer
+from musictargeting.api.stats import group_campaigns_by_cabinet
+from musictargeting.settings import AUTOMATE_WORKERS, AUTOMATE_INTERVAL, AUTOMATE_SCHEDULER_REFRESH
+
+
+class AutomateScheduler:
+
+    def __init__(self, max_workers=AUTOMATE_WORKERS):
+        """
+        Планировщик автоматизаций: один процесс на все автоматизированные кампании.
+        Кампании лежат в очереди по времени следующего цикла (интервал у каждой кампании свой, см. AutomatePacer).
+        Планировщик просыпается только когда подошло время цикла какой-то кампании, пришло сообщение в канал
+        управления (остановка, пауза, новые настройки) или пора перечитать из БД новые автоматизации.
+        Подошедшие кампании группируются по кабинетам, циклы кабинетов выполняются в пуле из max_workers потоков
+
+        :param max_workers:     int, максимум одновременно обрабатываемых кабинетов
+        """
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.channel = ControlChannel()
+        self.pacer = AutomatePacer()
+        self.queue = []         # [(next_run, campaign_pk), ...] - куча по времени следующего цикла
+        self.next_runs = {}     # {campaign_pk: next_run} - актуальное время цикла, остальные записи кучи устарели
+        self.scheduled = set()  # primary key кампаний в очереди или в работе
+        self.running = {}       # {future: [campaign_pk, ...]}
+        self.stopped = set()    # кампании в работе, которые сняли с автоматизации во время цикла
+        self.woken = set()      # кампании в работе, цикл которых нужно повторить сразу после текущего
+        self.next_refresh = timezone.now()
+
+    def run(self):
+        """
+        Основной цикл планировщика, работает до прерывания процесса
+        """
+        try:
+            while True:
+                now = timezone.now()
+                if now >= self.next_refresh:
+                    self._load_automates()
+                    self.next_refresh = now + timedelta(seconds=AUTOMATE_SCHEDULER_REFRESH)
+
+                self._submit_due()
+                self._wait()
+        except KeyboardInterrupt:
+            self.executor.shutdown(wait=True)
+        finally:
+            self.channel.close()
+
+    def _schedule(self, campaign_pk, next_run):
+        self.scheduled.add(campaign_pk)
+        self.next_runs[campaign_pk] = next_run
+        heapq.heappush(self.queue, (next_run, campaign_pk))
+
+    def _unschedule(self, campaign_pk):
+        self.scheduled.discard(campaign_pk)
+        self.next_runs.pop(campaign_pk, None)
+        self.pacer.forget(campaign_pk)
+
+    def _load_automates(self):
+        """
+        Добавляет в очередь кампании, автоматизация которых включена, но которых еще нет в планировщике.
+        Автоматизации, время окончания которых прошло (например, пока планировщик не работал), завершаются
+        """
+        now = timezone.now()
+        automate_settings = AutomateSettings.objects.filter(campaign__automate=1)\
+            .exclude(campaign_id__in=list(self.scheduled)).select_related('campaign')\
+            .order_by('campaign_id', '-settings_create_datetime')
+
+        loaded = set()
+        for settings in list(automate_settings):
+            # Берутся только последние настройки каждой кампании
+            if settings.campaign_id in loaded:
+                continue
+            loaded.add(settings.campaign_id)
+
+            if settings.finish_time <= now:
+                _finish_automate(settings.campaign)
+                continue
+            self._schedule(settings.campaign_id, max(now, settings.start_time))
+
+    def _submit_due(self):
+        """
+        Отправляет в пул циклы кампаний, время которых подошло, по одной задаче на кабинет
+        (пока в пуле есть свободные потоки)
+        """
+        now = timezone.now()
+        if len(self.running) >= self.max_workers:
+            return
+
+        due_campaign_pks = []
+        while self.queue and self.queue[0][0] <= now:
+            next_run, campaign_pk = heapq.heappop(self.queue)
+            # Кампанию перепланировали или сняли с автоматизации - запись в куче устарела
+            if self.next_runs.get(campaign_pk) != next_run:
+                continue
+            del self.next_runs[campaign_pk]
+            due_campaign_pks.append(campaign_pk)
+        if not due_campaign_pks:
+            return
+
+        campaigns = list(Campaign.objects.filter(pk__in=due_campaign_pks).select_related('owner'))
+        for campaign_pk in set(due_campaign_pks) - set(x.pk for x in campaigns):
+            self.scheduled.discard(campaign_pk)
+
+        for cabinet_campaigns in group_campaigns_by_cabinet(campaigns).values():
+            future = self.executor.submit(_run_cabinet_cycles, cabinet_campaigns, self.pacer)
+            self.running[future] = [x.pk for x in cabinet_campaigns]
+            # Завершение цикла будит планировщик через тот же канал управления
+            future.add_done_callback(lambda _: self.channel.notify())
+
+    def _wait(self):
+        """
+        Спит до ближайшего события: сообщения в канале управления, завершения цикла,
+        времени цикла очередной кампании или перечитывания БД
+        """
+        wake_time = self.next_refresh
+        if self.queue and len(self.running) < self.max_workers:
+            wake_time = min(wake_time, self.queue[0][0])
+        timeout = max(0., (wake_time - timezone.now()).total_seconds())
+
+        if self.channel.sock:
+            select([self.channel], [], [], timeout)
+            self._apply_controls(self.channel.receive())
+        elif self.running:
+            wait(list(self.running.keys()), timeout=timeout, return_when=FIRST_COMPLETED)
+        else:
+            sleep(timeout)
+
+        self._collect_finished()
+
+    def _apply_controls(self, messages):
+        """
+        Применяет сообщения канала управления. Состояние автоматизации уже записано в БД отправителем,
+        сообщение только говорит, какую кампанию обработать сейчас, а не по расписанию
+
+        :param messages:    list, [(action, campaign_pk), ...] - как у ControlChannel.receive
+        """
+        now = timezone.now()
+        running_pks = set(x for campaign_pks in self.running.values() for x in campaign_pks)
+        for action, campaign_pk in messages:
+            if campaign_pk is None:
+                continue
+
+            if action in STOP_ACTIONS:
+                if campaign_pk in running_pks:
+                    self.stopped.add(campaign_pk)
+                else:
+                    self._unschedule(campaign_pk)
+            elif campaign_pk in running_pks:
+                self.stopped.discard(campaign_pk)
+                self.woken.add(campaign_pk)
+            elif campaign_pk in self.next_runs:
+                self._schedule(campaign_pk, now)
+            else:
+                # Новой (или возобновленной) автоматизации еще нет в планировщике - перечитываем БД сразу
+                self.next_refresh = now
+
+    def _collect_finished(self):
+        """
+        Разбирает завершившиеся циклы кабинетов и ставит их кампании в очередь на следующий цикл
+        """
+        for future in [x for x in self.running if x.done()]:
+            campaign_pks = self.running.pop(future)
+            try:
+                next_runs = future.result()
+            except Exception as exc:
+                print(f'Automate cycles of campaigns {campaign_pks} failed: {exc}')
+                next_runs = {x: timezone.now() + AUTOMATE_INTERVAL for x in campaign_pks}
+
+            for campaign_pk, next_run in next_runs.items():
+                if campaign_pk in self.stopped:
+                    next_run = None
+                elif campaign_pk in self.woken:
+                    if next_run:
+                        next_run = timezone.now()
+                    else:
+                        # Цикл увидел промежуточное состояние (например, перезапуск с новыми настройками)
+                        self.next_refresh = timezone.now()
+                self.stopped.discard(campaign_pk)
+                self.woken.discard(campaign_pk)
+
+                if next_run:
+                    self._schedule(campaign_pk, next_run)
+                else:
+                    self._unschedule(campaign_pk)
+
+
+def _run_cabinet_cycles(campaigns, pacer):
+    try:
+        return automate_cabinet_cycles(campaigns, pacer=pacer)
+    finally:
+        # У каждого потока свое соединение с БД, между циклами оно не нужно
+        connection.close()
+
+
+def run_automate_scheduler(max_workers=AUTOMATE_WORKERS):
+    AutomateScheduler(max_workers=max_workers).run()
@@ -0,0 +1,63 @@
+from itertools import product
+
+from musictargeting.api.backtest import Strategy, SyntheticAdModel, RecordedAdModel, run_backtest
+from musictargeting.api.models import AdStatSnapshot
+
+
+def backtest_automate(target_costs, speed_coefs, campaign_pks=None, campaigns=100, ads_per_campaign=30, days=30,
+                      elasticity=1.5, seed=0):
+    """
+    Прогоняет стратегии автоматизации (все сочетания target_cost и speed_coef) по записанной стате кампаний
+    или по синтетической модели и печатает отчет
+
+    :param target_costs:        list of float, целевые стоимости прослушивания
+    :param speed_coefs:         list of float, коэффициенты ускорения
+    :param campaign_pks:        list of int, кампании, по снимкам статы которых строится модель (None - синтетика)
+    :param campaigns:           int, кампаний в синтетической модели
+    :param ads_per_campaign:    int, объявлений в кампании синтетической модели
+    :param days:                int, дней в синтетической модели
+    :param elasticity:          float, эластичность показов по СРМ
+    :param seed:                int, сид генератора случайных чисел
+    """
+    if campaign_pks:
+        series = _get_recorded_series(campaign_pks)
+        if not series:
+            print(f'No recorded stats for campaigns {campaign_pks}')
+            return
+        model = RecordedAdModel(series, elasticity=elasticity)
+    else:
+        model = SyntheticAdModel(campaigns=campaigns, ads_per_campaign=ads_per_campaign, days=days,
+                                 elasticity=elasticity, seed=seed)
+
+    strategies = [Strategy(f'target_cost={tc} speed_coef={sc}', tc, sc)
+                  for tc, sc in product(target_costs, speed_coefs)]
+    report = run_backtest(model, strategies, seed=seed)
+
+    for name, result in report.items():
+        print(f"{name}: spent {result['spent']}, listens {result['listens']}, cpl {result['cpl']} "
+              f"({result['campaign_days']} campaign-days in {result['seconds']} s)")
+
+
+def _get_recorded_series(campaign_pks):
+    """
+    Возвращает дневную стату объявлений кампаний из снимков AdStatSnapshot
+
+    :param campaign_pks:    list of int, primary key кампаний
+    :return:                dict, {campaign_pk: {ad_pk: [{'day': date, 'spent': , 'reach': , 'listens': }, ...]}}
+    """
+    snapshots = AdStatSnapshot.objects.filter(ad__campaign_id__in=campaign_pks).order_by('ad_id', 'day', 'timestamp')\
+        .values_list('ad__campaign_id', 'ad_id', 'day', 'spent', 'reach', 'listens')
+
+    # Последний снимок каждого дня, первый снимок объявления - точка отсчета прослушиваний плейлиста
+    last_day_snapshots, first_listens = {}, {}
+    for campaign_pk, ad_pk, day, spent, reach, listens in snapshots.iterator():
+        first_listens.setdefault(ad_pk, listens)
+        last_day_snapshots[(campaign_pk, ad_pk, day)] = (spent, reach, listens)
+
+    series, prev_listens = {}, {}
+    for (campaign_pk, ad_pk, day), (spent, reach, listens) in last_day_snapshots.items():
+        day_listens = listens - prev_listens.get(ad_pk, first_listens[ad_pk])
+        prev_listens[ad_pk] = listens
+        series.setdefault(campaign_pk, {}).setdefault(ad_pk, []).append({'day': day, 'spent': spent, 'reach': reach,
+                                                                         'listens': max(0, day_listens)})
+    return series
@@ -0,0 +1,93 @@
+import os
+import traceback
+
+from multiprocessing import Process
+from time import sleep
+
+from django.core.management import call_command
+from django.db import connections, close_old_connections
+from django.utils import timezone
+
+from musictargeting.api.models import Job
+from musictargeting.settings import JOB_POLL_INTERVAL
+
+
+def run_job_workers(concurrency):
+    """
+    Запускает пул из concurrency долгоживущих процессов-воркеров, которые разбирают очередь задач.
+    Упавшие воркеры перезапускаются, задачи, прерванные прошлым остановом пула, возвращаются в очередь
+
+    :param concurrency:     int, количество воркеров (одновременно выполняемых задач)
+    """
+    _requeue_interrupted_jobs()
+
+    # Соединения с БД не должны наследоваться дочерними процессами
+    connections.close_all()
+
+    workers = [_start_worker() for _ in range(concurrency)]
+    try:
+        while True:
+            sleep(JOB_POLL_INTERVAL)
+            for n, worker in enumerate(workers):
+                if not worker.is_alive():
+                    print(f'Job worker {worker.pid} died with exit code {worker.exitcode}, restarting')
+                    workers[n] = _start_worker()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+def _start_worker():
+    worker = Process(target=_worker_loop, daemon=True)
+    worker.start()
+    return worker
+
+
+def _worker_loop():
+    """
+    Цикл воркера: берет из очереди задачу с наибольшим приоритетом и выполняет ее, пока очередь пуста - ждет
+    """
+    while True:
+        close_old_connections()
+        job = _claim_next_job()
+        if job:
+            _run_job(job)
+        else:
+            sleep(JOB_POLL_INTERVAL)
+
+
+def _claim_next_job():
+    """
+    Атомарно забирает из очереди следующую задачу: задачу получит только тот воркер, чей update ее изменил
+
+    :return:    Job or None
+    """
+    queued_jobs = Job.objects.filter(status='queued').order_by('-priority', 'create_datetime')
+    for job_pk in list(queued_jobs.values_list('pk', flat=True)[:10]):
+        claimed = Job.objects.filter(pk=job_pk, status='queued')\
+            .update(status='running', worker_pid=os.getpid(), start_datetime=timezone.now())
+        if claimed:
+            return Job.objects.get(pk=job_pk)
+    return None
+
+
+def _run_job(job):
+    try:
+        call_command(job.command, **job.kwargs)
+        job.status = 'done'
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+        print(f'Job {job.pk} "{job.command}" failed: {job.error}')
+    job.finish_datetime = timezone.now()
+    job.save(update_fields=['status', 'error', 'finish_datetime'])
+
+
+def _requeue_interrupted_jobs():
+    """
+    Возвращает в очередь задачи, которые выполнялись при прошлом останове пула.
+    Запуски кампаний продолжаются с последнего завершенного этапа, автоматизации - заново с сохраненными настройками
+    """
+    Job.objects.filter(status='running').update(status='queued', worker_pid=None, start_datetime=None)
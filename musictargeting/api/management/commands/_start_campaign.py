@@ -1,8 +1,10 @@
+from django.db import transaction
 from rest_framework.generics import get_object_or_404
 
 from musictargeting.api import serializers
+from musictargeting.api.cache import MusiciansCache
 from musictargeting.api.vk import vk_framework
-from musictargeting.api.models import User, Ad, CampaignSettings, Campaign
+from musictargeting.api.models import User, Ad, CampaignSettings, Campaign, LaunchState
 from musictargeting.settings import DEV_RUCAPTCHA_KEY, DEV_PROXY
 
 
@@ -13,17 +15,36 @@ def start_campaign(campaign_settings_pk):
 
     user = get_object_or_404(User, id=campaign_settings['owner'])
     if user:
+        # Состояние запуска: если запуск уже прерывался, продолжаем с последнего выполненного этапа
+        launch_state, _ = LaunchState.objects.get_or_create(campaign_settings_id=campaign_settings_pk)
+        if launch_state.status == 'finished':
+            return
+        launch_state.status = 'running'
+        launch_state.save(update_fields=['status', 'update_datetime'])
+
         # Запуск кампании в ВК
-        campaign = _start_campaign_in_vk(campaign_settings, user)
+        try:
+            campaign = _start_campaign_in_vk(campaign_settings, user, launch_state)
+        except Exception as exc:
+            launch_state.status = 'failed'
+            launch_state.error = repr(exc)
+            launch_state.save(update_fields=['status', 'error', 'update_datetime'])
+            raise
+
         campaign.update({'owner': user})
 
         campaign_without_nested_fields = campaign.copy()
         campaign_without_nested_fields.pop('ads', None)
 
-        campaign_instance = Campaign(**campaign_without_nested_fields)
-        campaign_instance.save()
+        with transaction.atomic():
+            campaign_instance = Campaign(**campaign_without_nested_fields)
+            campaign_instance.save()
 
-        _create_ads_in_db(campaign, campaign_instance)
+            _create_ads_in_db(campaign, campaign_instance)
+
+            launch_state.status = 'finished'
+            launch_state.error = None
+            launch_state.save(update_fields=['status', 'error', 'update_datetime'])
 
 
 def _create_ads_in_db(campaign, campaign_instance):
@@ -38,13 +59,34 @@ def _create_ads_in_db(campaign, campaign_instance):
     Ad.objects.bulk_create(ads)
 
 
-def _start_campaign_in_vk(campaign_settings, user):
+def _get_launch_checkpoint(launch_state):
+    # Результаты уже выполненных этапов запуска
+    checkpoint = {}
+    for stage in LaunchState.STAGES:
+        result = getattr(launch_state, stage)
+        if result is not None:
+            checkpoint[stage] = result
+    return checkpoint
+
+
+def _start_campaign_in_vk(campaign_settings, user, launch_state):
+    # Сохранение результата каждого этапа запуска сразу после его выполнения
+    def save_stage_result(stage, result):
+        setattr(launch_state, stage, result)
+        launch_state.save(update_fields=[stage, 'update_datetime'])
+
+    # Сохранение созданных объявлений после каждой пачки, чтобы при продолжении они не создавались повторно
+    def save_created_ads(created_ads):
+        launch_state.created_ads = list(created_ads)
+        launch_state.save(update_fields=['created_ads', 'update_datetime'])
+
     # Инициализация VK
     vk = vk_framework.VkAPI(token=user.vk_token,
                             rucaptcha_key=DEV_RUCAPTCHA_KEY,
                             proxy=DEV_PROXY,
                             ads_cabinet_id=campaign_settings['cabinet_vk_id'],
-                            ads_client_id=campaign_settings['client_vk_id'])
+                            ads_client_id=campaign_settings['client_vk_id'],
+                            musicians_cache=MusiciansCache())
     # Запуск кампании в VK
     campaign = vk.start_new_campaign(release_url=campaign_settings['release_url'],
                                      artist_group_id=campaign_settings['group_id'],
@@ -55,5 +97,9 @@ def _start_campaign_in_vk(campaign_settings, user):
                                      age_disclaimer=campaign_settings['age_disclaimer'],
                                      age_from=campaign_settings['age_from'],
                                      age_to=campaign_settings['age_to'],
-                                     find_related_artists=campaign_settings['find_related_artists'])
+                                     find_related_artists=campaign_settings['find_related_artists'],
+                                     checkpoint=_get_launch_checkpoint(launch_state),
+                                     on_stage_done=save_stage_result,
+                                     created_ads=launch_state.created_ads,
+                                     on_ads_created=save_created_ads)
     return campaign
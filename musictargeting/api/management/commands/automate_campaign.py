@@ -1,18 +1,19 @@
 from django.core.management.base import BaseCommand
 from rest_framework.generics import get_object_or_404
 
-from musictargeting.api.management.commands._automate_campaign import automate_campaign
+from musictargeting.api.control import send_automate_control
+from musictargeting.api.management.commands._automate_campaign import start_automate
 from musictargeting.api.models import Campaign
 
 
 class Command(BaseCommand):
     help = 'get campaign  from db with pk, ' \
-           'start or stop campaign automate'
+           'start or stop campaign automate (automate cycles are run by continue_automate_campaigns daemon)'
 
     def add_arguments(self, parser):
         parser.add_argument('-campaign_primary_key', action='store', dest='pk', type=int)
         parser.add_argument('-automate', action='store', dest='ss', type=int)
-        parser.add_argument('-target_cost', action='store', dest='tc', type=int)
+        parser.add_argument('-target_cost', action='store', dest='tc', type=float)
         parser.add_argument('-start_tomorrow', action='store', dest='st', type=int)
         parser.add_argument('-finish_tomorrow', action='store', dest='ft', type=int)
         parser.add_argument('-is_restart', action='store', dest='rs', type=int)
@@ -20,16 +21,19 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         campaign = get_object_or_404(Campaign, pk=options['pk'])
 
-        # Остановка возможно уже запущенной автоматизации в другом процессе.
-        # Соседний процесс увидит изменение параметра в БД и завершится
+        # Остановка возможно уже запущенной автоматизации.
+        # Планировщик получит сообщение в канал управления и снимет кампанию сразу
         if campaign.automate:
             campaign.automate = 0
-            campaign.save()
+            campaign.save(update_fields=['automate'])
+            if not options['ss']:
+                send_automate_control('stop', campaign.pk)
 
-        # Если передан параметр запуска автоматизации - собственно запуск автоматизации
+        # Если передан параметр запуска автоматизации - включение автоматизации с новыми настройками,
+        # планировщик сразу выполнит цикл кампании с ними
         if options['ss']:
-            automate_campaign(campaign=campaign,
-                              target_cost=options['tc'],
-                              start_tomorrow=options['st'],
-                              finish_tomorrow=options['ft'],
-                              is_restart=options['rs'] if options['rs'] else 0)
+            start_automate(campaign=campaign,
+                           target_cost=options['tc'],
+                           start_tomorrow=options['st'],
+                           finish_tomorrow=options['ft'],
+                           is_restart=options['rs'] if options['rs'] else 0)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from musictargeting.api.management.commands._backtest_automate import backtest_automate
+
+
+class Command(BaseCommand):
+    help = 'offline backtest of campaign automate strategies on recorded campaign stats or synthetic ads, ' \
+           'report spent, listens and cpl per strategy'
+
+    def handle(self, *args, **options):
+        backtest_automate(target_costs=[float(x) for x in options['tc'].split(',')],
+                          speed_coefs=[float(x) for x in options['sc'].split(',')],
+                          campaign_pks=[int(x) for x in options['pks'].split(',')] if options['pks'] else None,
+                          campaigns=options['campaigns'],
+                          ads_per_campaign=options['ads'],
+                          days=options['days'],
+                          elasticity=options['elasticity'],
+                          seed=options['seed'])
+
+    def add_arguments(self, parser):
+        parser.add_argument('-target_costs', action='store', dest='tc', type=str, default='1,1.5,2')
+        parser.add_argument('-speed_coefs', action='store', dest='sc', type=str, default='1')
+        parser.add_argument('-campaign_primary_keys', action='store', dest='pks', type=str)
+        parser.add_argument('-campaigns', action='store', dest='campaigns', type=int, default=100)
+        parser.add_argument('-ads_per_campaign', action='store', dest='ads', type=int, default=30)
+        parser.add_argument('-days', action='store', dest='days', type=int, default=30)
+        parser.add_argument('-elasticity', action='store', dest='elasticity', type=float, default=1.5)
+        parser.add_argument('-seed', action='store', dest='seed', type=int, default=0)
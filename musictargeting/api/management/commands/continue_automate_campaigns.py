@@ -1,20 +1,15 @@
-from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from musictargeting.api.models import Campaign
+from musictargeting.api.management.commands._automate_scheduler import run_automate_scheduler
+from musictargeting.settings import AUTOMATE_WORKERS
 
 
 class Command(BaseCommand):
-    help = 'continue automate campaigns after server restart'
+    help = 'run scheduler daemon executing automate cycles of all automated campaigns ' \
+           '(also continues automates after server restart)'
 
     def handle(self, *args, **options):
-        campaigns = Campaign.objects.all().filter(automate=1)
-        for campaign in list(campaigns):
-            automate_settings = list(campaign.automate_settings.all().order_by('-settings_create_datetime'))[0]
-            call_command('automate_campaign',
-                         campaign_primary_key=campaign.pk,
-                         automate=campaign.automate,
-                         target_cost=automate_settings.target_cost,
-                         start_tomorrow=automate_settings.start_tomorrow,
-                         finish_tomorrow=automate_settings.finish_tomorrow,
-                         is_restart=1)
+        run_automate_scheduler(max_workers=options['workers'] or AUTOMATE_WORKERS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('-workers', action='store', dest='workers', type=int)
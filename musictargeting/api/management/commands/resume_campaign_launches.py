@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from musictargeting.api.jobs import enqueue_job
+from musictargeting.api.models import LaunchState, Job
+
+
+class Command(BaseCommand):
+    help = 'enqueue interrupted campaign launches to resume them from their last completed stage ' \
+           '(after server restart)'
+
+    def handle(self, *args, **options):
+        # Продолжаются только прерванные запуски (остались в running): упавшие с ошибкой (failed) повторно
+        # не ставятся, иначе запуски с постоянной ошибкой (например, нет музыкантов для таргета) повторялись бы
+        # после каждого рестарта
+        launch_states = LaunchState.objects.filter(status='running')
+        queued_launches = set(job.kwargs.get('pk') for job in Job.objects.filter(command='start_campaign',
+                                                                                 status__in=['queued', 'running']))
+        for launch_state in list(launch_states):
+            if launch_state.campaign_settings_id not in queued_launches:
+                enqueue_job('start_campaign', owner=launch_state.campaign_settings.owner,
+                            pk=launch_state.campaign_settings_id)
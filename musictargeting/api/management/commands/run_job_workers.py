@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from musictargeting.api.management.commands._run_job_workers import run_job_workers
+from musictargeting.settings import JOB_WORKERS
+
+
+class Command(BaseCommand):
+    help = 'run long-lived worker pool executing queued jobs ' \
+           '(campaign launches, stats refresh, campaign automates)'
+
+    def handle(self, *args, **options):
+        run_job_workers(options['concurrency'] or JOB_WORKERS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('-concurrency', action='store', dest='concurrency', type=int)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from musictargeting.api.stats import update_campaign_stats_by_pk
+
+
+class Command(BaseCommand):
+    help = 'get campaign from db with pk, ' \
+           'update campaign and its ads stats from vk'
+
+    def handle(self, *args, **options):
+        if options['pk']:
+            update_campaign_stats_by_pk(options['pk'])
+
+    def add_arguments(self, parser):
+        parser.add_argument('-campaign_primary_key', action='store', dest='pk', type=int)
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User as DjangoUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(DjangoUser):
@@ -134,3 +135,117 @@ class AutomateSettings(models.Model):
     settings_create_datetime = models.DateTimeField(auto_now_add=True)
     start_time = models.DateTimeField(blank=True)
     finish_time = models.DateTimeField(blank=True)
+
+
+class Musician(models.Model):
+
+    name_key = models.CharField(max_length=100, unique=True)
+    musician_name = models.CharField(max_length=100, blank=True, null=True)
+    musician_vk_id = models.IntegerField(blank=True, null=True)
+    update_datetime = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        if self.musician_vk_id:
+            return f'Musician "{self.musician_name}"'
+        else:
+            return f'Not found musician "{self.name_key}"'
+
+
+class ArtistCard(models.Model):
+
+    card_id = models.CharField(max_length=100, unique=True)
+    card_url = models.CharField(max_length=255, db_index=True)
+    artist_name = models.CharField(max_length=255)
+    plays = models.JSONField(default=list, blank=True)             # Прослушивания релизов, от последнего
+    last_release_date = models.DateField(blank=True, null=True)
+    crawl_datetime = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Artist card "{self.artist_name}"'
+
+
+class ArtistCardEdge(models.Model):
+
+    KIND_CHOICES = [['related', 'Похожий артист'], ['feat', 'Фит']]
+
+    source = models.ForeignKey(ArtistCard, related_name='edges', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    target_name = models.CharField(max_length=255)
+    target_ref = models.CharField(max_length=255)                  # Ссылка на карточку или айди артиста
+
+    def __str__(self):
+        return f'Artist card edge "{self.kind}" to "{self.target_name}"'
+
+
+class LaunchState(models.Model):
+
+    STAGES = ['release', 'musicians', 'release_group', 'playlists', 'dark_posts', 'campaign', 'ads']
+    STATUS_CHOICES = [['running', 'Запускается'], ['failed', 'Ошибка запуска'], ['finished', 'Запущена']]
+
+    campaign_settings = models.OneToOneField(CampaignSettings, related_name='launch_state', on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='running')
+    error = models.TextField(blank=True, null=True)
+    release = models.JSONField(blank=True, null=True)           # Объект релиза
+    musicians = models.JSONField(blank=True, null=True)         # {musician_name: musician_id}
+    release_group = models.JSONField(blank=True, null=True)     # {'group_id': int, 'audios_str': str}
+    playlists = models.JSONField(blank=True, null=True)         # [playlist_url, ...]
+    dark_posts = models.JSONField(blank=True, null=True)        # {post_url: playlist_url}
+    campaign = models.IntegerField(blank=True, null=True)       # campaign_vk_id
+    ads = models.JSONField(blank=True, null=True)               # [{'ad_name', 'ad_vk_id', 'playlist_url'}, ...]
+    created_ads = models.JSONField(blank=True, null=True)       # Уже созданные объявления незавершенного этапа ads
+    update_datetime = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Launch state "{self.status}" of campaign settings {self.campaign_settings_id}'
+
+
+class Job(models.Model):
+
+    COMMAND_CHOICES = [['start_campaign', 'Запуск кампании'],
+                       ['update_campaign_stats', 'Обновление статы кампании'],
+                       ['automate_campaign', 'Автоматизация кампании']]
+    STATUS_CHOICES = [['queued', 'В очереди'], ['running', 'Выполняется'], ['done', 'Выполнена'],
+                      ['failed', 'Ошибка']]
+
+    owner = models.ForeignKey(User, related_name='jobs', on_delete=models.CASCADE, blank=True, null=True)
+    command = models.CharField(max_length=30, choices=COMMAND_CHOICES)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='queued')
+    error = models.TextField(blank=True, null=True)
+    worker_pid = models.IntegerField(blank=True, null=True)
+    create_datetime = models.DateTimeField(auto_now_add=True)
+    start_datetime = models.DateTimeField(blank=True, null=True)
+    finish_datetime = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Job "{self.command}" ({self.status})'
+
+    class Meta:
+        ordering = ['-pk']
+        indexes = [models.Index(fields=['status', '-priority', 'create_datetime'])]
+
+
+class AdStatSnapshot(models.Model):
+
+    # Снимки только добавляются: дневные значения - за день day по состоянию на timestamp,
+    # total_* - накопленные с запуска объявления по этот день включительно
+    ad = models.ForeignKey(Ad, related_name='stat_snapshots', on_delete=models.CASCADE, db_index=False)
+    timestamp = models.DateTimeField()
+    day = models.DateField()
+    spent = models.FloatField(default=0.0)
+    reach = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+    subscribes = models.PositiveIntegerField(default=0)
+    total_spent = models.FloatField(default=0.0)
+    total_reach = models.PositiveIntegerField(default=0)
+    total_clicks = models.PositiveIntegerField(default=0)
+    total_subscribes = models.PositiveIntegerField(default=0)
+    listens = models.PositiveIntegerField(default=0)                # Счетчик прослушиваний плейлиста
+    followers = models.PositiveIntegerField(default=0)              # Счетчик подписок на плейлист
+
+    def __str__(self):
+        return f'Stat snapshot of ad {self.ad_id} on {self.day}'
+
+    class Meta:
+        indexes = [models.Index(fields=['ad', 'timestamp']), models.Index(fields=['ad', 'day'])]
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from musictargeting.settings import AUTOMATE_INTERVAL, AUTOMATE_MIN_INTERVAL, AUTOMATE_MAX_INTERVAL, \
+    AUTOMATE_LISTENS_PER_CYCLE
+
+
+class AutomatePacer:
+
+    def __init__(self, min_interval=AUTOMATE_MIN_INTERVAL, max_interval=AUTOMATE_MAX_INTERVAL,
+                 listens_per_cycle=AUTOMATE_LISTENS_PER_CYCLE, idle_factor=2., stop_coef=1.2):
+        """
+        Адаптивный интервал между циклами автоматизации кампании по разнице статы между циклами.
+        Интервал подбирается так, чтобы за цикл кампания тратила около listens_per_cycle целевых стоимостей
+        прослушивания: чем быстрее тратится бюджет, тем чаще цикл. Если у запущенных объявлений кост близок
+        к остановочному - следующий цикл через min_interval. Если трат не было - интервал растет в idle_factor раз.
+        Состояние (время, траты и интервал последнего цикла) хранится в памяти по кампаниям
+
+        :param min_interval:        timedelta, минимальный интервал
+        :param max_interval:        timedelta, максимальный интервал
+        :param listens_per_cycle:   float, сколько целевых стоимостей прослушивания тратить за цикл
+        :param idle_factor:         float, во сколько раз увеличивать интервал кампании без трат
+        :param stop_coef:           float, во сколько раз остановочный кост больше целевого (как у StopRule)
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.listens_per_cycle = listens_per_cycle
+        self.idle_factor = idle_factor
+        self.stop_coef = stop_coef
+        self.last_cycles = {}   # {campaign_pk: (datetime, spent, interval)}
+
+    def next_interval(self, campaign, target_cost, ad_stats=None, ad_statuses=None):
+        """
+        Запоминает цикл кампании и возвращает интервал до следующего
+
+        :param campaign:        Campaign, кампания цикла
+        :param target_cost:     float, целевая стоимость прослушивания
+        :param ad_stats:        dict, {ad_id: {'spent': , 'listens': , ...}} - как у VkAPI.get_full_ads_stat
+                                      (None - стату в этом цикле получить не удалось)
+        :param ad_statuses:     dict, {ad_id: {'status': , 'approved': }} - как у VkAds.get_ads
+        :return:                timedelta
+        """
+        now = timezone.now()
+        last_cycle = self.last_cycles.get(campaign.pk)
+
+        # Без статы скорость трат неизвестна: цикл не считается простоем и не запоминается,
+        # следующий - не позже обычного интервала
+        if not ad_stats:
+            interval = min(last_cycle[2], AUTOMATE_INTERVAL) if last_cycle else AUTOMATE_INTERVAL
+            return min(max(interval, self.min_interval), self.max_interval)
+
+        # Траты считаются по стате объявлений цикла: сумма кампании в БД пересчитывается только после цикла
+        spent = sum(x['spent'] for x in ad_stats.values())
+
+        if self._near_stop(target_cost, ad_stats, ad_statuses):
+            interval = self.min_interval
+        elif not last_cycle:
+            interval = AUTOMATE_INTERVAL
+        else:
+            last_time, last_spent, last_interval = last_cycle
+            elapsed = (now - last_time).total_seconds()
+            spent_delta = spent - last_spent
+            if spent_delta <= 0 or elapsed <= 0:
+                interval = last_interval * self.idle_factor
+            else:
+                # Время, за которое при текущей скорости трат будет потрачено listens_per_cycle целевых костов
+                interval = timedelta(seconds=elapsed * self.listens_per_cycle * target_cost / spent_delta)
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        self.last_cycles[campaign.pk] = (now, spent, interval)
+        return interval
+
+    def forget(self, campaign_pk):
+        """
+        Удаляет состояние кампании, автоматизация которой закончилась
+
+        :param campaign_pk:     int, primary key кампании
+        """
+        self.last_cycles.pop(campaign_pk, None)
+
+    def _near_stop(self, target_cost, ad_stats, ad_statuses):
+        """
+        Есть ли запущенные объявления, кост которых выше целевого, но еще ниже остановочного
+        """
+        if not ad_stats or not target_cost:
+            return False
+        for ad_id, stat in ad_stats.items():
+            if ad_statuses and ad_statuses.get(ad_id, {}).get('status') != 1:
+                continue
+            if stat['listens'] and target_cost < stat['spent'] / stat['listens'] < target_cost * self.stop_coef:
+                return True
+        return False
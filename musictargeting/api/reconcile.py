@@ -0,0 +1,58 @@
+class AdStateReconciler:
+
+    def __init__(self, known_states=None):
+        """
+        Сверяет нужное состояние объявлений с последним известным состоянием в ВК (ответ VkAds.get_ads)
+        и отправляет в ВК только реальные изменения - одним буфером ads.updateAds (VkAdsUpdateBuffer).
+        Объявления без известного состояния считаются изменившимися
+
+        :param known_states:    dict, {ad_id: {'status': , 'cpm': , ...}} - как у VkAds.get_ads (cpm в копейках)
+        """
+        self.known_states = {ad_id: dict(state) for ad_id, state in (known_states or {}).items()}
+
+    def diff(self, start_ads=None, stop_ads=None, cpm_update=None):
+        """
+        Возвращает изменения, которых еще нет в ВК, по объявлениям
+
+        :param start_ads:       list, айди объявлений, которые должны быть запущены
+        :param stop_ads:        list, айди объявлений, которые должны быть остановлены
+        :param cpm_update:      dict, {ad_id: cpm} - нужный СРМ в рублях
+        :return:                dict, {ad_id: {'status': 0/1, 'cpm': float}} - параметры для VkAds.update_ads
+        """
+        changes = {}
+        for ad_ids, status in [(start_ads, 1), (stop_ads, 0)]:
+            for ad_id in ad_ids or []:
+                if self.known_states.get(ad_id, {}).get('status') != status:
+                    changes.setdefault(ad_id, {})['status'] = status
+
+        for ad_id, cpm in (cpm_update or {}).items():
+            # В ВК СРМ хранится в копейках, а передается в рублях
+            cpm = round(cpm, 2)
+            if self.known_states.get(ad_id, {}).get('cpm') != round(cpm * 100):
+                changes.setdefault(ad_id, {})['cpm'] = cpm
+
+        return changes
+
+    def push(self, vk, start_ads=None, stop_ads=None, cpm_update=None):
+        """
+        Отправляет в ВК изменения, которых там еще нет, и запоминает их как известное состояние
+
+        :param vk:              VkAPI, объект API кабинета объявлений
+        :param start_ads:       list, айди объявлений, которые должны быть запущены
+        :param stop_ads:        list, айди объявлений, которые должны быть остановлены
+        :param cpm_update:      dict, {ad_id: cpm} - нужный СРМ в рублях
+        :return:                dict, {ad_id: bool} - отправленные изменения, True - применены в ВК
+        """
+        changes = self.diff(start_ads, stop_ads, cpm_update)
+        if not changes:
+            return {}
+
+        results = vk.ads.update_ads(changes)
+        for ad_id, ad_changes in changes.items():
+            if results.get(ad_id):
+                state = self.known_states.setdefault(ad_id, {})
+                if 'status' in ad_changes:
+                    state['status'] = ad_changes['status']
+                if 'cpm' in ad_changes:
+                    state['cpm'] = round(ad_changes['cpm'] * 100)
+        return results
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from rest_framework_jwt.settings import api_settings
 
-from musictargeting.api.models import User, Cabinet, Campaign, Ad, CampaignSettings, Retarget
+from musictargeting.api.models import User, Cabinet, Campaign, Ad, CampaignSettings, Retarget, Job
 
 
 class AdSerializer(serializers.ModelSerializer):
@@ -115,6 +115,13 @@ class AutomateSettingsSerializer(serializers.Serializer):
     finish_tomorrow = serializers.BooleanField(default=False)
 
 
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = 'id', 'command', 'kwargs', 'priority', 'status', 'error', 'create_datetime', 'start_datetime', \
+                 'finish_datetime'
+
+
 class GroupSerializer(serializers.Serializer):
 
     group_name = serializers.CharField()
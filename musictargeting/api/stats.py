@@ -0,0 +1,404 @@
+from datetime import timedelta
+
+import pytz
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from musictargeting.api.models import Ad, AdStatSnapshot, Campaign
+from musictargeting.api.vk import vk_framework
+from musictargeting.settings import DEV_PROXY, DEV_RUCAPTCHA_KEY, VK_ADS_TIME_ZONE
+
+
+# Дневные поля снимка статы, накопленные поля называются так же с префиксом total_
+SNAPSHOT_DAY_FIELDS = ['spent', 'reach', 'clicks', 'subscribes']
+
+
+def ingest_ads_stats(vk, ads):
+    """
+    Дописывает в AdStatSnapshot новые снимки статы объявлений и возвращает их накопленную стату.
+    Из ВК запрашиваются только дни начиная с дня последнего снимка (period: day), а не вся стата с запуска.
+    Снимки, которые ничего не меняют, не записываются. Дни снимков - дни кабинета (VK_ADS_TIME_ZONE), как в ВК
+
+    :param vk:      VkAPI, объект API кабинета объявлений
+    :param ads:     list, [Ad, ...] - объявления одного кабинета
+    :return:        dict, {ad_id: {...}} - как у VkAPI.get_full_ads_stat (без объявлений, по которым статы нет)
+    """
+    if not ads:
+        return {}
+
+    last_snapshots = _get_last_snapshots(ads)
+
+    # Первый день, с которого нужна стата: день последнего снимка или день создания кампании
+    days_from = [x.day for x in last_snapshots.values()]
+    ads_without_snapshots = [ad for ad in ads if ad.pk not in last_snapshots]
+    if ads_without_snapshots:
+        campaign_pks = set(ad.campaign_id for ad in ads_without_snapshots)
+        days_from.extend([_get_cabinet_date(x) for x in Campaign.objects.filter(pk__in=campaign_pks)
+                         .values_list('create_datetime', flat=True)])
+    date_from = min(days_from)
+    # Плюс день на случай, если часовой пояс кабинета отличается от VK_ADS_TIME_ZONE
+    date_to = _get_cabinet_date() + timedelta(days=1)
+
+    day_stats = vk.ads.get_ads_day_stat(ad_ids=[ad.ad_vk_id for ad in ads], date_from=date_from, date_to=date_to)
+    if day_stats is None:
+        return {}
+    playlist_stats = vk.audio.get_playlists_stat(playlist_urls=list(set(ad.playlist_url for ad in ads)))
+
+    now = timezone.now()
+    new_snapshots, ads_stat = [], {}
+    for ad in ads:
+        if ad.playlist_url not in playlist_stats:
+            continue
+        snapshots = _get_ad_new_snapshots(ad, last_snapshots.get(ad.pk), day_stats.get(ad.ad_vk_id, {}),
+                                          playlist_stats[ad.playlist_url], now)
+        new_snapshots.extend(snapshots)
+
+        last_snapshot = snapshots[-1] if snapshots else last_snapshots[ad.pk]
+        ads_stat[ad.ad_vk_id] = _get_snapshot_totals(last_snapshot)
+
+    AdStatSnapshot.objects.bulk_create(new_snapshots, batch_size=500)
+
+    return ads_stat
+
+
+def _get_cabinet_date(value=None):
+    """
+    Возвращает день в часовом поясе рекламного кабинета (TIME_ZONE проекта - UTC, а дни статы в ВК - дни кабинета)
+
+    :param value:   datetime, время с часовым поясом (None - сейчас)
+    :return:        datetime.date
+    """
+    return timezone.localdate(value, timezone=pytz.timezone(VK_ADS_TIME_ZONE))
+
+
+def _get_last_snapshots(ads):
+    """
+    Возвращает последние снимки объявлений (по индексу (ad, timestamp), один запрос)
+
+    :param ads:     list, [Ad, ...]
+    :return:        dict, {ad_pk: AdStatSnapshot}
+    """
+    last_snapshot = AdStatSnapshot.objects.filter(ad=OuterRef('pk')).order_by('-timestamp', '-day').values('pk')[:1]
+    snapshot_pks = Ad.objects.filter(pk__in=[ad.pk for ad in ads])\
+        .annotate(last_snapshot_pk=Subquery(last_snapshot)).values_list('last_snapshot_pk', flat=True)
+    snapshots = AdStatSnapshot.objects.filter(pk__in=[x for x in snapshot_pks if x])
+    return {x.ad_id: x for x in snapshots}
+
+
+def _get_ad_new_snapshots(ad, last_snapshot, ad_day_stats, playlist_stat, timestamp):
+    """
+    Возвращает новые снимки объявления: по одному на каждый день, стата которого изменилась с последнего снимка
+
+    :param ad:              Ad, объект объявления
+    :param last_snapshot:   AdStatSnapshot or None, последний снимок объявления
+    :param ad_day_stats:    dict, {day: {'spent': , 'reach': , 'clicks': , 'subscribes': }} - стата из ВК по дням
+    :param playlist_stat:   dict, {'title': str, 'listens': int, 'followers': int} - стата плейлиста объявления
+    :param timestamp:       datetime, время снимков
+    :return:                list, [AdStatSnapshot, ...] в порядке дней
+    """
+    # Накопленная стата до дня последнего снимка, день последнего снимка будет пересчитан из свежей статы
+    totals = dict.fromkeys(SNAPSHOT_DAY_FIELDS, 0)
+    if last_snapshot:
+        ad_day_stats = {day: stat for day, stat in ad_day_stats.items() if day >= last_snapshot.day}
+        ad_day_stats.setdefault(last_snapshot.day, {x: getattr(last_snapshot, x) for x in SNAPSHOT_DAY_FIELDS})
+        totals = {x: getattr(last_snapshot, f'total_{x}') - getattr(last_snapshot, x) for x in SNAPSHOT_DAY_FIELDS}
+
+    snapshots = []
+    for day in sorted(ad_day_stats.keys()):
+        for field in SNAPSHOT_DAY_FIELDS:
+            totals[field] += ad_day_stats[day][field]
+
+        if last_snapshot and day == last_snapshot.day and \
+                all(ad_day_stats[day][x] == getattr(last_snapshot, x) for x in SNAPSHOT_DAY_FIELDS):
+            continue
+
+        snapshots.append(AdStatSnapshot(ad=ad, timestamp=timestamp, day=day,
+                                        listens=playlist_stat['listens'], followers=playlist_stat['followers'],
+                                        **ad_day_stats[day],
+                                        **{f'total_{x}': totals[x] for x in SNAPSHOT_DAY_FIELDS}))
+
+    # Стата объявления не менялась, но плейлист послушали - снимок с прежней статой последнего дня
+    if not snapshots:
+        if not last_snapshot:
+            snapshots.append(AdStatSnapshot(ad=ad, timestamp=timestamp, day=_get_cabinet_date(timestamp),
+                                            listens=playlist_stat['listens'], followers=playlist_stat['followers']))
+        elif last_snapshot.listens != playlist_stat['listens'] or last_snapshot.followers != playlist_stat['followers']:
+            snapshots.append(AdStatSnapshot(ad=ad, timestamp=timestamp, day=last_snapshot.day,
+                                            listens=playlist_stat['listens'], followers=playlist_stat['followers'],
+                                            **{x: getattr(last_snapshot, x) for x in SNAPSHOT_DAY_FIELDS},
+                                            **{f'total_{x}': getattr(last_snapshot, f'total_{x}')
+                                               for x in SNAPSHOT_DAY_FIELDS}))
+
+    return snapshots
+
+
+def _get_snapshot_totals(snapshot):
+    """
+    Возвращает накопленную стату объявления из его последнего снимка
+
+    :param snapshot:    AdStatSnapshot
+    :return:            dict, как у VkAPI.get_full_ads_stat для одного объявления
+    """
+    spent, reach = round(snapshot.total_spent, 2), snapshot.total_reach
+    return {'spent': spent,
+            'reach': reach,
+            'cpm': round((spent / (reach / 1000)), 2) if reach else 0,
+            'clicks': snapshot.total_clicks,
+            'subscribes': snapshot.total_subscribes,
+            'listens': snapshot.listens,
+            'followers': snapshot.followers}
+
+
+def group_campaigns_by_cabinet(campaigns):
+    """
+    Группирует кампании по рекламному кабинету и клиенту (и владельцу, чей токен используется для запросов)
+
+    :param campaigns:   list, [Campaign, ...]
+    :return:            dict, {(owner_id, cabinet_vk_id, client_vk_id): [Campaign, ...]}
+    """
+    cabinets = {}
+    for campaign in campaigns:
+        cabinets.setdefault((campaign.owner_id, campaign.cabinet_vk_id, campaign.client_vk_id), []).append(campaign)
+    return cabinets
+
+
+class CabinetStatsCollector:
+
+    def __init__(self, vk, campaigns):
+        """
+        Собирает стату и статусы объявлений сразу всех кампаний одного кабинета (и клиента) и раздает
+        каждой кампании ее часть. Запросов к ВК за проход столько же, сколько для одной кампании:
+        один ads.getAds, ads.getStatistics по дням с последнего снимка пачками по ADS_STAT_MAX_IDS объявлений
+        и audio.getPlaylistById через execute пачками по EXECUTE_MAX_CALLS плейлистов.
+        Стата попутно записывается в снимки AdStatSnapshot
+
+        :param vk:          VkAPI, объект API с токеном владельца и айди кабинета (и клиента) кампаний
+        :param campaigns:   list, [Campaign, ...] - кампании одного кабинета
+        """
+        self.vk = vk
+        self.campaigns = campaigns
+
+    def collect(self):
+        """
+        Возвращает объявления, стату и статусы объявлений для каждой кампании.
+        Если стату или статусы кампании получить не удалось - вместо них None
+
+        :return:    dict, {campaign_pk: {'ads': [Ad, ...],
+                                         'ad_stats': {ad_id: {...}} or None,        - как у VkAPI.get_full_ads_stat
+                                         'ad_statuses': {ad_id: {...}} or None}}    - как у VkAds.get_ads
+        """
+        campaign_vk_ids = [x.campaign_vk_id for x in self.campaigns]
+        ads = list(Ad.objects.filter(campaign_vk_id__in=campaign_vk_ids))
+
+        ad_stats = ingest_ads_stats(self.vk, ads)
+        ad_statuses = self.vk.ads.get_ads(campaign_ids=campaign_vk_ids) or {}
+
+        campaigns_stats = {}
+        for campaign in self.campaigns:
+            campaign_ads = [ad for ad in ads if ad.campaign_vk_id == campaign.campaign_vk_id]
+            campaign_ad_stats = {ad.ad_vk_id: ad_stats[ad.ad_vk_id] for ad in campaign_ads
+                                 if ad.ad_vk_id in ad_stats}
+            campaign_ad_statuses = {ad_id: statuses for ad_id, statuses in ad_statuses.items()
+                                    if statuses['campaign_id'] == campaign.campaign_vk_id}
+
+            # Неполная стата кампании не отдается, чтобы по ней не принимались решения
+            campaigns_stats[campaign.pk] = {
+                'ads': campaign_ads,
+                'ad_stats': campaign_ad_stats if len(campaign_ad_stats) == len(campaign_ads) else None,
+                'ad_statuses': campaign_ad_statuses or None
+            }
+
+        return campaigns_stats
+
+
+class StatsAggregator:
+
+    # Счетчики объявлений, из которых складывается стата кампании
+    COUNTERS = ['spent', 'reach', 'clicks', 'subscribes', 'listens']
+    AD_FIELDS = COUNTERS + ['cpm', 'cpl', 'cpc', 'cps', 'status', 'approved']
+    COST_FIELDS = ['cpm', 'cpl', 'cpc', 'cps']
+
+    def __init__(self):
+        """
+        Общий движок обновления статы: обновляет объекты объявлений свежей статой и копит по кампаниям разницу
+        между новыми и старыми счетчиками изменившихся объявлений. Все изменения пишутся в БД одним save:
+        bulk_update на объявления, затем к счетчикам каждой кампании прибавляется только ее разница (F-выражения,
+        так параллельные записи не затираются), стоимости кампании пересчитываются по полученным суммам
+        """
+        self.ads = {}           # {ad_pk: Ad} - изменившиеся объявления
+        self.campaigns = {}     # {campaign_pk: Campaign} - изменившиеся кампании
+        self.deltas = {}        # {campaign_pk: {field: delta}} - разница счетчиков изменившихся объявлений
+        self.statuses = {}      # {campaign_pk: status} - изменившиеся статусы кампаний
+
+    def update_ads(self, campaign, ads, ads_stat=None, ad_statuses=None):
+        """
+        Обновляет объявления кампании и запоминает разницу их счетчиков для суммарной статы кампании
+
+        :param campaign:        Campaign, кампания объявлений
+        :param ads:             list, [Ad, ...] - объявления кампании
+        :param ads_stat:        dict, {ad_id: {...}} - как у VkAPI.get_full_ads_stat
+        :param ad_statuses:     dict, {ad_id: {'status': , 'approved': , ...}} - как у VkAds.get_ads
+        """
+        for ad in ads:
+            changed = False
+
+            # Стата обновляется, если по объявлению был охват (если он не ноль)
+            ad_stat = ads_stat.get(ad.ad_vk_id) if ads_stat else None
+            if ad_stat and ad_stat['reach']:
+                for field in self.COUNTERS:
+                    if ad_stat[field] != getattr(ad, field):
+                        self._add_delta(campaign, field, ad_stat[field] - getattr(ad, field))
+                        setattr(ad, field, ad_stat[field])
+                        changed = True
+                if ad_stat['cpm'] != ad.cpm:
+                    ad.cpm = ad_stat['cpm']
+                    changed = True
+                if changed:
+                    ad.cpl, ad.cpc, ad.cps = _get_costs(ad)
+
+            if ad_statuses and ad.ad_vk_id in ad_statuses:
+                for field in ['status', 'approved']:
+                    if ad_statuses[ad.ad_vk_id][field] != getattr(ad, field):
+                        setattr(ad, field, ad_statuses[ad.ad_vk_id][field])
+                        changed = True
+
+            if changed:
+                self.ads[ad.pk] = ad
+
+    def set_ads_status(self, ads, ad_ids, status):
+        """
+        Ставит статус объявлениям (например, после их запуска или остановки в ВК)
+
+        :param ads:         list, [Ad, ...]
+        :param ad_ids:      list, айди объявлений в ВК, которым нужно поставить статус
+        :param status:      int, 1 - запущено, 0 - остановлено
+        """
+        ad_ids = set(ad_ids)
+        for ad in ads:
+            if ad.ad_vk_id in ad_ids and ad.status != status:
+                ad.status = status
+                self.ads[ad.pk] = ad
+
+    def set_campaign_status(self, campaign, status):
+        """
+        Ставит статус кампании
+
+        :param campaign:    Campaign
+        :param status:      int, статус кампании в ВК
+        """
+        if campaign.status != status:
+            campaign.status = status
+            self.campaigns[campaign.pk] = campaign
+            self.statuses[campaign.pk] = status
+
+    def save(self):
+        """
+        Записывает все изменившиеся объявления в БД, прибавляет к кампаниям разницу счетчиков и очищает движок
+        """
+        with transaction.atomic():
+            if self.ads:
+                Ad.objects.bulk_update(list(self.ads.values()), self.AD_FIELDS, batch_size=200)
+            if self.campaigns:
+                self._update_campaigns()
+        self.ads, self.campaigns, self.deltas, self.statuses = {}, {}, {}, {}
+
+    def _add_delta(self, campaign, field, delta):
+        """
+        Добавляет к разнице счетчика кампании разницу счетчика ее объявления
+        """
+        campaign_deltas = self.deltas.setdefault(campaign.pk, dict.fromkeys(self.COUNTERS, 0))
+        campaign_deltas[field] += delta
+        self.campaigns[campaign.pk] = campaign
+
+    def _update_campaigns(self):
+        """
+        Прибавляет к счетчикам кампаний разницу (один update на кампанию) и пересчитывает их стоимости
+        """
+        recount = []
+        for campaign_pk, campaign in self.campaigns.items():
+            deltas = {field: delta for field, delta in self.deltas.get(campaign_pk, {}).items() if delta}
+            values = {field: F(field) + delta for field, delta in deltas.items()}
+            if campaign_pk in self.statuses:
+                values['status'] = self.statuses[campaign_pk]
+            if not values:
+                continue
+            # Только поля статы, чтобы не затереть флаг автоматизации, измененный параллельно
+            Campaign.objects.filter(pk=campaign_pk).update(**values)
+            if deltas:
+                recount.append(campaign)
+
+        if not recount:
+            return
+
+        # Строки кампаний заблокированы update до конца транзакции: суммы уже не изменятся параллельно
+        totals = Campaign.objects.filter(pk__in=[x.pk for x in recount]).values('pk', *self.COUNTERS)
+        totals = {x['pk']: x for x in totals}
+        for campaign in recount:
+            for field in self.COUNTERS:
+                setattr(campaign, field, totals[campaign.pk][field])
+            campaign.cpm = round((campaign.spent / (campaign.reach / 1000)), 2) if campaign.reach else 0
+            campaign.cpl, campaign.cpc, campaign.cps = _get_costs(campaign)
+        Campaign.objects.bulk_update(recount, self.COST_FIELDS)
+
+
+def _get_costs(obj):
+    """
+    Возвращает стоимости прослушивания, перехода и подписки объявления или кампании
+
+    :param obj:     Ad or Campaign
+    :return:        tuple, (cpl, cpc, cps)
+    """
+    cpl = round((obj.spent / obj.listens), 2) if obj.listens else 0
+    cpc = round((obj.spent / obj.clicks), 2) if obj.clicks else 0
+    cps = round((obj.spent / obj.subscribes), 2) if obj.subscribes else 0
+    return cpl, cpc, cps
+
+
+def update_campaign_stats(campaign):
+    """
+    Обновляет стату кампании и ее объявлений из ВК и сохраняет в БД
+
+    :param campaign:    Campaign, объект кампании
+    :return:            Campaign, обновленный объект кампании
+    """
+    # Юзер кампании, чтобы взять его вк токен
+    user = campaign.owner
+
+    # Получение объявлений кампании и рефакторинг их для ВК фреймворка
+    ads = list(Ad.objects.filter(campaign_vk_id=campaign.campaign_vk_id))
+    if not ads:
+        return campaign
+
+    # Получение статы объявлений (новые дни статы дописываются в снимки)
+    vk = vk_framework.VkAPI(token=user.vk_token, rucaptcha_key=DEV_RUCAPTCHA_KEY, proxy=DEV_PROXY,
+                            ads_cabinet_id=campaign.cabinet_vk_id, ads_client_id=campaign.client_vk_id)
+    ads_stat = ingest_ads_stats(vk, ads)
+    ads_statuses = vk.ads.get_ads(campaign_id=campaign.campaign_vk_id)
+
+    # Обновление объектов объявлений и суммарной статы кампании
+    aggregator = StatsAggregator()
+    aggregator.update_ads(campaign, ads, ads_stat, ads_statuses)
+
+    # Обновление статуса кампании
+    campaign_status = vk.ads.get_campaigns()
+    if campaign_status:
+        aggregator.set_campaign_status(campaign, campaign_status[campaign.campaign_vk_id]['status'])
+
+    # Сохранение изменившихся объектов в БД
+    aggregator.save()
+
+    return campaign
+
+
+def update_campaign_stats_by_pk(campaign_pk):
+    """
+    Обновляет стату кампании по ее primary key (для задач из очереди)
+
+    :param campaign_pk:     int, primary key кампании в БД
+    """
+    campaign = Campaign.objects.filter(pk=campaign_pk).first()
+    if not campaign:
+        print(f'Campaign {campaign_pk} does not exist')
+        return
+    update_campaign_stats(campaign)
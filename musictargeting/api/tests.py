@@ -1,3 +1,236 @@
-from django.test import TestCase
+import json
+import random
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from musictargeting.api.backtest import MIN_CPM, RecordedAdModel, Strategy, SyntheticAdModel, run_backtest
+from musictargeting.api.cache import MusiciansCache
+from musictargeting.api.decisions import AdsFrame, DecisionEngine
+from musictargeting.api.management.commands._automate_campaign import _get_ads_dicisions
+from musictargeting.api.management.commands._start_campaign import start_campaign
+from musictargeting.api.models import Ad, Campaign, CampaignSettings, LaunchState, Musician, User
+from musictargeting.api.vk import vk_framework
+from musictargeting.settings import MUSICIANS_CACHE_TTL, MUSICIANS_CACHE_NEGATIVE_TTL
+
+
+def _legacy_ads_decisions(ads_stats, ad_statuses, target_cost, speed_coef=None):
+    """
+    Решения по объявлениям прежним циклом по каждому объявлению (до DecisionEngine) - эталон для сравнения
+    """
+    stop_cost = target_cost * 1.2
+    if speed_coef:
+        target_cost *= speed_coef
+        stop_cost *= speed_coef
+
+    stop_ads, cpm_update = [], {}
+    for ad_id, ad_stats in ads_stats.items():
+        current_cost = ad_stats['spent'] / ad_stats['listens'] if ad_stats['listens'] else None
+        if current_cost and current_cost <= target_cost and ad_stats['cpm'] <= 115:
+            cpm_update[ad_id] = ad_stats['cpm'] + 5.1
+        elif current_cost and stop_cost > current_cost > target_cost and ad_stats['cpm'] <= 35.1:
+            cpm_update[ad_id] = ad_stats['cpm'] - 5.1
+        elif current_cost and current_cost > stop_cost:
+            stop_ads.append(ad_id)
+
+    start_ads = [x for x in ads_stats.keys() if x not in stop_ads]
+    if ad_statuses:
+        start_ads = [x for x in start_ads if ad_statuses[x]['approved'] == 2 and ad_statuses[x]['status'] == 0]
+
+    return start_ads, stop_ads, cpm_update
+
+
+class DecisionEngineParityTest(SimpleTestCase):
+
+    def assertSameDecisions(self, ads_stats, ad_statuses, target_cost, speed_coef=None):
+        expected = _legacy_ads_decisions(ads_stats, ad_statuses, target_cost, speed_coef)
+        self.assertEqual(_get_ads_dicisions(ads_stats, ad_statuses, target_cost, speed_coef), expected)
+
+    def test_random_campaigns(self):
+        rnd = random.Random(42)
+        for _ in range(300):
+            target_cost = rnd.choice([1., 1.5, 2., 3.3])
+            speed_coef = rnd.choice([None, 0.8, 1.5])
+            ads_stats, ad_statuses = {}, {}
+            for ad_id in rnd.sample(range(1, 10 ** 6), rnd.randint(0, 30)):
+                listens = rnd.choice([0, 0, rnd.randint(1, 500)])
+                ads_stats[ad_id] = {'spent': rnd.choice([0., round(rnd.uniform(0, 1000), 2)]),
+                                    'listens': listens,
+                                    'cpm': rnd.choice([30., 35.1, 35.2, 115., 115.1, round(rnd.uniform(30, 130), 1)])}
+                ad_statuses[ad_id] = {'status': rnd.randint(0, 1), 'approved': rnd.randint(0, 3)}
+            self.assertSameDecisions(ads_stats, rnd.choice([ad_statuses, None, {}]), target_cost, speed_coef)
+
+    def test_cpm_bounds(self):
+        # Кост ниже целевого: СРМ поднимается до 115 включительно, кост между целевым и остановочным:
+        # СРМ понижается до 35.1 включительно
+        ads_stats = {1: {'spent': 10., 'listens': 10, 'cpm': 115.},
+                     2: {'spent': 10., 'listens': 10, 'cpm': 115.1},
+                     3: {'spent': 11., 'listens': 10, 'cpm': 35.1},
+                     4: {'spent': 11., 'listens': 10, 'cpm': 35.2}}
+        start_ads, stop_ads, cpm_update = _get_ads_dicisions(ads_stats, None, target_cost=1.)
+        self.assertEqual(cpm_update, {1: 115. + 5.1, 3: 35.1 - 5.1})
+        self.assertEqual(stop_ads, [])
+        self.assertSameDecisions(ads_stats, None, target_cost=1.)
+
+    def test_speed_coef(self):
+        # Кост 1.3: без ускорения выше остановочного (1.2), с ускорением 1.5 - ниже целевого (1.5)
+        ads_stats = {1: {'spent': 13., 'listens': 10, 'cpm': 50.}}
+        self.assertEqual(_get_ads_dicisions(ads_stats, None, target_cost=1.), ([], [1], {}))
+        self.assertEqual(_get_ads_dicisions(ads_stats, None, target_cost=1., speed_coef=1.5), ([1], [], {1: 55.1}))
+        for speed_coef in [None, 0.5, 1.1, 1.5]:
+            self.assertSameDecisions(ads_stats, None, 1., speed_coef)
+
+    def test_start_only_approved_and_stopped(self):
+        ads_stats = {x: {'spent': 0., 'listens': 0, 'cpm': 30.} for x in range(1, 5)}
+        ad_statuses = {1: {'status': 0, 'approved': 2},
+                       2: {'status': 1, 'approved': 2},
+                       3: {'status': 0, 'approved': 1},
+                       4: {'status': 0, 'approved': 3}}
+        self.assertEqual(_get_ads_dicisions(ads_stats, ad_statuses, target_cost=1.), ([1], [], {}))
+        self.assertSameDecisions(ads_stats, ad_statuses, target_cost=1.)
+
+    def test_no_listens_or_spent(self):
+        ads_stats = {1: {'spent': 100., 'listens': 0, 'cpm': 30.},
+                     2: {'spent': 0., 'listens': 10, 'cpm': 30.}}
+        self.assertEqual(_get_ads_dicisions(ads_stats, None, target_cost=1.), ([1, 2], [], {}))
+        self.assertSameDecisions(ads_stats, None, target_cost=1.)
+
+    def test_several_campaigns_in_one_pass(self):
+        ads_stats_1 = {1: {'spent': 5., 'listens': 10, 'cpm': 30.}, 2: {'spent': 50., 'listens': 10, 'cpm': 30.}}
+        ads_stats_2 = {3: {'spent': 50., 'listens': 10, 'cpm': 30.}}
+        frame = AdsFrame.concat([AdsFrame.from_stats('a', ads_stats_1, None, 1.),
+                                 AdsFrame.from_stats('b', ads_stats_2, None, 10.)])
+        decisions = DecisionEngine().decide(frame)
+        self.assertEqual(decisions['a'], _legacy_ads_decisions(ads_stats_1, None, 1.))
+        self.assertEqual(decisions['b'], _legacy_ads_decisions(ads_stats_2, None, 10.))
+
+
+class BacktestTest(SimpleTestCase):
+
+    def test_synthetic_model(self):
+        model = SyntheticAdModel(campaigns=3, ads_per_campaign=4, days=2, seed=1)
+        strategies = [Strategy('cheap', 1.), Strategy('fast', 1., speed_coef=1.5)]
+        report = run_backtest(model, strategies, cycles_per_day=6, seed=1)
+
+        self.assertEqual(set(report.keys()), {'cheap', 'fast'})
+        for result in report.values():
+            self.assertEqual(result['campaign_days'], 6)
+            self.assertGreater(result['reach'], 0)
+            self.assertGreater(result['spent'], 0)
+        # Один сид - одинаковый результат
+        self.assertEqual(run_backtest(model, strategies[:1], cycles_per_day=6, seed=1)['cheap']['spent'],
+                         report['cheap']['spent'])
+
+    def test_recorded_model(self):
+        series = {1: {10: [{'day': date(2020, 1, 1), 'spent': 0., 'reach': 0, 'listens': 0},
+                           {'day': date(2020, 1, 2), 'spent': 50., 'reach': 1000, 'listens': 30}],
+                      11: [{'day': date(2020, 1, 3), 'spent': 100., 'reach': 2000, 'listens': 10}]}}
+        model = RecordedAdModel(series)
+
+        self.assertEqual(model.days, 3)
+        self.assertEqual(model.start_cpm.tolist(), [50., 50.])
+        self.assertEqual(model.listen_rate(1).tolist(), [0.03, 0.])
+        report = run_backtest(model, [Strategy('default', 2.)], cycles_per_day=4)
+        self.assertEqual(report['default']['campaign_days'], 3)
+        self.assertGreater(report['default']['reach'], 0)
+
+    def test_recorded_model_without_stats(self):
+        for series in [{}, {1: {10: []}}]:
+            model = RecordedAdModel(series)
+            self.assertEqual(model.days, 0)
+            self.assertEqual(model.start_cpm.tolist(), [MIN_CPM] * len(model.ad_ids))
+            report = run_backtest(model, [Strategy('default', 1.)])
+            self.assertEqual(report['default']['spent'], 0)
+            self.assertEqual(report['default']['listens'], 0)
+
+
+class ResumeCampaignLaunchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='user', vk_token='token')
+        self.campaign_settings = CampaignSettings.objects.create(owner=self.user, cabinet_vk_id=1, client_vk_id=0,
+                                                                 release_url='https://vk.com/music/album/-1_1',
+                                                                 post_text='text', group_id=1, budget=1000)
+        # Запуск прервался на этапе ads: все предыдущие этапы выполнены, первое объявление уже создано
+        LaunchState.objects.create(
+            campaign_settings=self.campaign_settings, status='running',
+            release={'artist_name': 'Artist', 'title': 'Release', 'cover_url': 'https://cover', 'is_explicit': False},
+            musicians={'A': 1, 'B': 2, 'C': 3},
+            release_group={'group_id': 10, 'audios_str': '-10_1'},
+            playlists=['https://playlist_1', 'https://playlist_2', 'https://playlist_3'],
+            dark_posts={'https://vk.com/wall-1_1': 'https://playlist_1',
+                        'https://vk.com/wall-1_2': 'https://playlist_2',
+                        'https://vk.com/wall-1_3': 'https://playlist_3'},
+            campaign=100,
+            created_ads=[{'ad_name': 'A (слушатели)', 'ad_vk_id': 501, 'playlist_url': 'https://playlist_1'}])
+        self.api_calls = []
+
+    def _api_response(self, method, params=None, full_response=False):
+        self.api_calls.append(method)
+        if method != 'ads.createAds':
+            raise AssertionError(f'unexpected {method} call on resume')
+        data = json.loads(params['data'])
+        return [{'id': 600 + n} for n in range(len(data))]
+
+    def test_resume_from_checkpoint(self):
+        with mock.patch.object(vk_framework.VkAds, '_api_response', side_effect=self._api_response), \
+                mock.patch.object(vk_framework.VkAudio, '_api_response', side_effect=self._api_response):
+            start_campaign(self.campaign_settings.pk)
+
+        # Выполнен только этап ads и только для таргетов, объявлений для которых еще нет
+        self.assertEqual(self.api_calls, ['ads.createAds'])
+        ads = {x.ad_name: (x.ad_vk_id, x.playlist_url) for x in Ad.objects.all()}
+        self.assertEqual(ads, {'A (слушатели)': (501, 'https://playlist_1'),
+                               'B (слушатели)': (600, 'https://playlist_2'),
+                               'C (слушатели)': (601, 'https://playlist_3')})
+
+        campaign = Campaign.objects.get()
+        self.assertEqual(campaign.campaign_vk_id, 100)
+        self.assertEqual(campaign.playlists_group_id, 10)
+        launch_state = LaunchState.objects.get()
+        self.assertEqual(launch_state.status, 'finished')
+        self.assertEqual(len(launch_state.created_ads), 3)
+
+    def test_finished_launch_is_not_restarted(self):
+        LaunchState.objects.filter(campaign_settings=self.campaign_settings).update(status='finished')
+        with mock.patch.object(vk_framework.VkAds, '_api_response', side_effect=self._api_response):
+            start_campaign(self.campaign_settings.pk)
+        self.assertEqual(self.api_calls, [])
+        self.assertFalse(Campaign.objects.exists())
+
+
+class MusiciansCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = MusiciansCache()
+        self.cache.set_many({'Artist': ('Artist', 1), 'Unknown': None})
+
+    def _age(self, name_key, age):
+        Musician.objects.filter(name_key=name_key).update(update_datetime=timezone.now() - age)
+
+    def test_fresh_entries(self):
+        cached, misses = self.cache.get_many(['  ARTIST ', 'Unknown', 'New'])
+        self.assertEqual(cached, {'  ARTIST ': ('Artist', 1), 'Unknown': None})
+        self.assertEqual(misses, ['New'])
+
+    def test_ttl_expiry(self):
+        self._age('artist', MUSICIANS_CACHE_TTL - timedelta(minutes=1))
+        self.assertEqual(self.cache.get_many(['Artist']), ({'Artist': ('Artist', 1)}, []))
+
+        self._age('artist', MUSICIANS_CACHE_TTL + timedelta(minutes=1))
+        self.assertEqual(self.cache.get_many(['Artist']), ({}, ['Artist']))
+
+    def test_negative_ttl_expiry(self):
+        # Ненайденные имена устаревают раньше найденных
+        self._age('unknown', MUSICIANS_CACHE_NEGATIVE_TTL + timedelta(minutes=1))
+        self._age('artist', MUSICIANS_CACHE_NEGATIVE_TTL + timedelta(minutes=1))
+        self.assertEqual(self.cache.get_many(['Unknown', 'Artist']), ({'Artist': ('Artist', 1)}, ['Unknown']))
+
+    def test_set_many_refreshes_existing_entries(self):
+        self._age('unknown', MUSICIANS_CACHE_NEGATIVE_TTL + timedelta(minutes=1))
+        self.cache.set_many({'unknown': ('Unknown', 2)})
+
+        self.assertEqual(Musician.objects.count(), 2)
+        self.assertEqual(self.cache.get_many(['Unknown']), ({'Unknown': ('Unknown', 2)}, []))
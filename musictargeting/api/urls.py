@@ -26,6 +26,10 @@ urlpatterns = [
     path('campaigns.updateStats', api_views.CampaignUpdateStatsView.as_view()),
     path('campaigns.startAutomate', api_views.CampaignStartAutomateView.as_view()),
     path('campaigns.stopAutomate', api_views.CampaignStopAutomateView.as_view()),
+    path('campaigns.pauseAutomate', api_views.CampaignPauseAutomateView.as_view()),
+    path('campaigns.resumeAutomate', api_views.CampaignResumeAutomateView.as_view()),
 
     path('ads.get', api_views.AdListView.as_view()),
+
+    path('jobs.get', api_views.JobListView.as_view()),
 ]
\ No newline at end of file
@@ -5,10 +5,11 @@ from rest_framework.decorators import api_view
 from rest_framework.generics import CreateAPIView
 from rest_framework.response import Response
 from django.http import JsonResponse
-from django.core.management import call_command
-from multiprocessing import Process
+from django.utils import timezone
 
-from musictargeting.api.models import User, Cabinet, Campaign, Ad, Retarget
+from musictargeting.api.control import send_automate_control
+from musictargeting.api.jobs import enqueue_job
+from musictargeting.api.models import User, Cabinet, Campaign, Ad, Retarget, Job
 from musictargeting.api import serializers
 from musictargeting.api.serializers import UserSerializer
 from musictargeting.api.vk import vk_framework
@@ -138,9 +139,8 @@ class CampaignCreateView(views.APIView):
         campaign_settings_serializer = serializers.CampaignSettingsSerializer(data=params)
         if campaign_settings_serializer.is_valid():
             campaign = campaign_settings_serializer.save()
-            process = Process(target=call_command, args=('start_campaign',), kwargs={'pk': campaign.pk})
-            process.start()
-            return Response({'info': 'campaign is starting, it takes some time'})
+            job = enqueue_job('start_campaign', owner_id=request.user.pk, pk=campaign.pk)
+            return Response({'info': 'campaign is starting, it takes some time', 'job_id': job.pk})
         else:
             return Response(campaign_settings_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -182,106 +182,10 @@ class CampaignUpdateStatsView(views.APIView):
             return Response({'detail': 'campaign_vk_id must be int'}, status=status.HTTP_400_BAD_REQUEST)
 
         campaign = get_object_or_404(Campaign, owner=request.user, campaign_vk_id=campaign_vk_id)
-        campaign = self._update_campaign_stats(campaign, campaign_vk_id, request)
-        serializer = serializers.CampaignExtendedSerializer(campaign)
-        return Response(serializer.data)
-
-    @staticmethod
-    def _update_campaign_stats(campaign, campaign_vk_id, request):
-        # Получение юзера, чтобы взять его вк токен
-        user = get_object_or_404(User, username=request.user.username)
-
-        # Получение объявлений кампании и рефакторинг их для ВК фреймворка
-        ads = get_list_or_404(Ad, campaign_vk_id=campaign_vk_id)
-        ads_for_vk_framework = {ad.ad_vk_id: ad.playlist_url for ad in list(ads)}
 
-        # Получение статы объявлений
-        vk = vk_framework.VkAPI(token=user.vk_token, rucaptcha_key=DEV_RUCAPTCHA_KEY, proxy=DEV_PROXY,
-                                ads_cabinet_id=campaign.cabinet_vk_id, ads_client_id=campaign.client_vk_id)
-        ads_stat = vk.get_full_ads_stat(ads=ads_for_vk_framework)
-        ads_statuses = vk.ads.get_ads(campaign_id=campaign_vk_id)
-
-        # Обновление объектов объявлений и получение обновлений для объекта кампании
-        updated_campaign_stat = CampaignUpdateStatsView._update_ads_objects(ads, ads_stat, ads_statuses)
-
-        # Обновление статуса кампании
-        campaign_status = vk.ads.get_campaigns()
-        if campaign_status:
-            updated_campaign_stat['status'] = campaign_status[campaign_vk_id]['status']
-
-        # Обновление объекта кампании и сохранение его в БД
-        updated_campaign = CampaignUpdateStatsView._update_campaign_object(campaign, updated_campaign_stat)
-
-        return updated_campaign
-
-    @staticmethod
-    def _update_campaign_object(campaign, updated_campaign_stat):
-        spent = round(updated_campaign_stat['spent'], 2)
-        reach = updated_campaign_stat['reach']
-        listens = updated_campaign_stat['listens']
-        clicks = updated_campaign_stat['clicks']
-        subscribes = updated_campaign_stat['subscribes']
-
-        campaign.spent = spent
-        campaign.listens = listens
-        campaign.reach = reach
-        campaign.clicks = clicks
-        campaign.subscribes = subscribes
-
-        campaign.cpm = round((spent / (reach / 1000)), 2) if reach else 0
-        campaign.cpl = round((spent / listens), 2) if listens else 0
-        campaign.cpc = round((spent / clicks), 2) if clicks else 0
-        campaign.cps = round((spent / subscribes), 2) if subscribes else 0
-
-        if 'status' in updated_campaign_stat.keys():
-            campaign.status = updated_campaign_stat['status']
-
-        campaign.save()
-
-        return campaign
-
-    @staticmethod
-    def _update_ads_objects(ads, ads_stat, ads_statuses):
-        updated_ad_objects = []
-        updated_campaign_stat = {'spent': 0, 'listens': 0, 'reach': 0, 'clicks': 0, 'subscribes': 0}
-        for ad in list(ads):
-            # Если был охват (если он не ноль)
-            if ads_stat[ad.ad_vk_id]['reach']:
-                # Обновление статы в объектах объявлений
-                ad.spent = ads_stat[ad.ad_vk_id]['spent']
-                ad.reach = ads_stat[ad.ad_vk_id]['reach'],
-                ad.reach = ad.reach[0]
-                ad.listens = ads_stat[ad.ad_vk_id]['listens']
-                ad.clicks = ads_stat[ad.ad_vk_id]['clicks'],
-                ad.clicks = ad.clicks[0]
-                ad.subscribes = ads_stat[ad.ad_vk_id]['subscribes'],
-                ad.subscribes = ad.subscribes[0]
-
-                ad.cpm = ads_stat[ad.ad_vk_id]['cpm'],
-                ad.cpm = ad.cpm[0]
-                ad.cpl = round((ad.spent / ad.listens), 2) if ad.listens else 0
-                ad.cpc = round((ad.spent / ad.clicks), 2) if ad.clicks else 0
-                ad.cps = round((ad.spent / ad.subscribes), 2) if ad.subscribes else 0
-
-                # Обновление средней статы кампании
-                for param in updated_campaign_stat.keys():
-                    updated_campaign_stat[param] += ads_stat[ad.ad_vk_id][param]
-
-            # Обновление статусов объявлений
-            ad.status = ads_statuses[ad.ad_vk_id]['status']
-            ad.approved = ads_statuses[ad.ad_vk_id]['approved']
-
-            # Добавление обновленного объекта в лист
-            updated_ad_objects.append(ad)
-
-        # Сохранение обновленных объектво объявлений в БД
-        Ad.objects.bulk_update(updated_ad_objects,
-                               ['spent', 'reach', 'cpm', 'clicks', 'cpc', 'subscribes', 'cps', 'listens', 'cpl',
-                                'status', 'approved'],
-                               batch_size=40)
-
-        # Возврат обновленной средней статы кампании
-        return updated_campaign_stat
+        # Стату обновит воркер очереди, статус задачи - в jobs.get, обновленная кампания - в campaigns.getDetails
+        job = enqueue_job('update_campaign_stats', owner_id=request.user.pk, campaign_primary_key=campaign.pk)
+        return Response({'info': 'campaign stats are updating, it takes some time', 'job_id': job.pk})
 
 
 class CampaignStartAutomateView(views.APIView):
@@ -301,10 +205,8 @@ class CampaignStartAutomateView(views.APIView):
         automate_setting['campaign'] = campaign
         serializer = serializers.AutomateSettingsSerializer(data=automate_setting)
         if serializer.is_valid():
-            serializer.save()
-            process = Process(target=call_command, args=('automate_campaign',), kwargs=serializer.data)
-            process.start()
-            return Response({'info': 'campaign automate is starting, it take some time'})
+            job = enqueue_job('automate_campaign', owner_id=request.user.pk, **serializer.data)
+            return Response({'info': 'campaign automate is starting, it take some time', 'job_id': job.pk})
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -318,8 +220,71 @@ class CampaignStopAutomateView(views.APIView):
             return Response({'detail': 'campaign_vk_id is required'}, status=status.HTTP_400_BAD_REQUEST)
         campaign = get_object_or_404(Campaign, owner=request.user, campaign_vk_id=campaign_vk_id)
         campaign.automate = 0
-        campaign.save()
-        return Response({'info': 'campaign automate is stopping, it take some time'})
+        campaign.save(update_fields=['automate'])
+        send_automate_control('stop', campaign.pk)
+        return Response({'info': 'campaign automate is stopped'})
+
+
+class CampaignPauseAutomateView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        campaign_vk_id = request.query_params.get('campaign_vk_id')
+        if not campaign_vk_id:
+            return Response({'detail': 'campaign_vk_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        campaign = get_object_or_404(Campaign, owner=request.user, campaign_vk_id=campaign_vk_id)
+        if campaign.automate != 1:
+            return Response({'detail': 'campaign is not automated'}, status=status.HTTP_400_BAD_REQUEST)
+        campaign.automate = 2
+        campaign.save(update_fields=['automate'])
+        send_automate_control('pause', campaign.pk)
+        return Response({'info': 'campaign automate is paused'})
+
+
+class CampaignResumeAutomateView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        campaign_vk_id = request.query_params.get('campaign_vk_id')
+        if not campaign_vk_id:
+            return Response({'detail': 'campaign_vk_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        campaign = get_object_or_404(Campaign, owner=request.user, campaign_vk_id=campaign_vk_id)
+        if campaign.automate != 2:
+            return Response({'detail': 'campaign automate is not paused'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Если автоматизация закончилась по времени, пока была на паузе, - завершаем ее, а не возобновляем
+        # (планировщик такие автоматизации не подхватывает)
+        automate_settings = campaign.automate_settings.order_by('-settings_create_datetime').first()
+        if not automate_settings or automate_settings.finish_time <= timezone.now():
+            campaign.automate = 0
+            campaign.save(update_fields=['automate'])
+            return Response({'detail': 'campaign automate finish time has passed, automate is stopped'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        campaign.automate = 1
+        campaign.save(update_fields=['automate'])
+        send_automate_control('resume', campaign.pk)
+        return Response({'info': 'campaign automate is resumed'})
+
+
+class JobListView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.query_params.get('job_id'):
+            try:
+                job_id = int(request.query_params.get('job_id'))
+            except (ValueError, TypeError):
+                return Response({'detail': 'job_id must be int'}, status=status.HTTP_400_BAD_REQUEST)
+            job = get_object_or_404(Job, owner=request.user, pk=job_id)
+            serializer = serializers.JobSerializer(job)
+            return Response(serializer.data)
+
+        jobs = Job.objects.filter(owner=request.user)
+        if request.query_params.get('status'):
+            jobs = jobs.filter(status=request.query_params.get('status'))
+        serializer = serializers.JobSerializer(list(jobs[:100]), many=True)
+        return Response(serializer.data)
 
 
 class AdListView(views.APIView):
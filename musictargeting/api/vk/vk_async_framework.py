@@ -0,0 +1,205 @@
+""" Use Python 3.7 """
+
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from musictargeting.api.vk.vk_framework import VkAPI, VkChart, EXECUTE_MAX_CALLS, \
+    _check_artist_names_for_get_musicians, _get_group_ids_from_playlist_urls, _merge_ads_and_playlists_stat
+from musictargeting.settings import VK_POOL_SIZE
+
+
+class _AsyncVkWrapper:
+
+    def __init__(self, sync_object, executor):
+        """
+        Асинхронная обертка над объектом фреймворка: любой публичный метод объекта становится корутиной.
+        Запросы выполняются в пуле потоков через те же сессии, лимитеры и антикапчу, что и синхронные
+
+        :param sync_object:     объект VkAudio, VkAds, VkTools, VkChart или VkArtistCards
+        :param executor:        ThreadPoolExecutor, пул потоков для запросов
+        """
+        self.sync_object = sync_object
+        self.executor = executor
+
+    def _run(self, func, *args, **kwargs):
+        """
+        Возвращает awaitable с результатом синхронной функции, выполненной в пуле потоков
+
+        :param func:    callable, синхронная функция
+        :return:        asyncio.Future
+        """
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync_object, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self._run(attr, *args, **kwargs)
+
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+
+class AsyncVkAudio(_AsyncVkWrapper):
+
+    async def get_related_artists(self, release, include_genres=False, related_in_genres=False):
+        """
+        Возвращает список имен "похожих" артистов, карточки артистов запрашиваются параллельно
+
+        :param release:             dict, объект релиза
+        :param include_genres:      bool, берет совпадения по указанным жанрам треков из актуального чарта ВК
+        :param related_in_genres:   bool, берет "похожих" артистов на артистов из жанровых совпадений в чарте
+        :return:                    list, [artist_name, ...]
+        """
+        finded_artists = [x for x in list(release['artist_domains'].keys())]
+        artist_domains = [f'https://vk.com/artist/{x}' for x in list(release['artist_domains'].values())]
+
+        finded_artists.extend(await self._get_related_artists_from_domains(artist_domains, include_feats=True))
+
+        if include_genres:
+            similars = await self.get_similar_artists(release=release)
+            if similars:
+                if related_in_genres:
+                    similars_domains = []
+                    for sim in similars:
+                        similars_domains.extend([f'https://vk.com/artist/{x}' for x in sim['domains']])
+                    finded_artists.extend(await self._get_related_artists_from_domains(similars_domains))
+                else:
+                    for sim in similars:
+                        finded_artists.extend(sim['names'])
+
+        finded_artists = list(set(finded_artists))
+
+        if len(finded_artists) > 150:
+            return finded_artists[:150]
+
+        return finded_artists
+
+    async def _get_related_artists_from_domains(self, domains, include_feats=False):
+        """
+        Возвращает имена похожих артистов для всех переданных доменов, запрашивая карточки параллельно
+
+        :param domains:         list, ссылки на карточки артистов
+        :param include_feats:   bool, True - брать артистов из фитов, False - нет
+        :return:                list, [artist_name, ...]
+        """
+        responses = await asyncio.gather(*[self._run(self.sync_object._get_related_artists_from_domain,
+                                                     domain, include_feats=include_feats) for domain in domains])
+        related_artists_names = []
+        for related_artists in responses:
+            if related_artists:
+                related_artists_names.extend(list(related_artists.keys()))
+        return related_artists_names
+
+    async def get_artist_card_ids(self, artist_ids_or_card_urls):
+        """
+        Возвращает айди карточек артистов, запрашивая их параллельно
+
+        :param artist_ids_or_card_urls:     list, ссылки на карточки артистов или айдишки артистов
+        :return:                            dict, {artist_id_or_card_url: artist_card_id or None}
+        """
+        card_ids = await asyncio.gather(*[self._run(self.sync_object._get_artist_card_id, x)
+                                          for x in artist_ids_or_card_urls])
+        return dict(zip(artist_ids_or_card_urls, card_ids))
+
+
+class AsyncVkAds(_AsyncVkWrapper):
+
+    async def get_musicians(self, artist_names):
+        """
+        Возвращает словарь с айдишками музыкантов, пачки имен ищутся в ads.getMusicians параллельно
+
+        :param artist_names:    list or str
+        :return:                dict, {artist_name: artist_id}
+        """
+        artist_names = _check_artist_names_for_get_musicians(artist_names=artist_names)
+        if not artist_names:
+            return None
+
+        # Каждая пачка имен - один execute, пачки отправляются параллельно
+        batches = [artist_names[i:i + EXECUTE_MAX_CALLS] for i in range(0, len(artist_names), EXECUTE_MAX_CALLS)]
+        responses = await asyncio.gather(*[self._run(self.sync_object.get_musicians, batch) for batch in batches])
+        artist_ids = {}
+        for musicians in responses:
+            if musicians:
+                artist_ids.update(musicians)
+
+        return artist_ids
+
+
+class AsyncVkTools(_AsyncVkWrapper):
+    pass
+
+
+class AsyncVkChart(_AsyncVkWrapper):
+    pass
+
+
+class AsyncVkArtistCards(_AsyncVkWrapper):
+    pass
+
+
+class AsyncVkAPI:
+
+    def __init__(self, token, rucaptcha_key, proxy=None, batch_count=10, ads_cabinet_id=None, ads_client_id=None,
+                 musicians_cache=None, artist_graph=None, max_workers=VK_POOL_SIZE):
+        """
+        Асинхронный клиент API ВК с тем же набором методов, что и VkAPI, только методы - корутины.
+        Независимые запросы выполняются параллельно в пределах лимитов токена
+
+        :param max_workers:     int, максимум одновременных запросов (по умолчанию - размер пула соединений)
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.sync_api = VkAPI(token, rucaptcha_key, proxy, batch_count, ads_cabinet_id, ads_client_id, musicians_cache,
+                              artist_graph)
+
+        self.tools = AsyncVkTools(self.sync_api.tools, self.executor)
+        self.audio = AsyncVkAudio(self.sync_api.audio, self.executor)
+        self.ads = AsyncVkAds(self.sync_api.ads, self.executor)
+        self.artist_cards = AsyncVkArtistCards(self.sync_api.artist_cards, self.executor)
+        self.chart = AsyncVkChart(VkChart(token, rucaptcha_key, proxy), self.executor)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def get_full_ads_stat(self, ads, targeted=True):
+        """
+        Возвращает дикт с полной статой по объявлениям, стата плейлистов и объявлений запрашивается параллельно
+
+        :param ads:         dict, {ad_id: playlist_url}
+        :param targeted:    bool, как у VkAPI.get_full_ads_stat
+        :return:            dict, как у VkAPI.get_full_ads_stat
+        """
+        if targeted:
+            playlist_urls = list(set(ads.values()))
+            batches = [playlist_urls[i:i + EXECUTE_MAX_CALLS] for i in range(0, len(playlist_urls), EXECUTE_MAX_CALLS)]
+            playlist_requests = [self.audio.get_playlists_stat(playlist_urls=x) for x in batches]
+        else:
+            playlist_requests = [self.audio.get_group_playlists_stat(group_id=x)
+                                 for x in _get_group_ids_from_playlist_urls(ads.values())]
+
+        ad_stats, *playlist_responses = await asyncio.gather(self.ads.get_ads_stat(ads=ads), *playlist_requests)
+
+        playlist_stats = {}
+        for response in playlist_responses:
+            playlist_stats.update(response)
+
+        return _merge_ads_and_playlists_stat(ads, ad_stats, playlist_stats)
+
+    async def start_new_campaign(self, *args, **kwargs):
+        """
+        Запускает новую кампанию так же, как VkAPI.start_new_campaign
+        """
+        return await self.ads._run(self.sync_api.start_new_campaign, *args, **kwargs)
@@ -9,18 +9,45 @@ import pickle
 
 from time import sleep
 from random import uniform
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from python_rucaptcha import ImageCaptcha
-from datetime import datetime
+from datetime import datetime, date
 from random import choice
 from fake_useragent import UserAgent
 
-from musictargeting.settings import VK_API_VERSION
+from musictargeting.settings import VK_API_VERSION, VK_POOL_SIZE, VK_KEEP_ALIVE, VK_CONNECT_TIMEOUT, \
+    VK_READ_TIMEOUT, VK_CONNECT_RETRIES
+from musictargeting.api.vk.vk_rate_limiter import get_rate_limiter, _get_method_name
 
 
 warnings.filterwarnings('ignore')
 
 USER_AGENT = UserAgent()
 
+# Максимум вызовов API внутри одного запроса к методу execute
+EXECUTE_MAX_CALLS = 25
+
+# Максимум объявлений в одном запросе к методу ads.createAds
+ADS_CREATE_MAX_ADS = 5
+
+# Максимум объявлений в одном запросе к методу ads.updateAds
+ADS_UPDATE_MAX_ADS = 5
+
+# Максимум айди объявлений в одном запросе к методу ads.getStatistics
+ADS_STAT_MAX_IDS = 2000
+
+# Страниц по 20 треков в чарте ВК (100 позиций)
+CHART_MAX_PAGES = 5
+
+# Максимум одновременно выполняемых этапов запуска кампании
+LAUNCH_PIPELINE_WORKERS = 4
+
+# Общие HTTP-сессии с пулом keep-alive соединений, {(pid, token, proxy): requests.Session}
+_SESSIONS = {}
+_SESSIONS_LOCK = Lock()
+
 
 def _anticaptcha(captcha_img, rucaptcha_key):
     """
@@ -37,9 +64,37 @@ def _anticaptcha(captcha_img, rucaptcha_key):
     return captcha_key
 
 
-def _get_api_response(url, data, rucaptcha_key, proxy=None, captcha_sid=None, captcha_key=None):
+def _get_session(token, proxy=None):
+    """
+    Возвращает общую для пары (token, proxy) HTTP-сессию с пулом keep-alive соединений.
+    Сессии не переживают fork: в дочернем процессе создается своя сессия
+
+    :param token:   str, токен от ВК
+    :param proxy:   str, прокси в виде login:pass&ip:port
+    :return:        requests.Session
+    """
+    key = (os.getpid(), token, proxy)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if not session:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=VK_POOL_SIZE, pool_maxsize=VK_POOL_SIZE,
+                                  max_retries=VK_CONNECT_RETRIES, pool_block=True)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            if proxy:
+                session.proxies = {'https': f'https://{proxy}'}
+            if not VK_KEEP_ALIVE:
+                session.headers['Connection'] = 'close'
+            _SESSIONS[key] = session
+    return session
+
+
+def _get_api_response(url, data, rucaptcha_key, proxy=None, captcha_sid=None, captcha_key=None, session=None,
+                      full_response=False):
     """
-    Возвращает ответ апи ВК, отбиваясь от капчи и ту мэни реквестс пер секонд
+    Возвращает ответ апи ВК, отбиваясь от капчи и ту мэни реквестс пер секонд.
+    Частота запросов ограничивается лимитером токена, а не фиксированной паузой
 
     :param url:             str, урл запроса к апи с названием метода (без параметров!!!)
     :param url:             dict, дикт с параметрами метода
@@ -47,14 +102,17 @@ def _get_api_response(url, data, rucaptcha_key, proxy=None, captcha_sid=None, ca
     :param proxy:           str, прокси в виде login:pass&ip:port
     :param captcha_sid:     str, сид капчи
     :param captcha_key:     str, разгаданная капча
+    :param session:         requests.Session, сессия для запроса (None - общая сессия токена и прокси)
+    :param full_response:   bool, True - вернуть весь ответ (с execute_errors), False - только response
     :return:                dict, разобранный из JSON ответ апи ВК (None - если ошибка в ответе)
     """
-    sleep(uniform(0.4, 0.6))
+    token = data.get('access_token') if data else None
+    method = _get_method_name(url)
+    limiter = get_rate_limiter(token)
+    limiter.acquire(method, data)
 
-    if proxy:
-        proxy_dict = {'https': f'https://{proxy}'}
-    else:
-        proxy_dict = None
+    if not session:
+        session = _get_session(token, proxy)
 
     if captcha_sid and captcha_key:
         if data:
@@ -64,22 +122,24 @@ def _get_api_response(url, data, rucaptcha_key, proxy=None, captcha_sid=None, ca
 
     u_agent = USER_AGENT.random
 
-    resp = requests.post(url, data, proxies=proxy_dict, headers={'User-Agent': u_agent}).json()
+    resp = session.post(url, data, headers={'User-Agent': u_agent},
+                        timeout=(VK_CONNECT_TIMEOUT, VK_READ_TIMEOUT)).json()
 
     if 'error' in resp.keys():
         if resp['error']['error_msg'] == 'Captcha needed':
             captcha_sid = resp['error']['captcha_sid']
             captcha_img = resp['error']['captcha_img']
             captcha_key = _anticaptcha(captcha_img, rucaptcha_key)
-            return _get_api_response(url, data, rucaptcha_key, proxy, captcha_sid, captcha_key)
+            return _get_api_response(url, data, rucaptcha_key, proxy, captcha_sid, captcha_key, session,
+                                     full_response)
         elif resp['error']['error_msg'] == 'Too many requests per second':
-            sleep(uniform(0.4, 0.6))
-            return _get_api_response(url, data, rucaptcha_key)
+            limiter.penalize(method, data)
+            return _get_api_response(url, data, rucaptcha_key, proxy, session=session, full_response=full_response)
         else:
             print(resp)
             return None
     else:
-        return resp['response']
+        return resp if full_response else resp['response']
 
 
 def _generate_random_filename():
@@ -212,6 +272,62 @@ def _code_for_get_chart_albums(batch):
     return code
 
 
+def _code_for_execute(calls):
+    """
+    Возвращает аргумент code для метода execute API ВК, выполняющий независимые вызовы и возвращающий их ответы
+
+    :param calls:   list, [(method, params), ...], params - dict или None
+    :return:        str, code для выполнения метода execute
+    """
+    api_calls = []
+    for method, params in calls:
+        params = {k: v for k, v in params.items() if v is not None} if params else {}
+        api_calls.append(f'API.{method}({json.dumps(params, ensure_ascii=False)})')
+
+    code = 'return [' + ', '.join(api_calls) + '];'
+
+    return code
+
+
+def _run_stages(stages, max_workers=LAUNCH_PIPELINE_WORKERS, results=None, on_stage_done=None):
+    """
+    Выполняет этапы в пуле потоков: каждый этап стартует, как только готовы все его зависимости.
+    Ошибка любого этапа пробрасывается наружу (уже запущенные этапы при этом дорабатывают)
+
+    :param stages:          dict, {stage_name: (func, [dependency_name, ...])},
+                            func принимает дикт с результатами готовых этапов
+    :param max_workers:     int, максимум одновременно выполняемых этапов
+    :param results:         dict, результаты уже выполненных ранее этапов, они не выполняются повторно
+    :param on_stage_done:   callable, on_stage_done(stage_name, result), вызывается в текущем потоке
+                            после каждого выполненного этапа
+    :return:                dict, {stage_name: result}
+    """
+    results = dict(results) if results else {}
+    pending = {name: stage for name, stage in stages.items() if name not in results}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Запускаем все этапы, зависимости которых уже готовы
+            for name, (func, dependencies) in list(pending.items()):
+                if all(x in results for x in dependencies):
+                    running[executor.submit(func, dict(results))] = name
+                    pending.pop(name)
+
+            if not running:
+                raise RuntimeError(f'stages have unresolvable dependencies: {list(pending.keys())}')
+
+            # Ждем завершения хотя бы одного этапа
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if on_stage_done:
+                    on_stage_done(name, results[name])
+
+    return results
+
+
 def _get_audios_str(group_id, audio_ids):
     """
     Возвращает строку с идентификаторами аудиозарписей для использования в методе audio.addToPlaylist
@@ -272,6 +388,79 @@ def _ads_stat_unpack(stat_response):
     return ads_stats
 
 
+def _iter_pages(api_response, method, params, get_page, max_pages=None):
+    """
+    Генератор страниц метода API ВК с пагинацией через start_from / next_from.
+    Следующая страница запрашивается только когда вызывающий код дошел до нее, рекурсии и склеек диктов нет
+
+    :param api_response:    callable, метод _api_response объекта фреймворка
+    :param method:          str, название метода API ВК
+    :param params:          dict, параметры метода (без start_from)
+    :param get_page:        callable, resp -> (items, next_from), next_from - None, если страница последняя
+    :param max_pages:       int, максимум страниц (None - все)
+    :return:                generator, списки элементов страниц
+    """
+    start_from, page = None, 0
+    while max_pages is None or page < max_pages:
+        resp = api_response(method, {**params, 'start_from': start_from})
+        if not resp:
+            return
+
+        items, start_from = get_page(resp)
+        yield items
+
+        page += 1
+        if not start_from:
+            return
+
+
+def _get_group_ids_from_playlist_urls(playlist_urls):
+    """
+    Возвращает айди пабликов, которым принадлежат плейлисты
+
+    :param playlist_urls:   list, ссылки на плейлисты
+    :return:                list, [group_id, ...] без повторов
+    """
+    return list(set(int(x[28:].split('_')[0]) for x in playlist_urls))
+
+
+def _merge_ads_and_playlists_stat(ads, ad_stats, playlist_stats):
+    """
+    Объединяет стату объявлений со статой их плейлистов
+
+    :param ads:             dict, {ad_id: playlist_url}
+    :param ad_stats:        dict, {ad_id: {'spent': , 'reach': , 'cpm': , 'clicks': , 'subscribes': }}
+    :param playlist_stats:  dict, {playlist_url: {'title': str, 'listens': int, 'followers': int}}
+    :return:                dict, как у VkAPI.get_full_ads_stat
+    """
+    full_ads_stat = {}
+    for ad_id, playlist_url in ads.items():
+        if ad_id in ad_stats and playlist_url in playlist_stats:
+            full_ads_stat[ad_id] = ad_stats[ad_id]
+            full_ads_stat[ad_id].update({'listens': playlist_stats[playlist_url]['listens'],
+                                         'followers': playlist_stats[playlist_url]['followers']})
+    return full_ads_stat
+
+
+def _ads_day_stat_unpack(stat_response):
+    """
+    Возвращает разобранный объект со статой объявлений по дням
+
+    :param stat_response:   dict, разобранный из JSON объект ВК со статой объявлений (period: day)
+    :return:                dict, {ad_id: {day: {'spent': , 'reach': , 'clicks': , 'subscribes': }}}
+    """
+    ads_day_stat = {}
+    for ad in stat_response:
+        ads_day_stat[int(ad['id'])] = {}
+        for day_stat in ad['stats'] or []:
+            day = date.fromisoformat(day_stat['day'])
+            ads_day_stat[int(ad['id'])][day] = {'spent': float(day_stat.get('spent', 0)),
+                                                'reach': int(day_stat.get('impressions', 0)),
+                                                'clicks': int(day_stat.get('clicks', 0)),
+                                                'subscribes': int(day_stat.get('join_rate', 0))}
+    return ads_day_stat
+
+
 def _check_artist_names_for_get_musicians(artist_names):
     """
     Возвращает результат проверки имен артистов для использования с методом ads.getMusicians
@@ -349,7 +538,7 @@ def _data_for_ads(ad_name, campaign_id, post_url, sex_filter=None, music_interes
                   musician_id=None, retarget_base_id=None, age_from=0, age_to=0, age_disclaimer='0+',
                   impressions_limit=1):
     """
-    Возвращает сериализованный JSON-объект с настройками для создания объявления
+    Возвращает дикт с настройками для создания объявления (один элемент JSON-массива data для ads.createAds)
 
     :param ad_name:                 str, название объявления
     :param campaign_id:             int, айди кампании, в которой создается объявление
@@ -362,7 +551,7 @@ def _data_for_ads(ad_name, campaign_id, post_url, sex_filter=None, music_interes
     :param age_to:                  int, возраст до
     :param age_disclaimer:          str, возрастной дисклеймер, '0+', '6+', '12+', '16+', '18+' или None
     :param impressions_limit:       int, ограничение по показам на одного человека (1, 2, 3, 5, 10, 15, 20)
-    :return:                        serialized JSON object
+    :return:                        dict
     """
     # Перевод параметров функции в параметры для настроек
     sex_filter = _sex_str_to_int(sex_filter)
@@ -396,7 +585,7 @@ def _data_for_ads(ad_name, campaign_id, post_url, sex_filter=None, music_interes
     if retarget_base_id:
         data_dict.update({'retargeting_groups': retarget_base_id})
 
-    return json.dumps([data_dict])
+    return data_dict
 
 
 def _pars_feats_from_audios(audios, main_artist_name):
@@ -425,49 +614,38 @@ def _pars_feats_from_audios(audios, main_artist_name):
     return feat_artists_ids
 
 
-def _listens_threshold_passed(artist_card_item, listens_threshold, n_last_releases):
+def _listens_threshold_passed(plays, listens_threshold, n_last_releases):
     """
     Возвращает True или False, если артист проходт или не прохождит порог
     по прослушиваниям на N последних релизных плейлистах
 
-    :param artist_card_item:    dict, объект карточки артиста, разобранный из JSON-ответа ВК
+    :param plays:               list, прослушивания релизных плейлистов артиста, от последнего
     :param listens_threshold:   int, минимальный порог по прослушиваниям в среднем по релизам
     :param n_last_releases:     int, количество последних релизов для анализа
     :return:                    bool, True - порог пройден, False - не пройден
     """
-
-    if 'playlists' not in artist_card_item.keys():
+    if not plays:
         return False
 
-    playlists = artist_card_item['playlists']
-
-    if len(playlists) <= n_last_releases:
-        listens = sum([x['plays'] for x in playlists]) / len(playlists)
-    else:
-        listens = sum([x['plays'] for x in playlists[:n_last_releases]]) / n_last_releases
+    last_plays = plays[:n_last_releases]
+    listens = sum(last_plays) / len(last_plays)
 
     return True if listens > listens_threshold else False
 
 
-def _is_artist_alive(artist_card_item, days_from_last_release):
+def _is_artist_alive(last_release_date, days_from_last_release):
     """
     Возвращает True или False, если артист жив или мертв
     Имеется ввиду, если в споследнего релиза прошло больше дней, чем хотелось бы
 
-    :param artist_card_item:        dict, разобранный JSON объект карточки основного артиста
+    :param last_release_date:       date, дата последнего релиза артиста
     :param days_from_last_release:  int, максиально допустимое кол-во дней, прошедших от даты последнего релиза
     :return:                        bool, True - проверка пройдена, False - не пройдена
     """
-
-    if 'playlists' not in artist_card_item.keys():
+    if not last_release_date:
         return False
 
-    last_release_timestamp = artist_card_item['playlists'][0]['create_time']
-    last_release_datetime = datetime.fromtimestamp(last_release_timestamp)
-
-    now_datetime = datetime.now()
-
-    days_delta = (now_datetime - last_release_datetime).days
+    days_delta = (date.today() - last_release_date).days
 
     return True if days_delta <= days_from_last_release else False
 
@@ -507,100 +685,312 @@ def decode_mp3_url(url):
     return f'{match[0]}/{match[1]}.mp3?extra={match[2]}'
 
 
-class VkAPI:
+class VkExecuteResult:
 
-    def __init__(self, token, rucaptcha_key, proxy=None, batch_count=10, ads_cabinet_id=None, ads_client_id=None):
+    def __init__(self, method, params=None):
+        """
+        Результат одного вызова, поставленного в очередь VkExecuteBatch.
+        Заполняется после отправки пачки, в которую попал вызов
 
-        self.tools = VkTools(token, rucaptcha_key, proxy)
-        self.audio = VkAudio(token, rucaptcha_key, proxy, batch_count)
-        self.ads = VkAds(token, rucaptcha_key, ads_cabinet_id, proxy, ads_client_id)
-        self.artist_cards = VkArtistCards(token, rucaptcha_key, proxy)
+        :param method:  str, название метода API ВК
+        :param params:  dict, параметры метода
+        """
+        self.method = method
+        self.params = params
+        self.response = None
+        self.error = None
+        self.done = False
+
+    def __repr__(self):
+        return f'VkExecuteResult({self.method}, done={self.done}, error={self.error})'
 
-    def get_full_ads_stat(self, ads):
+
+class VkExecuteBatch:
+
+    def __init__(self, api_response, batch_size=EXECUTE_MAX_CALLS, common_params=None):
+        """
+        Очередь независимых вызовов API ВК, которые отправляются пачками через метод execute.
+        Ответ и ошибка каждого вызова раскладываются в его VkExecuteResult.
+        Можно использовать как контекстный менеджер - на выходе из блока очередь отправляется
+
+        :param api_response:    callable, метод _api_response объекта фреймворка
+        :param batch_size:      int, количество вызовов в одном execute (не более 25)
+        :param common_params:   dict, параметры, которые добавляются ко всем вызовам методов ads (account_id и т.п.)
+        """
+        self.api_response = api_response
+        self.batch_size = min(batch_size, EXECUTE_MAX_CALLS)
+        self.common_params = common_params
+        self.queue = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not exc_type:
+            self.flush()
+
+    def add(self, method, params=None):
+        """
+        Ставит вызов в очередь и возвращает объект для его результата. Полная пачка отправляется сразу
+
+        :param method:  str, название метода API ВК
+        :param params:  dict, параметры метода
+        :return:        VkExecuteResult
+        """
+        if self.common_params and method.startswith('ads.'):
+            params = {**self.common_params, **(params or {})}
+
+        result = VkExecuteResult(method, params)
+        self.queue.append(result)
+
+        if len(self.queue) >= self.batch_size:
+            self.flush()
+
+        return result
+
+    def flush(self):
+        """
+        Отправляет все вызовы из очереди пачками по batch_size и раскладывает ответы по результатам
+        """
+        while self.queue:
+            batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+            code = _code_for_execute([(x.method, x.params) for x in batch])
+            resp = self.api_response('execute', {'code': code}, full_response=True)
+            self._unpack_execute_response(batch, resp)
+
+    @staticmethod
+    def _unpack_execute_response(batch, resp):
+        """
+        Раскладывает ответ execute по результатам вызовов.
+        Неудачные вызовы возвращают false, а их ошибки идут в execute_errors в том же порядке
+
+        :param batch:   list, [VkExecuteResult, ...]
+        :param resp:    dict, полный ответ метода execute (None - если ошибка всего execute)
+        """
+        if not resp or not isinstance(resp.get('response'), list):
+            for result in batch:
+                result.error = {'error_msg': 'execute failed'}
+                result.done = True
+            return
+
+        execute_errors = list(resp.get('execute_errors', []))
+        for result, response in zip(batch, resp['response']):
+            if response is False:
+                result.error = execute_errors.pop(0) if execute_errors else {'error_msg': 'unknown error'}
+            else:
+                result.response = response
+            result.done = True
+
+        # Вызовы, на которые в ответе execute нет элемента, считаются неудачными
+        for result in batch[len(resp['response']):]:
+            result.error = {'error_msg': 'no execute response for call'}
+            result.done = True
+
+
+class VkAdsUpdateBuffer:
+
+    def __init__(self, execute_batch):
+        """
+        Буфер изменений объявлений для ads.updateAds: все изменения одного объявления сливаются в один элемент,
+        элементы уходят по ADS_UPDATE_MAX_ADS в ads.updateAds, а вызовы ads.updateAds - по EXECUTE_MAX_CALLS
+        в execute (до 125 объявлений за запрос). Успех изменения каждого объявления пишется в results.
+        Можно использовать как контекстный менеджер - на выходе из блока буфер отправляется
+
+        :param execute_batch:   callable, метод execute_batch объекта VkAds (с account_id и client_id кабинета)
         """
-        Возвращает дикт с полной статой по объявлениям
+        self.execute_batch = execute_batch
+        self.changes = {}   # {ad_id: {field: value}} - еще не отправленные изменения
+        self.results = {}   # {ad_id: bool} - отправленные изменения, True - применены
+        self.errors = {}    # {ad_id: error} - ошибки неприменившихся изменений
 
-        :param ads:     dict, {ad_id: playlist_url}
-        :return:        {ad_id: {'spent': float,        - потраченный бюджет
-                                 'reach': int,          - показы объявления
-                                 'cpm': cpm,            - текущий СРМ
-                                 'clicks': int          - переходы в паблик и по ссылкам
-                                 'subscribes': int      - подписки в паблик
-                                 'title': str,          - заголовок плейлиста
-                                 'listens': int,        - прослушивания плейлиста
-                                 'followers': int}}     - подписки на плейлист
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not exc_type:
+            self.flush()
+
+    def add(self, ad_id, **fields):
+        """
+        Добавляет изменения полей объявления (поверх уже добавленных). Полный буфер отправляется сразу
+
+        :param ad_id:   int, айди объявления
+        :param fields:  поля ads.updateAds: status, cpm (в рублях), all_limit и т.п.
+        """
+        self.changes.setdefault(ad_id, {}).update(fields)
+        if len(self.changes) >= ADS_UPDATE_MAX_ADS * EXECUTE_MAX_CALLS:
+            self.flush()
+
+    def flush(self):
+        """
+        Отправляет все изменения из буфера и возвращает успех по объявлениям
+
+        :return:    dict, {ad_id: bool} - все отправленные через буфер изменения
         """
-        # Достаем group_id из ссылки на плейлист
-        group_id = int(list(ads.values())[0][28:].split('_')[0])
+        data_list = [{'ad_id': ad_id, **fields} for ad_id, fields in self.changes.items() if fields]
+        self.changes = {}
+
+        with self.execute_batch() as batch:
+            calls = []
+            for i in range(0, len(data_list), ADS_UPDATE_MAX_ADS):
+                chunk = data_list[i:i + ADS_UPDATE_MAX_ADS]
+                calls.append((chunk, batch.add('ads.updateAds', {'data': json.dumps(chunk)})))
+
+        for chunk, result in calls:
+            # Ответ ads.updateAds - по элементу на объявление: айди объявления или ошибка
+            # Объявления, на которые в ответе нет элемента, считаются неизмененными
+            responses = result.response if isinstance(result.response, list) else []
+            responses = responses + [None] * (len(chunk) - len(responses))
+            for data, response in zip(chunk, responses):
+                ad_id = data['ad_id']
+                if isinstance(response, dict):
+                    self.results[ad_id] = not response.get('error_code')
+                else:
+                    self.results[ad_id] = isinstance(response, int) and response > 0
+                if not self.results[ad_id]:
+                    self.errors[ad_id] = response if isinstance(response, dict) else \
+                        result.error or {'error_msg': 'no ads.updateAds response for ad'}
+
+        return self.results
+
+
+class VkAPI:
+
+    def __init__(self, token, rucaptcha_key, proxy=None, batch_count=10, ads_cabinet_id=None, ads_client_id=None,
+                 musicians_cache=None, artist_graph=None):
 
+        self.tools = VkTools(token, rucaptcha_key, proxy)
+        self.audio = VkAudio(token, rucaptcha_key, proxy, batch_count)
+        self.ads = VkAds(token, rucaptcha_key, ads_cabinet_id, proxy, ads_client_id, musicians_cache)
+        self.artist_cards = VkArtistCards(token, rucaptcha_key, proxy, artist_graph)
+
+    def get_full_ads_stat(self, ads, targeted=True):
+        """
+        Возвращает дикт с полной статой по объявлениям. Объявления могут вести на плейлисты разных пабликов
+
+        :param ads:         dict, {ad_id: playlist_url}
+        :param targeted:    bool, True - запрашивать только плейлисты объявлений (audio.getPlaylistById через execute),
+                                  False - все плейлисты пабликов объявлений (audio.getPlaylists)
+        :return:            {ad_id: {'spent': float,        - потраченный бюджет
+                                     'reach': int,          - показы объявления
+                                     'cpm': cpm,            - текущий СРМ
+                                     'clicks': int          - переходы в паблик и по ссылкам
+                                     'subscribes': int      - подписки в паблик
+                                     'title': str,          - заголовок плейлиста
+                                     'listens': int,        - прослушивания плейлиста
+                                     'followers': int}}     - подписки на плейлист
+                            объявления, по которым не удалось получить стату, в дикт не попадают
+        """
         # Получаем стату по плейлистам и объявлениям
-        playlist_stats = self.audio.get_group_playlists_stat(group_id=group_id)
+        if targeted:
+            playlist_stats = self.audio.get_playlists_stat(playlist_urls=list(set(ads.values())))
+        else:
+            playlist_stats = {}
+            for group_id in _get_group_ids_from_playlist_urls(ads.values()):
+                playlist_stats.update(self.audio.get_group_playlists_stat(group_id=group_id))
         ad_stats = self.ads.get_ads_stat(ads=ads)
 
         # Объединяем стату объявлений и плейлистов
-        for ad_id, playlist_url in ads.items():
-            ad_stats[ad_id].update({'listens': playlist_stats[playlist_url]['listens'],
-                                    'followers': playlist_stats[playlist_url]['followers']})
-
-        return ad_stats
+        return _merge_ads_and_playlists_stat(ads, ad_stats, playlist_stats)
 
     def start_new_campaign(self, release_url, artist_group_id, post_text, campaign_budget, artist_names=None,
                            sex_filter=None, age_disclaimer='0+', age_from=0, age_to=0, impressions_limit=1,
-                           find_related_artists=False):
-        # Парсим релиз
-        release = self.audio.pars_release_playlist(playlist_url=release_url)
-        if release['is_explicit']:
-            age_disclaimer = '18+'
-            age_from = 18
-
-        # Собираем артистов для таргета
-        artist_names = self._extend_artist_names_for_start_new_campaign(artist_names, release, find_related_artists)
-
-        # Если нет ни одного артиста, то не на кого делать таргет, райзим исключение
-        if not artist_names:
-            raise RuntimeError('have no artist_names for target')
-
-        # Достаем айди баз слушателей музыкантов ВК
-        musicians = self.ads.get_musicians(artist_names=artist_names)
-        # Если нет ни одной базы слушателей, то не на кого делать таргет, райзим исключение
-        if not musicians:
-            raise RuntimeError('have no musicians for target')
-
-        # Копируем релизный плейлист для каждого артиста из списка для таргета
-        playlist_urls = self.audio.replicate_release(count=len(musicians))
-
-        # Создаем дарк-посты
-        dark_posts = self.ads.create_dark_posts(group_id=artist_group_id,
-                                                playlist_urls=playlist_urls,
-                                                post_text=post_text)
-        # Создаем пустую кампанию в кабинете
-        campaign_id = self.ads.create_campaign(campaign_name=f"{release['artist_name']} / {release['title']}",
-                                               money_limit=campaign_budget)
-        # Создаем и запускаем объявления в кампании
-        ads = self.ads.create_ads(campaign_id=campaign_id, posts=dark_posts, musicians=musicians,
-                                  age_from=age_from, age_to=age_to, age_disclaimer=age_disclaimer,
-                                  sex_filter=sex_filter, impressions_limit=impressions_limit)
+                           find_related_artists=False, checkpoint=None, on_stage_done=None, created_ads=None,
+                           on_ads_created=None):
+        """
+        Запускает новую кампанию. Запуск разбит на этапы, независимые этапы выполняются параллельно:
+
+            release ─┬─ musicians ──────┬─ playlists ── dark_posts ─┬─ ads
+                     ├─ release_group ──┘                           │
+                     └─ (release + musicians) ── campaign ──────────┘
+
+        Для продолжения прерванного запуска передается checkpoint с результатами уже выполненных этапов,
+        они повторно не выполняются. Результаты этапов JSON-сериализуемы
+
+        :param checkpoint:      dict, {stage_name: result}, результаты выполненных ранее этапов
+        :param on_stage_done:   callable, on_stage_done(stage_name, result) - для сохранения результатов этапов
+        :param created_ads:     list, объявления, созданные прерванным этапом ads (повторно не создаются)
+        :param on_ads_created:  callable, on_ads_created(created_ads) - для сохранения созданных объявлений
+                                после каждой пачки ads.createAds
+        :return:                dict, объект запущенной кампании для записи в БД
+        """
+        def release_stage(results):
+            # Парсим релиз
+            return self.audio.pars_release_playlist(playlist_url=release_url)
+
+        def musicians_stage(results):
+            # Собираем артистов для таргета
+            names = self._extend_artist_names_for_start_new_campaign(artist_names, results['release'],
+                                                                     find_related_artists)
+            # Если нет ни одного артиста, то не на кого делать таргет, райзим исключение
+            if not names:
+                raise RuntimeError('have no artist_names for target')
+
+            # Достаем айди баз слушателей музыкантов ВК
+            musicians = self.ads.get_musicians(artist_names=names)
+            # Если нет ни одной базы слушателей, то не на кого делать таргет, райзим исключение
+            if not musicians:
+                raise RuntimeError('have no musicians for target')
+            return musicians
+
+        def release_group_stage(results):
+            # Создаем паблик для реплик релиза и добавляем в него аудиозаписи, пока ищутся музыканты
+            return self.audio.create_release_group(release=results['release'])
+
+        def playlists_stage(results):
+            # Копируем релизный плейлист для каждого артиста из списка для таргета
+            return self.audio.replicate_release(count=len(results['musicians']),
+                                                release_group=results['release_group'])
+
+        def dark_posts_stage(results):
+            # Создаем дарк-посты
+            return self.ads.create_dark_posts(group_id=artist_group_id,
+                                              playlist_urls=results['playlists'],
+                                              post_text=post_text)
+
+        def campaign_stage(results):
+            # Создаем пустую кампанию в кабинете (только когда есть на кого таргетироваться)
+            release = results['release']
+            return self.ads.create_campaign(campaign_name=f"{release['artist_name']} / {release['title']}",
+                                            money_limit=campaign_budget)
+
+        def ads_stage(results):
+            # Создаем и запускаем объявления в кампании
+            ads_age_disclaimer, ads_age_from = age_disclaimer, age_from
+            if results['release']['is_explicit']:
+                ads_age_disclaimer, ads_age_from = '18+', 18
+            return self.ads.create_ads(campaign_id=results['campaign'], posts=results['dark_posts'],
+                                       musicians=results['musicians'], age_from=ads_age_from, age_to=age_to,
+                                       age_disclaimer=ads_age_disclaimer, sex_filter=sex_filter,
+                                       impressions_limit=impressions_limit, created_ads=created_ads,
+                                       on_batch_done=on_ads_created)
+
+        stages = {
+            'release': (release_stage, []),
+            'musicians': (musicians_stage, ['release']),
+            'release_group': (release_group_stage, ['release']),
+            'playlists': (playlists_stage, ['musicians', 'release_group']),
+            'dark_posts': (dark_posts_stage, ['playlists']),
+            'campaign': (campaign_stage, ['release', 'musicians']),
+            'ads': (ads_stage, ['campaign', 'dark_posts', 'musicians', 'release']),
+        }
+        if checkpoint and 'release' in checkpoint:
+            self.audio.release_object = checkpoint['release']
+        results = _run_stages(stages, results=checkpoint, on_stage_done=on_stage_done)
 
+        release = results['release']
         campaign = {
             'cabinet_vk_id': self.ads.cabinet_id,
             'client_vk_id': self.ads.client_id,
-            'campaign_vk_id': campaign_id,
+            'campaign_vk_id': results['campaign'],
             'campaign_name': f"{release['artist_name']} / {release['title']}",
             'campaign_budget': campaign_budget,
             'release_artist': release['artist_name'],
             'release_title': release['title'],
             'release_cover_url': release['cover_url'],
-            # 'release_object': release,
             'artist_group_id': artist_group_id,
-            'playlists_group_id': int(playlist_urls[0][28:].split('_')[0]),
-            # 'musicians': musicians,
-            # 'dark_posts': dark_posts,
-            # 'age_from': age_from,
-            # 'age_to': age_to,
-            # 'age_disclaimer': age_disclaimer,
-            # 'sex_filter': sex_filter,
-            # 'impressions_limit': impressions_limit,
-            'ads': ads
+            'playlists_group_id': results['release_group']['group_id'],
+            'ads': results['ads']
         }
 
         return campaign
@@ -608,11 +998,10 @@ class VkAPI:
     def _extend_artist_names_for_start_new_campaign(self, artist_names, release, find_related_artists):
         if not artist_names:
             artist_names = []
-        for name, domain in release['artist_domains'].items():
-            artist_names.append(name)
-            if find_related_artists:
-                related_artists = self.audio.get_related_artists(release=release, include_genres=True)
-                artist_names.extend(related_artists)
+        artist_names = artist_names + list(release['artist_domains'].keys())
+        if find_related_artists:
+            related_artists = self.audio.get_related_artists(release=release, include_genres=True)
+            artist_names.extend(related_artists)
 
         return list(set(artist_names))
 
@@ -633,59 +1022,113 @@ class VkAudio:
         self.rucaptcha_key = rucaptcha_key
         self.batch_count = batch_count
         self.release_object = None
+        self.failed_audios = []
+        self.failed_playlists = []
 
-    def _api_response(self, method, params=None):
+    def _api_response(self, method, params=None, full_response=False):
         """
         Возвращает ответ от API ВК (None - если ошибка)
 
-        :param method:  str, название метода API ВК
-        :param params:  dict, параметры метода
-        :return:        dict, разобранный из JSON ответ апи ВК (None - если ошибка)
+        :param method:          str, название метода API ВК
+        :param params:          dict, параметры метода
+        :param full_response:   bool, True - вернуть весь ответ (с execute_errors), False - только response
+        :return:                dict, разобранный из JSON ответ апи ВК (None - если ошибка)
         """
         url = f'https://api.vk.com/method/{method}'
         if params:
             params.update({'access_token': self.token, 'v': VK_API_VERSION})
         else:
             params = {'access_token': self.token, 'v': VK_API_VERSION}
-        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy)
+        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy,
+                                 session=_get_session(self.token, self.proxy), full_response=full_response)
+
+    def execute_batch(self, batch_size=EXECUTE_MAX_CALLS):
+        """
+        Возвращает очередь вызовов, отправляемых пачками через execute
+
+        :param batch_size:  int, количество вызовов в одном execute (не более 25)
+        :return:            VkExecuteBatch
+        """
+        return VkExecuteBatch(self._api_response, batch_size)
 
     def add_audios_to_group(self, group_id, audios):
         """
-        Возвращает список айди добавленных в паблик аудиозаписей
+        Возвращает список айди добавленных в паблик аудиозаписей, недобавленные записываются в self.failed_audios
 
         :param group_id:    int, айди паблика, в который добавляются аудиозаписи
         :param audios:      list, список объектов аудиозаписей упрощенных методом pars_release_playlist
         :return:            list, список айдишек добавленных в паблик аудиозаписей
         """
+        # Добавляем аудиозаписи пачками через execute
+        with self.execute_batch() as batch:
+            results = []
+            for audio in audios:
+                api_method_params = {'owner_id': audio['owner_id'], 'audio_id': audio['audio_id'], 'group_id': group_id}
+                results.append(batch.add('audio.add', api_method_params))
+
+        # Собираем айди добавленных аудиозаписей, недобавленные откладываем в failed_audios
         audio_ids = []
-        for audio in audios:
-            api_method_params = {'owner_id': audio['owner_id'], 'audio_id': audio['audio_id'], 'group_id': group_id}
-            added_audio_id = self._api_response('audio.add', api_method_params)
-            audio_ids.append(added_audio_id)
+        for audio, result in zip(audios, results):
+            if result.response:
+                audio_ids.append(result.response)
+            else:
+                self.failed_audios.append({'artist_name': audio['artist_name'], 'title': audio['title'],
+                                           'error': result.error})
 
         return audio_ids
 
-    def get_group_playlists_stat(self, group_id, start_from=None):
+    def iter_group_playlists(self, group_id, max_pages=None):
+        """
+        Генератор плейлистов паблика, страницы по 200 плейлистов запрашиваются по мере перебора
+
+        :param group_id:    int, айди паблика
+        :param max_pages:   int, максимум страниц (None - все)
+        :return:            generator, объекты плейлистов из ответа audio.getPlaylists
+        """
+        api_method_params = {'owner_id': group_id * -1, 'count': 200}
+        pages = _iter_pages(self._api_response, 'audio.getPlaylists', api_method_params,
+                            get_page=lambda resp: (resp['items'], resp.get('next_from')), max_pages=max_pages)
+        for playlists in pages:
+            yield from playlists
+
+    def get_group_playlists_stat(self, group_id):
         """
         Возвращает дикт со статой всех плейлистов паблика
 
         :param group_id:    int, айди паблика
-        :param start_from:  str, параметр скролла, если в паблике более 200 плейлистов
         :return:            dict, {playlist_url: {'title': str, 'listens': int, 'followers': int}}
         """
         playlist_stats = {}
+        for playlist in self.iter_group_playlists(group_id=group_id):
+            playlist_url = f'https://vk.com/music/album/{playlist["owner_id"]}_{playlist["id"]}'
+            playlist_stats[playlist_url] = {'title': playlist['title'],
+                                            'listens': int(playlist['plays']),
+                                            'followers': int(playlist['followers'])}
+
+        return playlist_stats
 
-        api_method_params = {'owner_id': group_id * -1, 'count': 200, 'start_from': start_from}
-        playlists = self._api_response('audio.getPlaylists', api_method_params)
-        if playlists:
-            for playlist in playlists['items']:
-                playlist_url = f'https://vk.com/music/album/{playlist["owner_id"]}_{playlist["id"]}'
-                playlist_stats[playlist_url] = {'title': playlist['title'],
-                                                'listens': int(playlist['plays']),
-                                                'followers': int(playlist['followers'])}
-            if 'next_from' in playlists.keys():
-                playlist_stats.update(self.get_group_playlists_stat(group_id=group_id,
-                                                                    start_from=playlists['next_from']))
+    def get_playlists_stat(self, playlist_urls):
+        """
+        Возвращает дикт со статой переданных плейлистов (из любых пабликов), плейлисты запрашиваются через execute
+
+        :param playlist_urls:   list, ссылки на плейлисты
+        :return:                dict, {playlist_url: {'title': str, 'listens': int, 'followers': int}}
+        """
+        with self.execute_batch() as batch:
+            results = []
+            for playlist_url in playlist_urls:
+                owner_id, playlist_id, access_key = _get_playlist_params_from_url(playlist_url=playlist_url)
+                api_method_params = {'owner_id': owner_id, 'playlist_id': playlist_id, 'access_key': access_key}
+                results.append(batch.add('audio.getPlaylistById', api_method_params))
+
+        playlist_stats = {}
+        for playlist_url, result in zip(playlist_urls, results):
+            if result.response:
+                playlist_stats[playlist_url] = {'title': result.response['title'],
+                                                'listens': int(result.response['plays']),
+                                                'followers': int(result.response['followers'])}
+            else:
+                print(playlist_url, result.error)
 
         return playlist_stats
 
@@ -809,12 +1252,34 @@ class VkAudio:
 
         return release
 
-    def replicate_release(self, playlist_url=None, count=1):
+    def create_release_group(self, release):
+        """
+        Создает паблик для реплик релизного плейлиста и добавляет в него аудиозаписи релиза
+
+        :param release:     dict, объект релиза
+        :return:            dict, {'group_id': int, 'audios_str': str}, audios_str - аудиозаписи для addToPlaylist
+        """
+        # Создаем паблик для создания реплик релизного плейлиста
+        group_id = self.create_group(group_name=release['artist_name'])
+
+        # Добавляем в паблик аудиозаписи из релиза и делаем строку из их айдишек для добавления в плейлисты пачкой
+        group_audio_ids = self.add_audios_to_group(group_id=group_id, audios=release['track_list'])
+        # Если не добавилась ни одна аудиозапись, то плейлисты будут пустыми, райзим исключение
+        if not group_audio_ids:
+            raise RuntimeError('have no release audios added to release group')
+        audios_str = _get_audios_str(group_id=group_id, audio_ids=group_audio_ids)
+
+        return {'group_id': group_id, 'audios_str': audios_str}
+
+    def replicate_release(self, playlist_url=None, count=1, release_group=None):
         """
-        Возвращает список с ссылками на копии релизного плейлиста
+        Возвращает список с ссылками на копии релизного плейлиста, незаполненные плейлисты
+        записываются в self.failed_playlists
 
         :param playlist_url:    str, ссылка на оригинальный релизный плейлист
         :param count:           int, количество копий, которое необходимо сделать
+        :param release_group:   dict, уже созданный паблик с аудиозаписями из create_release_group
+                                (None - паблик создается здесь)
         :return:                list, список ссылок на копии релизного плейлиста
         """
         # Если релиз еще не был спрасер и ссылка на него передана в этот метод..
@@ -827,21 +1292,27 @@ class VkAudio:
         else:
             release = self.release_object
 
-        # Создаем паблик для создания реплик релизного плейлиста
-        group_id = self.create_group(group_name=release['artist_name'])
-
-        # Добавляем в паблик аудиозаписи из релиза и делаем строку из их айдишек для добавления в плейлисты пачкой
-        group_audio_ids = self.add_audios_to_group(group_id=group_id, audios=release['track_list'])
-        audios_str = _get_audios_str(group_id=group_id, audio_ids=group_audio_ids)
+        # Создаем паблик с аудиозаписями релиза, если он не был создан заранее
+        if not release_group:
+            release_group = self.create_release_group(release=release)
+        group_id, audios_str = release_group['group_id'], release_group['audios_str']
 
         # Создаем пустые плейлисты в паблике
         playlist_ids = self.create_empty_playlists(count=count, group_id=group_id, playlist_name=release['title'])
 
-        # Добавляем аудиозаписи в плейлисты и собираем на них прямые ссылки
+        # Добавляем аудиозаписи в плейлисты пачками через execute
+        with self.execute_batch() as batch:
+            results = []
+            for playlist_id in playlist_ids:
+                api_method_params = {'owner_id': group_id * -1, 'playlist_id': playlist_id, 'audio_ids': audios_str}
+                results.append(batch.add('audio.addToPlaylist', api_method_params))
+
+        # Собираем прямые ссылки на заполненные плейлисты, незаполненные откладываем в failed_playlists
         duplicate_playlist_urls = []
-        for playlist_id in playlist_ids:
-            api_method_params = {'owner_id': group_id * -1, 'playlist_id': playlist_id, 'audio_ids': audios_str}
-            self._api_response('audio.addToPlaylist', api_method_params)
+        for playlist_id, result in zip(playlist_ids, results):
+            if result.error:
+                self.failed_playlists.append({'playlist_id': playlist_id, 'group_id': group_id, 'error': result.error})
+                continue
             duplicate_playlist_urls.append(f'https://vk.com/music/album/-{group_id}_{playlist_id}')
 
         return duplicate_playlist_urls
@@ -1004,7 +1475,7 @@ class VkAudio:
 
 class VkAds:
 
-    def __init__(self, token, rucaptcha_key, cabinet_id, proxy=None, client_id=None):
+    def __init__(self, token, rucaptcha_key, cabinet_id, proxy=None, client_id=None, musicians_cache=None):
         """
         Объект для работы с рекламным кабинетом (дичным или агентским) через API ВК
 
@@ -1013,19 +1484,24 @@ class VkAds:
         :param proxy:           str, прокси в виде login:pass&ip:port
         :param cabinet_id:      int, айди рекламного кабинета, с которым будет работать объект
         :param client_id:       int, айди клиента агентского кабинета, None - если cabinet_id от личного кабинета
+        :param musicians_cache: объект с методами get_many и set_many для кэша get_musicians (например, MusiciansCache)
         """
         self.token = token
         self.proxy = proxy
         self.rucaptcha_key = rucaptcha_key
         self.cabinet_id = cabinet_id
         self.client_id = client_id
+        self.musicians_cache = musicians_cache
+        self.failed_ads = []
+        self.failed_posts = []
 
-    def _api_response(self, method, params=None):
+    def _api_response(self, method, params=None, full_response=False):
         """
         Возвращает ответ от API ВК (None - если ошибка)
 
-        :param method:  str, название метода со специфичными для него параметрами в формате запросов к REST API
-        :return:        dict, разобранный из JSON ответ апи ВК (None - если ошибка)
+        :param method:          str, название метода со специфичными для него параметрами в формате запросов к REST API
+        :param full_response:   bool, True - вернуть весь ответ (с execute_errors), False - только response
+        :return:                dict, разобранный из JSON ответ апи ВК (None - если ошибка)
         """
         if not self.cabinet_id:
             raise RuntimeError("cabinet_id can't be None to use ads API, it's required parameter")
@@ -1040,7 +1516,21 @@ class VkAds:
         if self.client_id:
             params.update({'client_id': self.client_id})
 
-        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy)
+        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy,
+                                 session=_get_session(self.token, self.proxy), full_response=full_response)
+
+    def execute_batch(self, batch_size=EXECUTE_MAX_CALLS):
+        """
+        Возвращает очередь вызовов, отправляемых пачками через execute.
+        К вызовам методов ads добавляются account_id и client_id кабинета
+
+        :param batch_size:  int, количество вызовов в одном execute (не более 25)
+        :return:            VkExecuteBatch
+        """
+        common_params = {'account_id': self.cabinet_id}
+        if self.client_id:
+            common_params['client_id'] = self.client_id
+        return VkExecuteBatch(self._api_response, batch_size, common_params)
 
     def _get_group_id_for_get_audience_count(self):
         """
@@ -1079,12 +1569,15 @@ class VkAds:
         else:
             return None
 
-    def get_ads(self, campaign_id):
+    def get_ads(self, campaign_id=None, campaign_ids=None):
         """
-        Возвращает дикт с айди объявлений рекламной кампании в ключаях и их парамтерами в значениях
+        Возвращает дикт с айди объявлений рекламной кампании в ключаях и их парамтерами в значениях.
+        Передавать нужно или campaign_id или campaign_ids (объявления нескольких кампаний кабинета одним запросом)
 
         :param campaign_id:     int, айди рекламной кампании, из которой будут получены объявления
-        :return:                dict, {ad_id, {'name': str, 'cpm': int, 'status': 1/0, 'approved': 0/1/2/3}}
+        :param campaign_ids:    list of int, айди рекламных кампаний
+        :return:                dict, {ad_id, {'name': str, 'cpm': int, 'status': 1/0, 'approved': 0/1/2/3,
+                                               'campaign_id': int}}
 
                                        cpm - в копейках,
                                        status: 0 - остановлено,
@@ -1095,7 +1588,8 @@ class VkAds:
                                                  2 — объявление одобрено,
                                                  3 — объявление отклонено
         """
-        api_method_params = {'campaign_ids': json.dumps([campaign_id]), 'include_deleted': 1}
+        campaign_ids = campaign_ids if campaign_ids else [campaign_id]
+        api_method_params = {'campaign_ids': json.dumps(campaign_ids), 'include_deleted': 1}
         ads_response = self._api_response('ads.getAds', api_method_params)
 
         if ads_response:
@@ -1104,7 +1598,8 @@ class VkAds:
                 ads[int(ad['id'])] = {'name': ad['name'],
                                       'cpm': int(ad['cpm']),
                                       'status': int(ad['status']),
-                                      'approved': int(ad['approved'])}
+                                      'approved': int(ad['approved']),
+                                      'campaign_id': int(ad['campaign_id'])}
             return ads
 
     def get_ads_stat(self, campaign_id=None, ads=None):
@@ -1123,21 +1618,46 @@ class VkAds:
             # Делаем типа дикт из списка айдишек (чтобы не переписывать код ниже, где ads.keys())
             ads = {x: 0 for x in ads}
 
-        # Делаем строку из айди объявлений для использования в методе ads.getStatistics
-        ad_ids_str = ''
-        for ad_id in ads.keys():
-            ad_ids_str += f'{ad_id},'
-        ad_ids_str = ad_ids_str[:-1]
+        # ads.getStatistics принимает до ADS_STAT_MAX_IDS айди объявлений за запрос
+        ad_ids = list(ads.keys())
+        ads_stat = {}
+        for i in range(0, len(ad_ids), ADS_STAT_MAX_IDS):
+            # Делаем строку из айди объявлений для использования в методе ads.getStatistics
+            ad_ids_str = ','.join([str(x) for x in ad_ids[i:i + ADS_STAT_MAX_IDS]])
 
-        # Получаем объект ВК со статой объявлений
-        api_method_params = {'ids_type': 'ad', 'period': 'overall', 'date_from': 0, 'date_to': 0, 'ids': ad_ids_str}
-        stat_response = self._api_response('ads.getStatistics', api_method_params)
+            # Получаем объект ВК со статой объявлений
+            api_method_params = {'ids_type': 'ad', 'period': 'overall', 'date_from': 0, 'date_to': 0,
+                                 'ids': ad_ids_str}
+            stat_response = self._api_response('ads.getStatistics', api_method_params)
 
-        # Распаковываем стату объявлений в удобный для себя дикт
-        ads_stat = _ads_stat_unpack(stat_response=stat_response)
+            # Распаковываем стату объявлений в удобный для себя дикт
+            if stat_response:
+                ads_stat.update(_ads_stat_unpack(stat_response=stat_response))
 
         return ads_stat
 
+    def get_ads_day_stat(self, ad_ids, date_from, date_to):
+        """
+        Возвращает стату объявлений по дням за период (только дни, в которые была стата)
+
+        :param ad_ids:      list of int, айди объявлений
+        :param date_from:   datetime.date, первый день периода
+        :param date_to:     datetime.date, последний день периода
+        :return:            dict, {ad_id: {day: {'spent': , 'reach': , 'clicks': , 'subscribes': }}},
+                            day - datetime.date, None - если стату получить не удалось
+        """
+        ads_day_stat = {}
+        for i in range(0, len(ad_ids), ADS_STAT_MAX_IDS):
+            ad_ids_str = ','.join([str(x) for x in ad_ids[i:i + ADS_STAT_MAX_IDS]])
+            api_method_params = {'ids_type': 'ad', 'period': 'day', 'ids': ad_ids_str,
+                                 'date_from': date_from.isoformat(), 'date_to': date_to.isoformat()}
+            stat_response = self._api_response('ads.getStatistics', api_method_params)
+            if stat_response is None:
+                return None
+            ads_day_stat.update(_ads_day_stat_unpack(stat_response=stat_response))
+
+        return ads_day_stat
+
     def get_campaigns(self):
         """
         Возвращает дикт с названиями кампаний и их айди
@@ -1152,7 +1672,8 @@ class VkAds:
     def get_musicians(self, artist_names):
         """
         Возвращает словарь с айдишками музыкантов.
-        Это не те же самые айдишки, что в методах audio
+        Это не те же самые айдишки, что в методах audio.
+        Если у объекта есть musicians_cache, в ВК ищутся только имена, которых нет в кэше
 
         :param artist_names:    list or str
         :return:                dict, {artist_name: artist_id}
@@ -1162,20 +1683,43 @@ class VkAds:
         if not artist_names:
             return None
 
-        artist_ids = {}
-        for name in artist_names:
-            artists_response = self._api_response('ads.getMusicians', {'artist_name': name})
+        # Достаем из кэша все, что там есть, искать в ВК будем только остальное
+        if self.musicians_cache:
+            founded_musicians, artist_names = self.musicians_cache.get_many(artist_names)
+        else:
+            founded_musicians = {}
+
+        searched_musicians = self._search_musicians(artist_names)
+        if self.musicians_cache:
+            self.musicians_cache.set_many(searched_musicians)
+        founded_musicians.update(searched_musicians)
+
+        return {musician[0]: musician[1] for musician in founded_musicians.values() if musician}
+
+    def _search_musicians(self, artist_names):
+        """
+        Ищет музыкантов по именам через ads.getMusicians пачками через execute.
+        Имена, для которых запрос не удался, в результат не попадают
+
+        :param artist_names:    list, имена артистов
+        :return:                dict, {artist_name: (musician_name, musician_id) or None}, None - не найден
+        """
+        with self.execute_batch() as batch:
+            results = {name: batch.add('ads.getMusicians', {'artist_name': name}) for name in artist_names}
+
+        musicians = {}
+        for name, result in results.items():
             try:
-                founded_artists = artists_response['items']
-                for artist in founded_artists:
-                    if artist['name'].lower() == name.lower():
-                        artist_ids[artist['name']] = artist['id']
-                        break
+                founded_artists = result.response['items']
             except (KeyError, TypeError):
-                pass
-            sleep(uniform(0.4, 0.6))
+                continue
+            musicians[name] = None
+            for artist in founded_artists:
+                if artist['name'].lower() == name.lower():
+                    musicians[name] = (artist['name'], artist['id'])
+                    break
 
-        return artist_ids
+        return musicians
 
     def get_retarget(self, minimal_size=650000):
         """
@@ -1200,7 +1744,8 @@ class VkAds:
         return retarget
 
     def create_ads(self, campaign_id, posts, music_interest_filter=True, sex_filter=None, age_from=0, age_to=0,
-                   age_disclaimer='0+', impressions_limit=1, retarget=None, musicians=None):
+                   age_disclaimer='0+', impressions_limit=1, retarget=None, musicians=None,
+                   batch_size=ADS_CREATE_MAX_ADS, created_ads=None, on_batch_done=None):
         """
         Создает объявления в рекламной кампании
         и возвращает дикт с айди объялений и соответствующих им ссылкой на плейлисты.
@@ -1208,6 +1753,10 @@ class VkAds:
         Передавать за раз можно либо только базы ретаргета, либо только музыкантов,
         посты при этом должны быть конкретно под эту пачку, а не общий список постов.
 
+        Объявления создаются пачками по batch_size штук за запрос к ads.createAds.
+        Объявления, которые ВК не создал, не попадают в результат и записываются в self.failed_ads.
+        Таргеты, для которых объявление уже есть в created_ads (прерванное создание), пропускаются
+
         :param campaign_id:             int, айди кампании, в которой создаются объявления
         :param posts:                   dict, {post_url: playlist_url}
         :param music_interest_filter:   True - с сужением по интересу музыка, False - без сужения
@@ -1218,6 +1767,10 @@ class VkAds:
         :param impressions_limit:       int, ограничение по показам на одного человека (1, 2, 3, 5, 10, 15, 20)
         :param retarget:                dict, {retarget_name: retarget_id}
         :param musicians:               dict, {musician_name: musician_id}
+        :param batch_size:              int, количество объявлений в одном запросе (не более 5, 1 - по одному)
+        :param created_ads:             list, уже созданные объявления, как в результате
+        :param on_batch_done:           callable, on_batch_done(created_ads) - вызывается после каждой пачки
+                                        со всеми созданными на этот момент объявлениями
         :return:                        list, [{'ad_name': str, 'ad_vk_id': int, 'playlist_url': str}, ...]
         """
         # Достаем ссылки на посты из диктса с постами и плейлистами
@@ -1227,43 +1780,71 @@ class VkAds:
         if musicians and retarget:
             raise RuntimeError("musicians and retarget cant't be received at the same time")
 
-        # Если переданы музыканты
+        # Собираем названия объявлений и их таргеты (музыканты или базы ретаргета)
         if musicians:
-            created_ads = []
-            for n, (musician_name, musician_id) in enumerate(musicians.items()):
-                ad_name = f'{musician_name} (слушатели)'
-                data = _data_for_ads(ad_name=ad_name, campaign_id=campaign_id, post_url=post_urls[n],
-                                     music_interest_filter=music_interest_filter, musician_id=musician_id,
-                                     retarget_base_id=None, age_from=age_from, age_to=age_to, sex_filter=sex_filter,
-                                     age_disclaimer=age_disclaimer, impressions_limit=impressions_limit)
-                created_ads_response = self._api_response('ads.createAds', {'data': data})
-                if created_ads_response:
-                    ad_id = created_ads_response[0]['id']
-                    # created_ads[int(ad_id)] = posts[post_urls[n]]
-                    created_ads.append({'ad_name': ad_name,
-                                        'ad_vk_id': int(ad_id),
-                                        'playlist_url': posts[post_urls[n]]})
-                sleep(uniform(2.9, 3.1))
-            return created_ads
-
-        # Если переданы базы ретаргета
+            targets = [(f'{name} (слушатели)', musician_id, None) for name, musician_id in musicians.items()]
         elif retarget:
-            created_ads = []
-            for n, retarget_item in enumerate(retarget):
-                data = _data_for_ads(ad_name=retarget_item['retarget_name'], campaign_id=campaign_id,
-                                     post_url=post_urls[n], music_interest_filter=music_interest_filter,
-                                     musician_id=None, retarget_base_id=retarget_item['retarget_id'],
-                                     age_from=age_from, age_to=age_to, age_disclaimer=age_disclaimer,
-                                     impressions_limit=impressions_limit, sex_filter=sex_filter)
-                created_ads_response = self._api_response('ads.createAds', {'data': data})
-                if created_ads_response:
-                    ad_id = created_ads_response[0]['id']
-                    # created_ads[int(ad_id)] = posts[post_urls[n]]
-                    created_ads.append({'ad_name': retarget_item['retarget_name'],
-                                        'ad_vk_id': int(ad_id),
-                                        'playlist_url': posts[post_urls[n]]})
-                sleep(uniform(2.9, 3.1))
-            return created_ads
+            targets = [(x['retarget_name'], None, x['retarget_id']) for x in retarget]
+        else:
+            return None
+
+        # Если постов меньше, чем таргетов (часть постов не создалась), лишние таргеты уходят в failed_ads
+        for ad_name, _, _ in targets[len(post_urls):]:
+            self.failed_ads.append({'ad_name': ad_name, 'playlist_url': None, 'error': 'no dark post for ad'})
+
+        # Собираем настройки всех объявлений
+        ads_specs = []
+        for n, (ad_name, musician_id, retarget_base_id) in enumerate(targets[:len(post_urls)]):
+            data = _data_for_ads(ad_name=ad_name, campaign_id=campaign_id, post_url=post_urls[n],
+                                 music_interest_filter=music_interest_filter, musician_id=musician_id,
+                                 retarget_base_id=retarget_base_id, age_from=age_from, age_to=age_to,
+                                 sex_filter=sex_filter, age_disclaimer=age_disclaimer,
+                                 impressions_limit=impressions_limit)
+            ads_specs.append({'ad_name': ad_name, 'playlist_url': posts[post_urls[n]], 'data': data})
+
+        # Пропускаем таргеты, объявления для которых уже созданы
+        created_ads = list(created_ads) if created_ads else []
+        created_ad_names = set(x['ad_name'] for x in created_ads)
+        ads_specs = [x for x in ads_specs if x['ad_name'] not in created_ad_names]
+
+        # Создаем объявления пачками, созданные отдаем в on_batch_done сразу после каждой пачки
+        batch_size = max(1, min(batch_size, ADS_CREATE_MAX_ADS))
+        for i in range(0, len(ads_specs), batch_size):
+            batch = ads_specs[i:i + batch_size]
+            created_ads_response = self._api_response('ads.createAds',
+                                                      {'data': json.dumps([x['data'] for x in batch])})
+            created_ads.extend(self._unpack_created_ads(batch, created_ads_response))
+            if on_batch_done:
+                on_batch_done(created_ads)
+
+        return created_ads
+
+    def _unpack_created_ads(self, batch, created_ads_response):
+        """
+        Возвращает созданные объявления пачки, несозданные записывает в self.failed_ads
+
+        :param batch:                   list, [{'ad_name': str, 'playlist_url': str, 'data': dict}, ...]
+        :param created_ads_response:    list, ответ ads.createAds, [{'id': int, 'error_code': int, ...}, ...]
+        :return:                        list, [{'ad_name': str, 'ad_vk_id': int, 'playlist_url': str}, ...]
+        """
+        if not created_ads_response:
+            created_ads_response = [{'error_desc': 'ads.createAds failed'}] * len(batch)
+        # Объявления, на которые ВК не вернул ответа, считаются несозданными
+        created_ads_response = list(created_ads_response)
+        created_ads_response += [{'error_desc': 'no ads.createAds response for ad'}] * \
+            (len(batch) - len(created_ads_response))
+
+        created_ads = []
+        for ad_spec, ad_response in zip(batch, created_ads_response):
+            if ad_response.get('id') and not ad_response.get('error_code'):
+                created_ads.append({'ad_name': ad_spec['ad_name'],
+                                    'ad_vk_id': int(ad_response['id']),
+                                    'playlist_url': ad_spec['playlist_url']})
+            else:
+                self.failed_ads.append({'ad_name': ad_spec['ad_name'],
+                                        'playlist_url': ad_spec['playlist_url'],
+                                        'error': ad_response})
+        return created_ads
 
     def create_campaign(self, campaign_name, money_limit):
         """
@@ -1288,29 +1869,39 @@ class VkAds:
 
         return campaign_id
 
-    def create_dark_posts(self, group_id, playlist_urls, post_text):
+    def create_dark_posts(self, group_id, playlist_urls, post_text, bulk=True):
         """
-        Возвращает дикт с ссылками на созданные дарк-посты и соответствующие им плейлисты
+        Возвращает дикт с ссылками на созданные дарк-посты и соответствующие им плейлисты.
+        Посты создаются пачками через execute, несозданные записываются в self.failed_posts
 
         :param group_id:        int, сслыка на паблик, в котором создаются дарк-посты
         :param playlist_urls:   list, список полных сылок на плейлисты
         :param post_text:       str, текст для постов со всеми отступами и эмодзи
+        :param bulk:            bool, True - до 25 постов за запрос, False - по одному посту за запрос
         :return:                dict, {post_url, playlist_url}
         """
         # Достаем айдишки плейлистов из полных ссылок на плейлисты для метода wall.postAdsStealth
         playlist_ids = [x[27:] for x in playlist_urls]
 
-        # Создаем дарк-посты с плейлистами и текстом, заполняем дикт
+        # Создаем дарк-посты с плейлистами и текстом пачками
+        with self.execute_batch(batch_size=EXECUTE_MAX_CALLS if bulk else 1) as batch:
+            results = []
+            for playlist_id in playlist_ids:
+                api_method_params = {'owner_id': group_id * -1,
+                                     'message': post_text,
+                                     'attachments': f'audio_playlist{playlist_id}',
+                                     'signed': 0}
+                results.append(batch.add('wall.postAdsStealth', api_method_params))
+
+        # Заполняем дикт созданными постами, несозданные откладываем в failed_posts
         posts_playlists = {}
-        for n, playlist_id in enumerate(playlist_ids):
-            api_method_params = {'owner_id': group_id * -1,
-                                 'message': post_text,
-                                 'attachments': f'audio_playlist{playlist_id}',
-                                 'signed': 0}
-            post_id = self._api_response('wall.postAdsStealth', api_method_params)['post_id']
-            post_url = f'https://vk.com/wall-{group_id}_{post_id}'
-            posts_playlists[post_url] = playlist_urls[n]
-            sleep(uniform(0.4, 0.6))
+        for playlist_url, result in zip(playlist_urls, results):
+            if result.response and 'post_id' in result.response:
+                post_url = f'https://vk.com/wall-{group_id}_{result.response["post_id"]}'
+                posts_playlists[post_url] = playlist_url
+            else:
+                print(playlist_url, result.error)
+                self.failed_posts.append({'playlist_url': playlist_url, 'error': result.error})
 
         return posts_playlists
 
@@ -1328,72 +1919,57 @@ class VkAds:
 
         :param ad_ids:      list of int, список айди объявлений
         :param limit:       int, ограничение по бюджету на каждое объявление в рублях
+        :return:            dict, {ad_id: bool} - True, если ограничение установлено
         """
-        # Собираем сериализованный JSON для метода ads.updateAds батчами по 5 штук в батч
-        data_list = []
-        for ad_id in ad_ids:
-            data_list.append({'ad_id': ad_id, 'all_limit': limit})
-            if len(data_list) == 5:
-                self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
-                data_list = []
-
-        # Если в этом листе еще что-то осталось
-        if data_list:
-            self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
+        return self.update_ads({ad_id: {'all_limit': limit} for ad_id in ad_ids})
 
     def stop_ads(self, ad_ids):
         """
         Останавливает активные объявления
 
         :param ad_ids:          list of int, список айди объявлений
+        :return:                dict, {ad_id: bool} - True, если объявление остановлено
         """
-        # Собираем сериализованный JSON для метода ads.updateAds батчами по 5 штук в батч
-        data_list = []
-        for ad_id in ad_ids:
-            data_list.append({'ad_id': ad_id, 'status': 0})
-            if len(data_list) == 5:
-                self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
-                data_list = []
-
-        # Если в этом листе еще что-то осталось
-        if data_list:
-            self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
+        return self.update_ads({ad_id: {'status': 0} for ad_id in ad_ids})
 
     def start_ads(self, ad_ids):
         """
         Запускает остановленные объявления
 
         :param ad_ids:          list of int, список айди объявлений
+        :return:                dict, {ad_id: bool} - True, если объявление запущено
         """
-        # Собираем сериализованный JSON для метода ads.updateAds батчами по 5 штук в батч
-        data_list = []
-        for ad_id in ad_ids:
-            data_list.append({'ad_id': ad_id, 'status': 1})
-            if len(data_list) == 5:
-                self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
-                data_list = []
-
-        # Если в этом листе еще что-то осталось
-        if data_list:
-            self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
+        return self.update_ads({ad_id: {'status': 1} for ad_id in ad_ids})
 
     def update_cpm(self, cpm_dict):
         """
-        Останавливает активные объявления
+        Меняет СРМ объявлений
 
         :param cpm_dict:        dict, {ad_id: cpm}, cpm - float в рублях с копейками после точки
+        :return:                dict, {ad_id: bool} - True, если СРМ изменен
+        """
+        return self.update_ads({ad_id: {'cpm': cpm} for ad_id, cpm in cpm_dict.items()})
+
+    def update_ads(self, ad_changes):
+        """
+        Меняет параметры объявлений: все изменения одного объявления уходят одним элементом ads.updateAds,
+        запросы ads.updateAds - пачками через execute (см. VkAdsUpdateBuffer)
+
+        :param ad_changes:      dict, {ad_id: {'status': 0/1, 'cpm': float в рублях, 'all_limit': int, ...}}
+        :return:                dict, {ad_id: bool} - True, если изменения объявления применены
+        """
+        with self.update_buffer() as buffer:
+            for ad_id, changes in ad_changes.items():
+                buffer.add(ad_id, **changes)
+        return buffer.results
+
+    def update_buffer(self):
         """
-        # Собираем сериализованный JSON для метода ads.updateAds батчами по 5 штук в батч
-        data_list = []
-        for ad_id, cpm in cpm_dict.items():
-            data_list.append({'ad_id': ad_id, 'cpm': cpm})
-            if len(data_list) == 5:
-                self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
-                data_list = []
+        Возвращает буфер изменений объявлений кабинета
 
-        # Если в этом листе еще что-то осталось
-        if data_list:
-            self._api_response('ads.updateAds', {'data': json.dumps(data_list)})
+        :return:    VkAdsUpdateBuffer
+        """
+        return VkAdsUpdateBuffer(self.execute_batch)
 
 
 class VkTools:
@@ -1410,20 +1986,22 @@ class VkTools:
         self.proxy = proxy
         self.rucaptcha_key = rucaptcha_key
 
-    def _api_response(self, method, params=None):
+    def _api_response(self, method, params=None, full_response=False):
         """
         Возвращает ответ от API ВК (None - если ошибка)
 
-        :param method:  str, название метода API ВК
-        :param params:  dict, параметры метода
-        :return:        dict, разобранный из JSON ответ апи ВК (None - если ошибка)
+        :param method:          str, название метода API ВК
+        :param params:          dict, параметры метода
+        :param full_response:   bool, True - вернуть весь ответ (с execute_errors), False - только response
+        :return:                dict, разобранный из JSON ответ апи ВК (None - если ошибка)
         """
         url = f'https://api.vk.com/method/{method}'
         if params:
             params.update({'access_token': self.token, 'v': VK_API_VERSION})
         else:
             params = {'access_token': self.token, 'v': VK_API_VERSION}
-        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy)
+        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy,
+                                 session=_get_session(self.token, self.proxy), full_response=full_response)
 
     def get_groups(self):
         """
@@ -1521,19 +2099,23 @@ class VkTools:
 
 class VkArtistCards:
 
-    def __init__(self, token, rucaptcha_key, proxy=None):
+    def __init__(self, token, rucaptcha_key, proxy=None, artist_graph=None):
         """
         Класс для работы с картчоками артистов
 
         :param token:           str, токен от ВК
         :param rucaptcha_key:   str, ключ от аккаунта рукапчи
         :param proxy:           str, прокся в формате login:pass@ip:port
+        :param artist_graph:    объект с методами get_node и set_node для хранения обойденных карточек
+                                (например, ArtistGraphStore)
         """
 
         self.token = token
         self.rucaptcha_key = rucaptcha_key
         self.proxy = {'https': f'https://{proxy}'} if proxy else None
-        self.session = requests.session()
+        self.session = _get_session(token, proxy)
+        self.limiter = get_rate_limiter(token)
+        self.artist_graph = artist_graph
         self.failed_artists = []
         self.parsed_cards_urls = {}
 
@@ -1552,9 +2134,11 @@ class VkArtistCards:
         return captcha_key
 
     def _resp_with_anticaptcha(self, url, captcha_sid=None, captcha_key=None):
+        method = _get_method_name(url)
+        self.limiter.acquire(method)
         if captcha_sid and captcha_key:
             url = f'{url}&captcha_sid={captcha_sid}&captcha_key={captcha_key}'
-        resp = self.session.get(url, proxies=self.proxy).json()
+        resp = self.session.get(url, proxies=self.proxy, timeout=(VK_CONNECT_TIMEOUT, VK_READ_TIMEOUT)).json()
         if 'error' in resp.keys():
             if resp['error']['error_msg'] == 'Captcha needed':
                 captcha_sid = resp['error']['captcha_sid']
@@ -1562,7 +2146,7 @@ class VkArtistCards:
                 captcha_key = self._anticaptcha(captcha_img)
                 return self._resp_with_anticaptcha(url, captcha_sid, captcha_key)
             elif resp['error']['error_msg'] == 'Too many requests per second':
-                sleep(uniform(0.4, 0.6))
+                self.limiter.penalize(method)
                 return self._resp_with_anticaptcha(url, captcha_sid, captcha_key)
             else:
                 return resp
@@ -1572,7 +2156,9 @@ class VkArtistCards:
     def get_related_artists(self, artist_card_url, include_feats=False, csv_path=None, max_recurse_level=3,
                             listens_threshold=None, n_last_releases=3, days_from_last_release=None):
         """
-        Возвращает дикт с похожими артистами и ссылками на их карточки в ВК
+        Возвращает дикт с похожими артистами и ссылками на их карточки в ВК.
+        Если у объекта есть artist_graph, свежие карточки берутся из него, а в ВК запрашиваются только
+        отсутствующие и устаревшие
 
         :param artist_card_url:         str - ссылка на карточку артиста в ВК
         :param include_feats:           bool, True - парсить артистов из фитов в качестве похожих, False - нет
@@ -1619,14 +2205,11 @@ class VkArtistCards:
         if not artist_id and not artist_card_id:
             raise RuntimeError("don't passed artist_id or artist_card_id")
 
-        # Если не передан айди карточки артиста, получаем его из айди артиста
-        if not artist_card_id:
-            artist_card_id = self._get_artist_card_id(artist_id_or_card_url=artist_id)
+        # Узел карточки артиста: из графа или из ВК (None - если карточка не нашлась)
+        artist_node = self._get_artist_node(artist_ref=artist_id, artist_card_id=artist_card_id)
 
-        # Если у артиста есть карточка (если она нашлась)
-        if artist_card_id:
-            artist_card_item = self._get_artist_card_item(artist_card_id=artist_card_id)
-            related_artists = self._pars_artist_card(artist_card_item=artist_card_item,
+        if artist_node:
+            related_artists = self._pars_artist_card(artist_node=artist_node,
                                                      include_feats=include_feats,
                                                      csv_path=csv_path,
                                                      listens_threshold=listens_threshold,
@@ -1636,7 +2219,6 @@ class VkArtistCards:
                 for related_artist_name, related_artist_id in related_artists.items():
                     if related_artist_name not in self.parsed_cards_urls.keys() and \
                             related_artist_name not in self.failed_artists:
-                        sleep(uniform(0.4, 0.5))
                         if current_recurse_level < max_recurse_level:
                             print(f'recurse level: {current_recurse_level}\t | \t\t'
                                   f'scanned artist: {related_artist_name}')
@@ -1652,25 +2234,102 @@ class VkArtistCards:
                         else:
                             print(f'recurse level: {current_recurse_level}\t | \t\t'
                                   f'scanned artist: {related_artist_name}')
-                            related_artist_card_id = self._get_artist_card_id(artist_id_or_card_url=related_artist_id)
-                            related_artist_card_item = self._get_artist_card_item(artist_card_id=related_artist_card_id)
-                            self._pars_artist_card(artist_card_item=related_artist_card_item,
-                                                   include_feats=include_feats,
-                                                   csv_path=csv_path,
-                                                   listens_threshold=listens_threshold,
-                                                   n_last_releases=n_last_releases,
-                                                   days_from_last_release=days_from_last_release)
+                            related_artist_node = self._get_artist_node(artist_ref=related_artist_id)
+                            if related_artist_node:
+                                self._pars_artist_card(artist_node=related_artist_node,
+                                                       include_feats=include_feats,
+                                                       csv_path=csv_path,
+                                                       listens_threshold=listens_threshold,
+                                                       n_last_releases=n_last_releases,
+                                                       days_from_last_release=days_from_last_release)
+                            else:
+                                self.failed_artists.append(related_artist_name)
         else:
             self.failed_artists.append(artist_name)
 
-    def _pars_artist_card(self, artist_card_item, include_feats=False, csv_path=None, listens_threshold=None,
+    def _get_artist_node(self, artist_ref=None, artist_card_id=None):
+        """
+        Возвращает узел карточки артиста: из artist_graph, если там есть свежий,
+        иначе карточка запрашивается в ВК и записывается в artist_graph.
+        В графе карточка ищется по айди карточки или ссылке на нее (похожие артисты) без запросов к ВК,
+        по айди артиста (фиты) - после получения айди его карточки
+
+        :param artist_ref:      str or int, айди артиста или ссылка на его карточку
+        :param artist_card_id:  str, айди карточки артиста (вместо artist_ref)
+        :return:                dict or None, узел как у _get_card_node (None - карточка не нашлась)
+        """
+        artist_ref = str(artist_ref) if artist_ref else None
+        if self.artist_graph:
+            if artist_card_id:
+                artist_node = self.artist_graph.get_node(card_id=artist_card_id)
+            elif artist_ref and 'vk.com' in artist_ref:
+                artist_node = self.artist_graph.get_node(card_url=artist_ref)
+            else:
+                artist_node = None
+            if artist_node:
+                return artist_node
+
+        if not artist_card_id:
+            artist_card_id = self._get_artist_card_id(artist_id_or_card_url=artist_ref)
+            if not artist_card_id:
+                return None
+            if self.artist_graph:
+                artist_node = self.artist_graph.get_node(card_id=artist_card_id)
+                if artist_node:
+                    return artist_node
+
+        artist_card_item = self._get_artist_card_item(artist_card_id=artist_card_id)
+        # Если такого ключа нет, то нет карточки артиста
+        if 'artists' not in artist_card_item.keys():
+            return None
+
+        artist_node = self._get_card_node(artist_card_id=artist_card_id, artist_card_item=artist_card_item)
+        if self.artist_graph:
+            self.artist_graph.set_node(artist_node)
+        return artist_node
+
+    def _get_card_node(self, artist_card_id, artist_card_item):
+        """
+        Возвращает узел графа артистов из карточки артиста: параметры артиста, похожие артисты и фиты
+
+        :param artist_card_id:      str, айди карточки артиста
+        :param artist_card_item:    dict, разобранный JSON объект карточки артиста
+        :return:                    dict, {'card_id': str, 'card_url': str, 'artist_name': str,
+                                           'plays': [int, ...] - прослушивания релизов, от последнего,
+                                           'last_release_date': date or None,
+                                           'related': {artist_name: artist_card_url},
+                                           'feats': {artist_name: artist_id}}
+        """
+        card_artist_name = artist_card_item['artists'][0]['name']
+        playlists = artist_card_item.get('playlists', [])
+
+        # Поиск блока с похожими артистами (его может не быть)
+        related_artists_block_id = None
+        for block in artist_card_item['section']['blocks']:
+            if 'url' in block.keys() and 'related' in block['url']:
+                related_artists_block_id = block['id']
+
+        related_artists = {}
+        if related_artists_block_id:
+            related_artists = self._pars_related_artists_block(related_artists_block_id=related_artists_block_id)
+
+        return {'card_id': artist_card_id,
+                'card_url': artist_card_item['section']['url'],
+                'artist_name': card_artist_name,
+                'plays': [x['plays'] for x in playlists],
+                'last_release_date': datetime.fromtimestamp(playlists[0]['create_time']).date() if playlists else None,
+                'related': related_artists,
+                'feats': _pars_feats_from_audios(audios=artist_card_item.get('audios', []),
+                                                 main_artist_name=card_artist_name)}
+
+    def _pars_artist_card(self, artist_node, include_feats=False, csv_path=None, listens_threshold=None,
                           n_last_releases=3, days_from_last_release=None):
         """
         Возвращает дикт с похожими артистами и их айдишками.
         Артисты берутся из фитов и блока с похожими артистами в карточке основного артиста.
         Обновляет аргумент parsed_cards_urls объекта
 
-        :param artist_card_item:        dict, разобранный JSON объект карточки основного артиста
+        :param artist_node:             dict, узел карточки основного артиста (см. _get_card_node)
         :param include_feats:           bool, True - парсить артистов из фитов в качестве похожих, False - нет
         :param csv_path:                str, путь к csv файлу для записи результатов в реальном времени
         :param listens_threshold:       int, минимальный порог по прослушиваниям в среднем по релизам
@@ -1678,13 +2337,9 @@ class VkArtistCards:
         :param days_from_last_release:  int, максиально допустимое кол-во дней, прошедших от даты последнего релиза
         :return:                        dict, {artist_name, artist_id (or artist_card_url)}
         """
-        # Если такого ключа нет, то нет карточки артиста
-        if 'artists' not in artist_card_item.keys():
-            return None
-
         # Достаем инфу об основном артисте переданной карточки артиста
-        card_artist_name = artist_card_item['artists'][0]['name']
-        card_url = artist_card_item['section']['url']
+        card_artist_name = artist_node['artist_name']
+        card_url = artist_node['card_url']
         finded_artists = {card_artist_name: card_url}
 
         # Проверка на повторы
@@ -1692,25 +2347,16 @@ class VkArtistCards:
             return None
 
         # Проверка на прохождение всех переданных фильтров
-        self._artist_parameters_filter(artist_card_item, card_artist_name, card_url, csv_path, days_from_last_release,
+        self._artist_parameters_filter(artist_node, card_artist_name, card_url, csv_path, days_from_last_release,
                                        listens_threshold, n_last_releases)
 
         if include_feats:
-            finded_artists.update(_pars_feats_from_audios(audios=artist_card_item['audios'],
-                                                          main_artist_name=card_artist_name))
-
-        # Поиск блока с похожими артистами (его может не быть)
-        related_artists_block_id = None
-        for block in artist_card_item['section']['blocks']:
-            if 'url' in block.keys() and 'related' in block['url']:
-                related_artists_block_id = block['id']
-
-        if related_artists_block_id:
-            finded_artists.update(self._pars_related_artists_block(related_artists_block_id=related_artists_block_id))
+            finded_artists.update(artist_node['feats'])
+        finded_artists.update(artist_node['related'])
 
         return finded_artists
 
-    def _artist_parameters_filter(self, artist_card_item, card_artist_name, card_url, csv_path, days_from_last_release,
+    def _artist_parameters_filter(self, artist_node, card_artist_name, card_url, csv_path, days_from_last_release,
                                   listens_threshold, n_last_releases):
         """
         Проверяет карточку артиста на прохождение всех переданных фильтров, а именно:
@@ -1722,10 +2368,10 @@ class VkArtistCards:
         """
         # Если переданы порог прослушиваний и дни от последнего релиза
         if listens_threshold and days_from_last_release:
-            if _listens_threshold_passed(artist_card_item=artist_card_item,
+            if _listens_threshold_passed(plays=artist_node['plays'],
                                          listens_threshold=listens_threshold,
                                          n_last_releases=n_last_releases):
-                if _is_artist_alive(artist_card_item=artist_card_item,
+                if _is_artist_alive(last_release_date=artist_node['last_release_date'],
                                     days_from_last_release=days_from_last_release):
                     self.parsed_cards_urls[card_artist_name] = card_url
                     if csv_path:
@@ -1738,7 +2384,7 @@ class VkArtistCards:
 
         # Если передан только порог по прослушивнаиям
         elif listens_threshold:
-            if _listens_threshold_passed(artist_card_item=artist_card_item,
+            if _listens_threshold_passed(plays=artist_node['plays'],
                                          listens_threshold=listens_threshold,
                                          n_last_releases=n_last_releases):
                 self.parsed_cards_urls[card_artist_name] = card_url
@@ -1750,7 +2396,7 @@ class VkArtistCards:
 
         # Если переданы только дни от последнего релиза
         elif days_from_last_release:
-            if _is_artist_alive(artist_card_item=artist_card_item,
+            if _is_artist_alive(last_release_date=artist_node['last_release_date'],
                                 days_from_last_release=days_from_last_release):
                 self.parsed_cards_urls[card_artist_name] = card_url
                 if csv_path:
@@ -1844,48 +2490,56 @@ class VkChart:
         self.rucaptcha_key = rucaptcha_key
         self.proxy = proxy
 
-    def _api_response(self, method, params=None):
+    def _api_response(self, method, params=None, full_response=False):
         """
         Возвращает ответ от API ВК (None - если ошибка)
 
-        :param method:  str, название метода API ВК
-        :param params:  dict, параметры метода
-        :return:        dict, разобранный из JSON ответ апи ВК (None - если ошибка)
+        :param method:          str, название метода API ВК
+        :param params:          dict, параметры метода
+        :param full_response:   bool, True - вернуть весь ответ (с execute_errors), False - только response
+        :return:                dict, разобранный из JSON ответ апи ВК (None - если ошибка)
         """
         url = f'https://api.vk.com/method/{method}'
         if params:
             params.update({'access_token': self.token, 'v': VK_API_VERSION})
         else:
             params = {'access_token': self.token, 'v': VK_API_VERSION}
-        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy)
+        return _get_api_response(url=url, data=params, rucaptcha_key=self.rucaptcha_key, proxy=self.proxy,
+                                 session=_get_session(self.token, self.proxy), full_response=full_response)
+
+    def iter_chart(self, max_pages=CHART_MAX_PAGES):
+        """
+        Генератор позиций чарта ВК, страницы по 20 треков запрашиваются по мере перебора
+
+        :param max_pages:   int, максимум страниц (None - пока ВК отдает следующую страницу)
+        :return:            generator, (chart_position, {api response about track})
+        """
+        api_method_params = {'block_id': 'PUlYRhcOWFVqSVhBFw5JBScfCBpaU0kb', 'extended': 1}
+        pages = _iter_pages(self._api_response, 'audio.getCatalogBlockById', api_method_params,
+                            get_page=lambda resp: (resp['block']['audios'], resp['block'].get('next_from')),
+                            max_pages=max_pages)
+
+        chart_position = 0
+        for tracks in pages:
+            for track in tracks:
+                chart_position += 1
+                yield chart_position, track
 
-    def get_chart(self, extended=False):
+    def get_chart(self, extended=False, max_pages=CHART_MAX_PAGES):
         """
         Парсит чарт ВК от текущей даты напрямую из ВК
 
-        :return:    dict, {chart_position: {api response about track}}
+        :param extended:    bool, True - добавить к трекам жанры их альбомов
+        :param max_pages:   int, максимум страниц по 20 треков (None - все)
+        :return:            dict, {chart_position: {api response about track}}
         """
-        chart = {}
-        next_from = None
-        for i in range(5):
-            resp = self._get_chart_response(next_from)
-            for n, track in enumerate(resp['block']['audios']):
-                chart_position = n + i * 20 + 1
-                chart[chart_position] = track
-            try:
-                next_from = resp['block']['next_from']
-            except KeyError:
-                pass
+        chart = dict(self.iter_chart(max_pages=max_pages))
 
         if extended:
             return self._extend_chart_tracks_info(chart)
 
         return chart
 
-    def _get_chart_response(self, next_from=None):
-        api_method_params = {'block_id': 'PUlYRhcOWFVqSVhBFw5JBScfCBpaU0kb', 'start_from': next_from, 'extended': 1}
-        return self._api_response('audio.getCatalogBlockById', api_method_params)
-
     def _extend_chart_tracks_info(self, chart):
 
         items_in_batch = 25
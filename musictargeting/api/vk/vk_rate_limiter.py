@@ -0,0 +1,218 @@
+""" Use Python 3.7 """
+
+import os
+
+from hashlib import sha1
+from threading import Lock
+from time import monotonic, sleep, time
+
+from musictargeting.settings import VK_RATE_LIMITS, VK_RATE_LIMIT_SHARED, VK_RATE_LIMIT_DIR
+
+try:
+    import fcntl
+except ImportError:
+    # Нет файловых блокировок (Windows) - лимиты будут только в пределах процесса
+    fcntl = None
+
+
+# Лимитеры токенов, {token: VkRateLimiter}
+_LIMITERS = {}
+_LIMITERS_LOCK = Lock()
+
+
+def _get_method_name(url):
+    """
+    Возвращает название метода API ВК из урла запроса
+
+    :param url:     str, урл запроса к апи (с параметрами или без)
+    :return:        str, название метода, например 'ads.getAds'
+    """
+    return url.split('?')[0].rsplit('/', 1)[-1]
+
+
+def _get_bucket_names(method, params=None):
+    """
+    Возвращает названия ведер лимитера, из которых тратится бюджет на вызов метода.
+    Вызов execute с методами ads внутри тратит и бюджет рекламного API
+
+    :param method:  str, название метода API ВК
+    :param params:  dict, параметры метода
+    :return:        list, [bucket_name, ...]
+    """
+    bucket_names = ['default']
+
+    code = params.get('code', '') if params and method == 'execute' else ''
+    if method.startswith('ads.') or 'API.ads.' in code:
+        bucket_names.append('ads')
+
+    for bucket_name, (_, _, methods) in VK_RATE_LIMITS.items():
+        if methods and (method in methods or any(f'API.{x}(' in code for x in methods)):
+            bucket_names.append(bucket_name)
+
+    # Сперва самое строгое ведро, чтобы не тратить общий бюджет, пока ждем строгое
+    bucket_names.reverse()
+
+    return bucket_names
+
+
+class TokenBucket:
+
+    def __init__(self, count, period):
+        """
+        Ведро токенов: не более count запросов за period секунд, с возможностью сразу потратить весь бюджет
+
+        :param count:   int, количество запросов за период
+        :param period:  float, период в секундах
+        """
+        self.capacity = count
+        self.rate = count / period
+        self.tokens = float(count)
+        self.timestamp = monotonic()
+        self.lock = Lock()
+
+    def take(self):
+        """
+        Пытается взять из ведра один токен
+
+        :return:    float, 0 - токен взят, иначе - сколько секунд ждать до появления токена
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.
+            return (1 - self.tokens) / self.rate
+
+    def drain(self):
+        """
+        Опустошает ведро (после ошибки "Too many requests per second" от ВК)
+        """
+        with self.lock:
+            self.tokens = 0.
+            self.timestamp = monotonic()
+
+
+class SharedTokenBucket:
+
+    def __init__(self, path, count, period):
+        """
+        Ведро токенов, общее для всех процессов на машине.
+        Состояние ведра ("токены время") хранится в файле и меняется только под файловой блокировкой
+
+        :param path:    str, путь к файлу состояния ведра
+        :param count:   int, количество запросов за период
+        :param period:  float, период в секундах
+        """
+        self.path = path
+        self.capacity = count
+        self.rate = count / period
+
+    def _update(self, drain=False):
+        """
+        Пополняет ведро по прошедшему времени и пытается взять из него токен (или опустошает его)
+
+        :param drain:   bool, True - опустошить ведро, False - взять токен
+        :return:        float, 0 - токен взят, иначе - сколько секунд ждать до появления токена
+        """
+        with open(self.path, 'a+') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                state = file.read().split()
+                now = time()
+                if len(state) == 2:
+                    tokens, timestamp = float(state[0]), float(state[1])
+                    tokens = min(self.capacity, tokens + max(0., now - timestamp) * self.rate)
+                else:
+                    tokens = float(self.capacity)
+
+                if drain:
+                    tokens, wait = 0., 0.
+                elif tokens >= 1:
+                    tokens, wait = tokens - 1, 0.
+                else:
+                    wait = (1 - tokens) / self.rate
+
+                file.seek(0)
+                file.truncate()
+                file.write(f'{tokens} {now}')
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+        return wait
+
+    def take(self):
+        """
+        Пытается взять из ведра один токен
+
+        :return:    float, 0 - токен взят, иначе - сколько секунд ждать до появления токена
+        """
+        return self._update()
+
+    def drain(self):
+        """
+        Опустошает ведро для всех процессов (после ошибки "Too many requests per second" от ВК)
+        """
+        self._update(drain=True)
+
+
+class VkRateLimiter:
+
+    def __init__(self, token=None, shared=False):
+        """
+        Лимитер запросов одного токена к API ВК. Лимиты берутся из VK_RATE_LIMITS в настройках
+
+        :param token:   str, токен от ВК (нужен только для общего между процессами лимитера)
+        :param shared:  bool, True - бюджет токена общий для всех процессов, False - только для этого процесса
+        """
+        if shared:
+            os.makedirs(VK_RATE_LIMIT_DIR, exist_ok=True)
+            token_hash = sha1(str(token).encode()).hexdigest()
+            self.buckets = {name: SharedTokenBucket(os.path.join(VK_RATE_LIMIT_DIR, f'{token_hash}_{name}'),
+                                                    count, period)
+                            for name, (count, period, _) in VK_RATE_LIMITS.items()}
+        else:
+            self.buckets = {name: TokenBucket(count, period) for name, (count, period, _) in VK_RATE_LIMITS.items()}
+
+    def acquire(self, method, params=None):
+        """
+        Ждет, пока в лимитах есть бюджет на вызов метода, и тратит его. Пока бюджет есть - не ждет вовсе
+
+        :param method:  str, название метода API ВК
+        :param params:  dict, параметры метода
+        """
+        for bucket_name in _get_bucket_names(method, params):
+            bucket = self.buckets[bucket_name]
+            wait = bucket.take()
+            while wait:
+                sleep(wait)
+                wait = bucket.take()
+
+    def penalize(self, method, params=None):
+        """
+        Обнуляет бюджет всех лимитов метода, если ВК все-таки ответил "Too many requests per second"
+
+        :param method:  str, название метода API ВК
+        :param params:  dict, параметры метода
+        """
+        for bucket_name in _get_bucket_names(method, params):
+            self.buckets[bucket_name].drain()
+
+
+def get_rate_limiter(token):
+    """
+    Возвращает общий для всех объектов фреймворка лимитер токена.
+    Если включен VK_RATE_LIMIT_SHARED, бюджет токена делят все процессы (запуски, автоматизации, вьюхи)
+
+    :param token:   str, токен от ВК
+    :return:        VkRateLimiter
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(token)
+        if not limiter:
+            limiter = VkRateLimiter(token=token, shared=bool(VK_RATE_LIMIT_SHARED and fcntl))
+            _LIMITERS[token] = limiter
+    return limiter
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 import datetime
 from pathlib import Path
+from tempfile import gettempdir
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -158,6 +159,56 @@ JWT_AUTH = {
 # VK API version for vk_framework
 VK_API_VERSION = '5.92'
 
+# HTTP transport for vk_framework: one pooled keep-alive session per (token, proxy)
+VK_POOL_SIZE = 10           # Максимум соединений в пуле сессии
+VK_KEEP_ALIVE = True        # False - закрывать соединение после каждого запроса
+VK_CONNECT_TIMEOUT = 10     # Таймаут на установку соединения, сек
+VK_READ_TIMEOUT = 60        # Таймаут на чтение ответа, сек
+VK_CONNECT_RETRIES = 2      # Повторы при ошибках соединения
+
+# Лимиты запросов к API ВК на один токен, {bucket_name: (count, period_sec, methods)}
+# default - все запросы токена, ads - все методы рекламного API, остальные - только перечисленные методы
+VK_RATE_LIMITS = {
+    'default': (3, 1., None),
+    'ads': (2, 1., None),
+    'ads_create': (1, 3., ['ads.createAds', 'ads.createCampaigns']),
+}
+
+# Общий для всех процессов бюджет запросов токена (состояние лимитов в файлах под файловой блокировкой)
+VK_RATE_LIMIT_SHARED = True
+VK_RATE_LIMIT_DIR = Path(gettempdir()) / 'musictargeting_vk_rate_limit'
+
+# Часовой пояс рекламных кабинетов: в нем ВК считает дни статы объявлений (ads.getStatistics, period: day)
+VK_ADS_TIME_ZONE = 'Europe/Moscow'
+
+# Кэш айди музыкантов рекламного кабинета (ads.getMusicians)
+MUSICIANS_CACHE_TTL = datetime.timedelta(days=30)
+MUSICIANS_CACHE_NEGATIVE_TTL = datetime.timedelta(days=3)   # Для имен, по которым музыкант не нашелся
+
+# Граф карточек артистов (VkArtistCards.get_related_artists): карточки свежее этого срока не запрашиваются повторно
+ARTIST_GRAPH_TTL = datetime.timedelta(days=7)
+
+# Очередь задач (run_job_workers): количество воркеров, пауза опроса очереди и приоритеты задач (больше - раньше)
+JOB_WORKERS = 4
+JOB_POLL_INTERVAL = 2
+JOB_PRIORITIES = {
+    'update_campaign_stats': 20,
+    'start_campaign': 10,
+    'automate_campaign': 0,
+}
+
+# Планировщик автоматизаций (continue_automate_campaigns): потоки для циклов, интервал между циклами кампании
+# и как часто перечитывать из БД новые автоматизации (в секундах)
+AUTOMATE_WORKERS = 8
+AUTOMATE_INTERVAL = datetime.timedelta(minutes=10)
+AUTOMATE_SCHEDULER_REFRESH = 30
+# Границы адаптивного интервала между циклами и сколько целевых стоимостей прослушивания тратить за цикл
+AUTOMATE_MIN_INTERVAL = datetime.timedelta(minutes=2)
+AUTOMATE_MAX_INTERVAL = datetime.timedelta(minutes=30)
+AUTOMATE_LISTENS_PER_CYCLE = 10
+# Локальный сокет, через который API будит планировщик при остановке, паузе и смене настроек автоматизации
+AUTOMATE_CONTROL_SOCKET = Path(gettempdir()) / 'musictargeting_automate.sock'
+
 # Production only
 DEV_RUCAPTCHA_KEY = 'b900c2e8222b8f9c116f12e3af17d757'
 DEV_PROXY = 'd1ONTO7Dua:qLR76hxgB7@45.135.177.101:62367'